@@ -3,15 +3,37 @@ import time
 import requests
 
 
-def wait_task(base_url: str, task_id: str, timeout: int = 600, interval: float = 1.0):
+def _format_progress(progress: dict) -> str:
+    if not progress:
+        return ""
+    parts = [progress.get("stage", "")]
+    if progress.get("total") is not None:
+        parts.append(f"{progress.get('done')}/{progress.get('total')} {progress.get('unit', '')}".strip())
+    for key in ("rows_inserted", "throughput", "eta_seconds"):
+        if progress.get(key) is not None:
+            parts.append(f"{key}={progress[key]}")
+    return " ".join(p for p in parts if p)
+
+
+def wait_task(base_url: str, task_id: str, timeout: int = 600, poll_timeout: float = 30.0):
+    # 长轮询：服务端在状态/进度变化时才返回，无需固定间隔轮询
     start = time.time()
+    version = -1
     while time.time() - start < timeout:
-        r = requests.get(f"{base_url}/cleanup/tasks/{task_id}")
+        r = requests.get(
+            f"{base_url}/tasks/{task_id}/wait",
+            params={"since": version, "timeout": poll_timeout},
+            timeout=poll_timeout + 30,
+        )
         r.raise_for_status()
         data = r.json()
-        if data.get("status") in ("succeeded", "failed"):
+        if data.get("status") in ("succeeded", "failed", "cancelled"):
             return data
-        time.sleep(interval)
+        if data.get("version", version) > version:
+            version = data["version"]
+            line = _format_progress(data.get("progress"))
+            if line:
+                print("progress:", line)
     raise TimeoutError("Task wait timeout")
 
 
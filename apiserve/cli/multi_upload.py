@@ -1,66 +1,160 @@
 import argparse
+import hashlib
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 
 
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _query_offset(api: str, upload_id: str) -> int:
+    resp = requests.get(f"{api}/data/uploads/{upload_id}", timeout=30)
+    resp.raise_for_status()
+    return resp.json()["offset"]
+
+
+def resumable_upload(api: str, path: str, excel_dir: str, force: bool = False,
+                     part_size: int = 8 * 1024 * 1024, retries: int = 5) -> dict:
+    """
+    分片上传单个文件：init 得到 upload_id 与服务端已收字节数，从该偏移继续 PUT 分片。
+    分片失败或服务端回 409 时重新查询偏移再续传，重试间隔指数退避。
+    """
+    size = os.path.getsize(path)
+    sha256 = _file_sha256(path)
+    resp = requests.post(f"{api}/data/uploads", json={
+        "filename": os.path.basename(path), "size": size, "sha256": sha256,
+        "excel_dir": excel_dir, "force": force,
+    }, timeout=30)
+    resp.raise_for_status()
+    session = resp.json()
+    if session["status"] == "skipped":
+        return session
+    upload_id = session["upload_id"]
+    offset = session["offset"]
+    part_size = session.get("part_size") or part_size
+    if offset:
+        print(f"{os.path.basename(path)}: resuming at {offset}/{size} bytes")
+
+    failures = 0
+    with open(path, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            chunk = f.read(part_size)
+            try:
+                resp = requests.put(
+                    f"{api}/data/uploads/{upload_id}", params={"offset": offset}, data=chunk,
+                    headers={"X-Part-SHA256": hashlib.sha256(chunk).hexdigest(),
+                             "Content-Type": "application/octet-stream"},
+                    timeout=300,
+                )
+                if resp.status_code == 409:
+                    offset = resp.json()["offset"]
+                    continue
+                resp.raise_for_status()
+                offset = resp.json()["offset"]
+                failures = 0
+            except requests.RequestException as e:
+                failures += 1
+                if failures > retries:
+                    raise
+                wait = min(2 ** failures, 30)
+                print(f"{os.path.basename(path)}: part at {offset} failed ({e}), retrying in {wait}s", file=sys.stderr)
+                time.sleep(wait)
+                try:
+                    offset = _query_offset(api, upload_id)
+                except requests.RequestException:
+                    pass
+    print(f"{os.path.basename(path)}: uploaded {size} bytes")
+    return session
+
+
+def run_resume(args) -> None:
+    """并发分片上传全部文件，再用一次 complete 调用提交（只触发一个导入/重建任务）。"""
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        sessions = list(pool.map(
+            lambda p: resumable_upload(args.api, p, args.excel_dir, force=args.force), args.files
+        ))
+    for session in sessions:
+        if session["status"] == "skipped":
+            print(f"skipped (unchanged): {session['filename']} == {session['duplicate_of']}")
+    upload_ids = [s["upload_id"] for s in sessions if s["status"] != "skipped"]
+    if not upload_ids:
+        return
+
+    payload = {"upload_ids": upload_ids, "rebuild": args.rebuild, "force": args.force}
+    for key in ("doc_dir", "bge_dir", "policy", "save_path"):
+        if getattr(args, key):
+            payload[key] = getattr(args, key)
+    resp = requests.post(f"{args.api}/data/uploads/complete", json=payload, timeout=600)
+    resp.raise_for_status()
+    info = resp.json()
+    print("complete:", info)
+    for item in info.get("skipped", []):
+        print(f"skipped (unchanged): {item['file']} == {item['duplicate_of']}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Upload multiple Excel files and optionally rebuild embeddings")
     parser.add_argument("--api", type=str, default="http://127.0.0.1:8000", help="API base url")
     parser.add_argument("--excel_dir", type=str, default="offline_data_ingestion_and_query_interface/dataset/dev_excel", help="Excel root dir on server")
     parser.add_argument("--files", type=str, nargs="+", required=True, help="Local excel file paths to upload")
-    parser.add_argument("--rebuild", action="store_true", help="Call upload_and_rebuild_many after upload")
+    parser.add_argument("--rebuild", action="store_true", help="Upload via upload_and_rebuild_many (import + rebuild embeddings)")
+    parser.add_argument("--force", action="store_true", help="Re-import even if the file content is unchanged")
     parser.add_argument("--doc_dir", type=str, default=None)
     parser.add_argument("--bge_dir", type=str, default=None)
     parser.add_argument("--policy", type=str, default=None, choices=["rebuild","build_if_missing","load_only"])
     parser.add_argument("--save_path", type=str, default=None)
+    parser.add_argument("--resume", action="store_true", help="Use the resumable upload protocol (parts by offset, resumes interrupted uploads)")
+    parser.add_argument("--concurrency", type=int, default=3, help="Files uploaded in parallel with --resume")
 
     args = parser.parse_args()
 
-    # 1) upload_many
-    url = f"{args.api}/data/upload_many"
-    files_payload = [("files", (os.path.basename(p), open(p, "rb"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")) for p in args.files]
-    try:
-        resp = requests.post(url, files=files_payload, data={"excel_dir": args.excel_dir}, timeout=600)
-        resp.raise_for_status()
-    finally:
-        for _, fh, *_ in files_payload:
-            try:
-                fh.close()
-            except Exception:
-                pass
-
-    print("upload_many:", resp.json())
-
-    if not args.rebuild:
+    if args.resume:
+        run_resume(args)
         return
 
-    # 2) upload_and_rebuild_many (no need to re-upload: demonstrate single call flow)
-    url2 = f"{args.api}/data/upload_and_rebuild_many"
-    files_payload2 = [("files", (os.path.basename(p), open(p, "rb"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")) for p in args.files]
-    form = {
-        "excel_dir": args.excel_dir,
-    }
-    if args.doc_dir:
-        form["doc_dir"] = args.doc_dir
-    if args.bge_dir:
-        form["bge_dir"] = args.bge_dir
-    if args.policy:
-        form["policy"] = args.policy
-    if args.save_path:
-        form["save_path"] = args.save_path
+    form = {"excel_dir": args.excel_dir}
+    if args.force:
+        form["force"] = "true"
+
+    # 未指定 --rebuild 时只上传并导入；指定时一次调用完成上传+导入+重建。
+    # 两步分开调用会让第二次上传被识别为重复内容而跳过重建。
+    if args.rebuild:
+        url = f"{args.api}/data/upload_and_rebuild_many"
+        if args.doc_dir:
+            form["doc_dir"] = args.doc_dir
+        if args.bge_dir:
+            form["bge_dir"] = args.bge_dir
+        if args.policy:
+            form["policy"] = args.policy
+        if args.save_path:
+            form["save_path"] = args.save_path
+    else:
+        url = f"{args.api}/data/upload_many"
 
+    files_payload = [("files", (os.path.basename(p), open(p, "rb"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")) for p in args.files]
     try:
-        resp2 = requests.post(url2, files=files_payload2, data=form, timeout=3600)
-        resp2.raise_for_status()
+        resp = requests.post(url, files=files_payload, data=form, timeout=3600 if args.rebuild else 600)
+        resp.raise_for_status()
     finally:
-        for _, fh, *_ in files_payload2:
+        for _, fh, *_ in files_payload:
             try:
                 fh.close()
             except Exception:
                 pass
 
-    print("upload_and_rebuild_many:", resp2.json())
+    info = resp.json()
+    print(f"{url.rsplit('/', 1)[-1]}:", info)
+    for item in info.get("skipped", []):
+        print(f"skipped (unchanged): {item['file']} == {item['duplicate_of']}")
 
 
 if __name__ == "__main__":
@@ -8,11 +8,18 @@ def main():
     parser.add_argument("--include-meta", action="store_true", help="Include per-table metadata like original_filename")
     parser.add_argument("--pretty", action="store_true", help="Pretty print table to original_filename mapping")
     parser.add_argument("--filenames-only", action="store_true", help="Print only original filenames, one per line")
+    parser.add_argument("--prefix", default=None, help="Only tables whose name starts with this prefix")
+    parser.add_argument("--q", default=None, help="Only tables whose name contains this substring (case-insensitive)")
+    parser.add_argument("--limit", type=int, default=None, help="Page size (default: all)")
+    parser.add_argument("--offset", type=int, default=0, help="Page offset")
     args = parser.parse_args()
 
     # --filenames-only implies we need metadata
     include_meta = args.include_meta or args.filenames_only
-    params = {"include_meta": "true" if include_meta else "false"}
+    params = {"include_meta": "true" if include_meta else "false", "offset": args.offset}
+    for key in ("prefix", "q", "limit"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
     r = requests.get(f"{args.host}/tables", params=params)
     r.raise_for_status()
     data = r.json()
@@ -1,16 +1,44 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+import json
 import os
+from .deps import PROJECT_ROOT
 from .routes.health import router as health_router
 from .routes.cleanup import router as cleanup_router
 from .routes.embeddings import router as embeddings_router
 from .routes.data import router as data_router
+from .routes.uploads import router as uploads_router
 from .routes.tables import router as tables_router
 from .routes.chat import router as chat_router
+from .routes.tasks import router as tasks_router
+
+
+def check_sql_backend() -> None:
+    """
+    The duckdb backend is an embedded, single-process database: this process must own it,
+    serving both ingestion and queries (SQL_SERVICE_TRANSPORT=inproc) from a single worker.
+    Reject other transports, and open the database eagerly so that a second worker or another
+    process holding the file lock fails at startup rather than on the first import or query.
+    """
+    from offline_data_ingestion_and_query_interface.src.sql_alchemy_helper import DUCKDB_DEPLOYMENT_HINT, resolve_backend
+
+    config_path = os.path.join(PROJECT_ROOT, "offline_data_ingestion_and_query_interface", "config", "database_config.json")
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    if resolve_backend(config) != "duckdb":
+        return
+    if os.getenv("SQL_SERVICE_TRANSPORT", "http").lower() != "inproc":
+        raise RuntimeError(f"duckdb 后端要求 SQL_SERVICE_TRANSPORT=inproc。{DUCKDB_DEPLOYMENT_HINT}")
+    # importing common_utils connects to the database and takes the file lock
+    from offline_data_ingestion_and_query_interface.src import common_utils  # noqa: F401
 
 
 def create_app() -> FastAPI:
+    check_sql_backend()
     app = FastAPI(title="TableRAG API", version="0.1.0")
     # Enable permissive CORS for development; tighten in production as needed
     app.add_middleware(
@@ -23,9 +51,11 @@ def create_app() -> FastAPI:
     app.include_router(health_router, prefix="")
     app.include_router(cleanup_router, prefix="/cleanup", tags=["cleanup"])
     app.include_router(data_router, prefix="/data", tags=["data"])
+    app.include_router(uploads_router, prefix="/data/uploads", tags=["data"])
     app.include_router(embeddings_router, prefix="/embeddings", tags=["embeddings"])
     app.include_router(tables_router, prefix="/tables", tags=["tables"])
     app.include_router(chat_router, prefix="/chat", tags=["chat"])
+    app.include_router(tasks_router, prefix="/tasks", tags=["tasks"])
 
     # Serve minimal static frontend from apiserve/static
     static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 from typing import Any, List, Optional
+import asyncio
 import os
 import sys
 import io
+import threading
 from contextlib import redirect_stdout
 from pathlib import Path
 
@@ -12,6 +15,11 @@ from ..deps import merge_config
 
 router = APIRouter()
 
+# 單次問答的整體時限（秒），可由請求體 timeout 覆蓋
+CHAT_REQUEST_TIMEOUT = float(os.getenv("CHAT_REQUEST_TIMEOUT", "600"))
+# 檢查客戶端是否已斷線的間隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
 
 class ChatRequest(BaseModel):
     question: str
@@ -22,10 +30,27 @@ class ChatRequest(BaseModel):
     bge_dir: Optional[str] = None
     embedding_policy: Optional[str] = None
     backbone: Optional[str] = None
+    timeout: Optional[float] = None
 
 
 @router.post("/ask")
-def ask(req: ChatRequest):
+async def ask(req: ChatRequest, request: Request):
+    """
+    推理在執行緒池中進行；客戶端斷線時取消請求的 deadline，
+    工作執行緒在下一個檢查點（LLM/SQL 調用之間）停止，不再佔用資源。
+    """
+    cancel_event = threading.Event()
+    task = asyncio.ensure_future(run_in_threadpool(_ask_sync, req, cancel_event))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            cancel_event.set()
+            raise HTTPException(status_code=499, detail="client disconnected")
+
+
+def _ask_sync(req: ChatRequest, cancel_event: threading.Event):
     cfg = merge_config(req.dict())
 
     # 构造 argparse.Namespace 供 interactive_chat 使用
@@ -66,11 +91,19 @@ def ask(req: ChatRequest):
             os.chdir(str(oi_dir))
 
             from interactive_chat import interactive_chat  # noqa: E402
+            from utils.deadline import Deadline, DeadlineExceeded  # noqa: E402
+
+            args.deadline = Deadline(req.timeout or CHAT_REQUEST_TIMEOUT, cancel_event=cancel_event)
 
             # 捕获 stdout 中的答案文本（interactive_chat 会 print(answer)）
             buf = io.StringIO()
-            with redirect_stdout(buf):
-                interactive_chat(args)
+            try:
+                with redirect_stdout(buf):
+                    interactive_chat(args)
+            except DeadlineExceeded as e:
+                if cancel_event.is_set():
+                    raise HTTPException(status_code=499, detail="client disconnected")
+                raise HTTPException(status_code=504, detail=f"request timed out: {e}")
             output = buf.getvalue().strip()
         finally:
             # 还原现场
@@ -86,6 +119,8 @@ def ask(req: ChatRequest):
             answer_text = ""
 
         return {"answer": answer_text}
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback as _tb
         err = f"{e}\n\n{_tb.format_exc()}"
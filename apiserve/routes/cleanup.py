@@ -2,8 +2,9 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 
-from ..tasks import GLOBAL_TASK_QUEUE
+from ..tasks import GLOBAL_TASK_QUEUE, TaskPriority, TaskType
 from ..deps import merge_config
+from ..table_catalog import TABLE_CATALOG
 
 
 router = APIRouter()
@@ -24,10 +25,14 @@ def cleanup(req: CleanupRequest):
     def task():
         # 重用现有脚本的主逻辑
         from offline_data_ingestion_and_query_interface.src.cleanup import run_cleanup
-        code = run_cleanup(targets=req.targets, assume_yes=req.yes, dry_run=req.dry_run)
+        try:
+            code = run_cleanup(targets=req.targets, assume_yes=req.yes, dry_run=req.dry_run)
+        finally:
+            TABLE_CATALOG.invalidate()
         return {"exit_code": code}
 
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
+    # 清理耗时短且会释放资源，优先执行
+    task_id = GLOBAL_TASK_QUEUE.submit(task, task_type=TaskType.CLEANUP, priority=TaskPriority.HIGH)
     return {"task_id": task_id, "status": "queued"}
 
 
@@ -39,3 +44,10 @@ def get_task(task_id: str):
     return res
 
 
+@router.delete("/tasks/{task_id}")
+def cancel_task(task_id: str):
+    res = GLOBAL_TASK_QUEUE.cancel(task_id)
+    if not res:
+        raise HTTPException(status_code=404, detail="task not found")
+    return res
+
@@ -1,21 +1,135 @@
 from fastapi import APIRouter, HTTPException
 from fastapi import UploadFile, File, Form
 import os
+import threading
 import uuid
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 
-from ..tasks import GLOBAL_TASK_QUEUE
+from ..tasks import GLOBAL_TASK_QUEUE, TaskType, current_progress
 from ..deps import merge_config
+from ..uploads import save_upload
+from ..table_catalog import TABLE_CATALOG
 
 
 router = APIRouter()
 
+SUPPORTED_UPLOAD_EXTENSIONS = (".xlsx", ".xls", ".csv")
+
+
+def _check_extensions(files: List[UploadFile]) -> None:
+    for file in files:
+        if not os.path.basename(file.filename).lower().endswith(SUPPORTED_UPLOAD_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Only .xlsx, .xls or .csv files are supported")
+
+
+async def _check_extensions_or_close(files: List[UploadFile]) -> None:
+    # 先校验全部文件再落盘，避免部分文件已保存后才报错
+    try:
+        _check_extensions(files)
+    except HTTPException:
+        for file in files:
+            await file.close()
+        raise
+
+
+def _skipped_response(saved: dict) -> dict:
+    # 与目录中已有文件内容完全相同：不落盘、不触发导入/重建（force=true 可强制重新导入）
+    return {
+        "task_id": None,
+        "status": "skipped",
+        "saved_path": saved["saved_path"],
+        "duplicate_of": saved["duplicate_of"],
+        "sha256": saved["sha256"],
+    }
+
 
 class ImportRequest(BaseModel):
     excel_dir: Optional[str] = None
 
 
+# 导入步骤按 excel_dir 串行：导入任务（IMPORT）与导入+重建任务（EMBEDDING）各有并发上限，
+# 不加锁时两者可能同时扫描到同一批新文件并重复写表/schema/快照
+_ingest_locks: Dict[str, threading.Lock] = {}
+_ingest_locks_guard = threading.Lock()
+
+
+def _ingest_lock(excel_dir: str) -> threading.Lock:
+    key = os.path.realpath(excel_dir) if excel_dir else ""
+    with _ingest_locks_guard:
+        return _ingest_locks.setdefault(key, threading.Lock())
+
+
+def ingest_excel_dir(excel_dir: str, progress_callback=None):
+    """在 excel_dir 的导入锁内执行导入，结束后使表目录缓存失效。"""
+    from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
+    with _ingest_lock(excel_dir):
+        try:
+            return parse_excel_file_and_insert_to_db(excel_dir, progress_callback=progress_callback)
+        finally:
+            TABLE_CATALOG.invalidate()
+
+
+def submit_import_task(excel_dir: str) -> str:
+    """提交导入 excel_dir 的后台任务，返回 task_id。"""
+    def task():
+        return ingest_excel_dir(excel_dir, progress_callback=current_progress())
+
+    # 同一目录的导入在排队时合并：执行时会扫描到目录中的全部新文件
+    return GLOBAL_TASK_QUEUE.submit(task, task_type=TaskType.IMPORT, dedupe_key=excel_dir)
+
+
+def submit_import_and_rebuild_task(cfg: dict, save_path: Optional[str] = None, policy: Optional[str] = None) -> str:
+    """提交“导入 excel_dir → 构建/重建向量”的串行后台任务，cfg 为 merge_config 的结果。返回 task_id。"""
+    # 读取用于构建嵌入的最终参数（含默认）
+    final_doc_dir = cfg.get("doc_dir")
+    final_excel_dir = cfg.get("excel_dir")
+    final_bge_dir = cfg.get("bge_dir")
+    # 默认 save_path 固定到 online_inference/embedding.pkl
+    default_save_path = os.path.join("online_inference", "embedding.pkl")
+    final_save_path = (cfg.get("embedding_save_path") if not save_path else save_path) or default_save_path
+    final_policy = (cfg.get("embedding_policy") if not policy else policy) or "rebuild"
+
+    # 串行后台任务：1) 持久化 2) 重建向量（等价于 CLI embeddings 路由的内部逻辑）
+    def task():
+        from online_inference.embed_index import main as embed_main
+        import sys
+
+        progress = current_progress()
+
+        # Step 1: 导入/持久化（与同目录的导入任务共用导入锁）
+        ingest_excel_dir(final_excel_dir, progress_callback=progress)
+
+        # Step 2: 构建/重建嵌入
+        argv = [
+            "--doc_dir", final_doc_dir,
+            "--excel_dir", final_excel_dir,
+            "--bge_dir", final_bge_dir,
+            "--save_path", final_save_path,
+            "--policy", final_policy,
+        ]
+        prev = list(sys.argv)
+        try:
+            sys.argv = ["embed_index.py", *argv]
+            embed_main(progress_callback=progress)
+        finally:
+            sys.argv = prev
+
+        return {
+            "save_path": final_save_path,
+            "policy": final_policy,
+            "excel_dir": final_excel_dir,
+            "doc_dir": final_doc_dir,
+        }
+
+    # 含向量重建（且会替换 sys.argv），与 /embeddings/build 共用 embedding 类型的并发上限
+    return GLOBAL_TASK_QUEUE.submit(
+        task,
+        task_type=TaskType.EMBEDDING,
+        dedupe_key=("import_and_rebuild", final_excel_dir, final_doc_dir, final_bge_dir, final_save_path, final_policy),
+    )
+
+
 @router.get("/dirs")
 def get_dirs(excel_dir: Optional[str] = None, doc_dir: Optional[str] = None, bge_dir: Optional[str] = None, save_path: Optional[str] = None):
     cfg = merge_config({
@@ -37,12 +151,7 @@ def run_import(req: ImportRequest):
     cfg = merge_config(req.dict())
     excel_dir = cfg.get("excel_dir")
 
-    def task():
-        from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
-        # 此函数内部会读取 DEFAULT 的 dev_excel 目录；这里传参以适配
-        return parse_excel_file_and_insert_to_db(excel_dir)
-
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
+    task_id = submit_import_task(excel_dir)
     return {"task_id": task_id, "status": "queued"}
 
 
@@ -52,80 +161,69 @@ def get_task(task_id: str):
     if not res:
         raise HTTPException(status_code=404, detail="task not found")
     return res
+
+
+@router.delete("/tasks/{task_id}")
+def cancel_task(task_id: str):
+    res = GLOBAL_TASK_QUEUE.cancel(task_id)
+    if not res:
+        raise HTTPException(status_code=404, detail="task not found")
+    return res
+
+
 @router.post("/upload")
-async def upload_excel(file: UploadFile = File(...), excel_dir: Optional[str] = Form(None)):
+async def upload_excel(file: UploadFile = File(...), excel_dir: Optional[str] = Form(None), force: bool = Form(False)):
     # 解析配置，拿到目标根目录
     cfg = merge_config({"excel_dir": excel_dir})
     dest_root = cfg.get("excel_dir")
+    schema_dir = cfg.get("doc_dir")
     if not dest_root:
         raise HTTPException(status_code=400, detail="excel_dir is not configured")
 
     # 保存上传的文件到 excel_dir 根目录
     os.makedirs(dest_root, exist_ok=True)
-    safe_name = os.path.basename(file.filename)
-    lower_name = safe_name.lower()
-    if not (lower_name.endswith(".xlsx") or lower_name.endswith(".xls")):
-        raise HTTPException(status_code=400, detail="Only .xlsx or .xls files are supported")
-    saved_path = os.path.join(dest_root, safe_name)
-    try:
-        with open(saved_path, "wb") as fout:
-            while True:
-                chunk = await file.read(1024 * 1024)
-                if not chunk:
-                    break
-                fout.write(chunk)
-    finally:
-        await file.close()
+    await _check_extensions_or_close([file])
+    saved = await save_upload(file, dest_root, force=force, schema_dir=schema_dir)
+    if saved["duplicate_of"]:
+        return _skipped_response(saved)
+    saved_path = saved["saved_path"]
 
     # 不再对 .xls 进行转换，保留原始文件
 
     # 提交异步任务：处理 excel_dir 根目录（新文件会被发现并导入）
-    def task():
-        from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
-        return parse_excel_file_and_insert_to_db(dest_root)
-
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
-    return {"task_id": task_id, "status": "queued", "saved_path": saved_path}
+    task_id = submit_import_task(dest_root)
+    return {"task_id": task_id, "status": "queued", "saved_path": saved_path, "sha256": saved["sha256"]}
 
 
 
 @router.post("/upload_many")
-async def upload_excel_many(files: List[UploadFile] = File(...), excel_dir: Optional[str] = Form(None)):
+async def upload_excel_many(files: List[UploadFile] = File(...), excel_dir: Optional[str] = Form(None), force: bool = Form(False)):
     # 解析配置，拿到目标根目录
     cfg = merge_config({"excel_dir": excel_dir})
     dest_root = cfg.get("excel_dir")
+    schema_dir = cfg.get("doc_dir")
     if not dest_root:
         raise HTTPException(status_code=400, detail="excel_dir is not configured")
 
     os.makedirs(dest_root, exist_ok=True)
 
+    await _check_extensions_or_close(files)
     saved_paths = []
+    skipped = []
     for file in files:
-        safe_name = os.path.basename(file.filename)
-        lower_name = safe_name.lower()
-        if not (lower_name.endswith(".xlsx") or lower_name.endswith(".xls")):
-            await file.close()
-            raise HTTPException(status_code=400, detail="Only .xlsx or .xls files are supported")
-        saved_path = os.path.join(dest_root, safe_name)
-        try:
-            with open(saved_path, "wb") as fout:
-                while True:
-                    chunk = await file.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    fout.write(chunk)
-        finally:
-            await file.close()
-        # 不再对 .xls 进行转换，保留原始文件
-        saved_paths.append(saved_path)
+        saved = await save_upload(file, dest_root, force=force, schema_dir=schema_dir)
+        if saved["duplicate_of"]:
+            skipped.append(saved)
+        else:
+            # 不再对 .xls 进行转换，保留原始文件
+            saved_paths.append(saved["saved_path"])
+    if not saved_paths:
+        # 全部与已有文件内容相同：不触发导入/重建
+        return {"task_id": None, "status": "skipped", "saved_paths": [], "skipped": skipped}
 
     # 提交异步任务：处理 excel_dir 根目录（新文件会被发现并导入）
-    def task():
-        from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
-        return parse_excel_file_and_insert_to_db(dest_root)
-
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
-    return {"task_id": task_id, "status": "queued", "saved_paths": saved_paths}
+    task_id = submit_import_task(dest_root)
+    return {"task_id": task_id, "status": "queued", "saved_paths": saved_paths, "skipped": skipped}
 
 
 
@@ -137,6 +235,7 @@ async def upload_and_rebuild(
     save_path: Optional[str] = Form(None),
     doc_dir: Optional[str] = Form(None),
     bge_dir: Optional[str] = Form(None),
+    force: bool = Form(False),
 ):
     # 解析配置，拿到目标根目录与嵌入默认参数
     cfg = merge_config({
@@ -147,71 +246,23 @@ async def upload_and_rebuild(
         "bge_dir": bge_dir,
     })
     dest_root = cfg.get("excel_dir")
+    schema_dir = cfg.get("doc_dir")
     if not dest_root:
         raise HTTPException(status_code=400, detail="excel_dir is not configured")
 
     os.makedirs(dest_root, exist_ok=True)
 
     # 保存到 excel_dir 根目录
-    safe_name = os.path.basename(file.filename)
-    lower_name = safe_name.lower()
-    if not (lower_name.endswith(".xlsx") or lower_name.endswith(".xls")):
-        raise HTTPException(status_code=400, detail="Only .xlsx or .xls files are supported")
-    saved_path = os.path.join(dest_root, safe_name)
-    try:
-        with open(saved_path, "wb") as fout:
-            while True:
-                chunk = await file.read(1024 * 1024)
-                if not chunk:
-                    break
-                fout.write(chunk)
-    finally:
-        await file.close()
+    await _check_extensions_or_close([file])
+    saved = await save_upload(file, dest_root, force=force, schema_dir=schema_dir)
+    if saved["duplicate_of"]:
+        return _skipped_response(saved)
+    saved_path = saved["saved_path"]
 
     # 不再对 .xls 进行转换，保留原始文件
 
-    # 读取用于构建嵌入的最终参数（含默认）
-    final_doc_dir = cfg.get("doc_dir")
-    final_excel_dir = cfg.get("excel_dir")
-    final_bge_dir = cfg.get("bge_dir")
-    # 默认 save_path 固定到 online_inference/embedding.pkl
-    default_save_path = os.path.join("online_inference", "embedding.pkl")
-    final_save_path = (cfg.get("embedding_save_path") if not save_path else save_path) or default_save_path
-    final_policy = (cfg.get("embedding_policy") if not policy else policy) or "rebuild"
-
-    # 串行后台任务：1) 持久化 2) 重建向量（等价于 CLI embeddings 路由的内部逻辑）
-    def task():
-        from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
-        from online_inference.embed_index import main as embed_main
-        import sys
-
-        # Step 1: 导入/持久化
-        parse_excel_file_and_insert_to_db(final_excel_dir)
-
-        # Step 2: 构建/重建嵌入
-        argv = [
-            "--doc_dir", final_doc_dir,
-            "--excel_dir", final_excel_dir,
-            "--bge_dir", final_bge_dir,
-            "--save_path", final_save_path,
-            "--policy", final_policy,
-        ]
-        prev = list(sys.argv)
-        try:
-            sys.argv = ["embed_index.py", *argv]
-            embed_main()
-        finally:
-            sys.argv = prev
-
-        return {
-            "save_path": final_save_path,
-            "policy": final_policy,
-            "excel_dir": final_excel_dir,
-            "doc_dir": final_doc_dir,
-        }
-
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
-    return {"task_id": task_id, "status": "queued", "saved_path": saved_path}
+    task_id = submit_import_and_rebuild_task(cfg, save_path, policy)
+    return {"task_id": task_id, "status": "queued", "saved_path": saved_path, "sha256": saved["sha256"]}
 
 
 @router.post("/upload_and_rebuild_many")
@@ -222,6 +273,7 @@ async def upload_and_rebuild_many(
     save_path: Optional[str] = Form(None),
     doc_dir: Optional[str] = Form(None),
     bge_dir: Optional[str] = Form(None),
+    force: bool = Form(False),
 ):
     # 解析配置，拿到目标根目录与嵌入默认参数
     cfg = merge_config({
@@ -232,70 +284,25 @@ async def upload_and_rebuild_many(
         "bge_dir": bge_dir,
     })
     dest_root = cfg.get("excel_dir")
+    schema_dir = cfg.get("doc_dir")
     if not dest_root:
         raise HTTPException(status_code=400, detail="excel_dir is not configured")
 
     os.makedirs(dest_root, exist_ok=True)
 
+    await _check_extensions_or_close(files)
     saved_paths = []
+    skipped = []
     for file in files:
-        safe_name = os.path.basename(file.filename)
-        lower_name = safe_name.lower()
-        if not (lower_name.endswith(".xlsx") or lower_name.endswith(".xls")):
-            await file.close()
-            raise HTTPException(status_code=400, detail="Only .xlsx or .xls files are supported")
-        saved_path = os.path.join(dest_root, safe_name)
-        try:
-            with open(saved_path, "wb") as fout:
-                while True:
-                    chunk = await file.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    fout.write(chunk)
-        finally:
-            await file.close()
-        # 不再对 .xls 进行转换，保留原始文件
-        saved_paths.append(saved_path)
-
-    # 读取用于构建嵌入的最终参数（含默认）
-    final_doc_dir = cfg.get("doc_dir")
-    final_excel_dir = cfg.get("excel_dir")
-    final_bge_dir = cfg.get("bge_dir")
-    # 默认 save_path 固定到 online_inference/embedding.pkl
-    default_save_path = os.path.join("online_inference", "embedding.pkl")
-    final_save_path = (cfg.get("embedding_save_path") if not save_path else save_path) or default_save_path
-    final_policy = (cfg.get("embedding_policy") if not policy else policy) or "rebuild"
-
-    # 串行后台任务：1) 持久化 2) 重建向量
-    def task():
-        from offline_data_ingestion_and_query_interface.src.data_persistent import parse_excel_file_and_insert_to_db
-        from online_inference.embed_index import main as embed_main
-        import sys
-
-        # Step 1: 导入/持久化
-        parse_excel_file_and_insert_to_db(final_excel_dir)
-
-        # Step 2: 构建/重建嵌入
-        argv = [
-            "--doc_dir", final_doc_dir,
-            "--excel_dir", final_excel_dir,
-            "--bge_dir", final_bge_dir,
-            "--save_path", final_save_path,
-            "--policy", final_policy,
-        ]
-        prev = list(sys.argv)
-        try:
-            sys.argv = ["embed_index.py", *argv]
-            embed_main()
-        finally:
-            sys.argv = prev
-
-        return {
-            "save_path": final_save_path,
-            "policy": final_policy,
-            "excel_dir": final_excel_dir,
-            "doc_dir": final_doc_dir,
-        }
-
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
-    return {"task_id": task_id, "status": "queued", "saved_paths": saved_paths}
+        saved = await save_upload(file, dest_root, force=force, schema_dir=schema_dir)
+        if saved["duplicate_of"]:
+            skipped.append(saved)
+        else:
+            # 不再对 .xls 进行转换，保留原始文件
+            saved_paths.append(saved["saved_path"])
+    if not saved_paths:
+        # 全部与已有文件内容相同：不触发导入/重建
+        return {"task_id": None, "status": "skipped", "saved_paths": [], "skipped": skipped}
+
+    task_id = submit_import_and_rebuild_task(cfg, save_path, policy)
+    return {"task_id": task_id, "status": "queued", "saved_paths": saved_paths, "skipped": skipped}
@@ -3,7 +3,7 @@ from pydantic import BaseModel
 from typing import Optional
 import os
 
-from ..tasks import GLOBAL_TASK_QUEUE
+from ..tasks import GLOBAL_TASK_QUEUE, TaskPriority, TaskType, current_progress
 from ..deps import merge_config
 
 
@@ -33,6 +33,7 @@ def build_embeddings(req: EmbeddingBuildRequest):
     def task():
         from online_inference.embed_index import main as embed_main
         import sys
+        progress = current_progress()
         argv = [
             "--doc_dir", doc_dir,
             "--excel_dir", excel_dir,
@@ -44,12 +45,18 @@ def build_embeddings(req: EmbeddingBuildRequest):
         prev = list(sys.argv)
         try:
             sys.argv = ["embed_index.py", *argv]
-            embed_main()
+            embed_main(progress_callback=progress)
         finally:
             sys.argv = prev
         return {"save_path": save_path, "policy": policy}
 
-    task_id = GLOBAL_TASK_QUEUE.submit(task)
+    # 同一 save_path（且参数相同）的重建在排队时合并为一个
+    task_id = GLOBAL_TASK_QUEUE.submit(
+        task,
+        task_type=TaskType.EMBEDDING,
+        priority=TaskPriority.LOW,
+        dedupe_key=("build", doc_dir, excel_dir, bge_dir, save_path, policy),
+    )
     return {"task_id": task_id, "status": "queued"}
 
 
@@ -61,3 +68,10 @@ def get_task(task_id: str):
     return res
 
 
+@router.delete("/tasks/{task_id}")
+def cancel_task(task_id: str):
+    res = GLOBAL_TASK_QUEUE.cancel(task_id)
+    if not res:
+        raise HTTPException(status_code=404, detail="task not found")
+    return res
+
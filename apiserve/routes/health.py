@@ -1,11 +1,13 @@
 from fastapi import APIRouter
 
+from ..tasks import GLOBAL_TASK_QUEUE
+
 
 router = APIRouter()
 
 
 @router.get("/health")
 def health():
-    return {"status": "ok", "version": "0.1.0"}
+    return {"status": "ok", "version": "0.1.0", "tasks": GLOBAL_TASK_QUEUE.stats()}
 
 
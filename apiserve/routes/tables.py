@@ -1,48 +1,46 @@
-from fastapi import APIRouter
-from typing import List
-import os
-import json
+from fastapi import APIRouter, Header, Query, Response
+from typing import Optional
+import hashlib
 
 from ..deps import merge_config
+from ..table_catalog import TABLE_CATALOG
 
 
 router = APIRouter()
 
 
 @router.get("")
-def list_tables(doc_dir: str | None = None, excel_dir: str | None = None, include_meta: bool = False):
+def list_tables(
+    response: Response,
+    doc_dir: str | None = None,
+    excel_dir: str | None = None,
+    include_meta: bool = False,
+    prefix: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    offset: int = Query(0, ge=0),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    表格目录。结果来自 TABLE_CATALOG 缓存（不逐次遍历 schema 目录）；prefix 为表名前缀，
+    q 为不区分大小写的子串，limit/offset 分页（不传 limit 时返回全部）。
+    ETag 由目录内容与查询参数共同决定，If-None-Match 命中时返回 304。
+    """
     cfg = merge_config({"doc_dir": doc_dir, "excel_dir": excel_dir})
     schema_dir = cfg.get("doc_dir")
-    tables: List[str] = []
-    metas: List[dict] = []
-    if schema_dir and os.path.isdir(schema_dir):
-        for filename in os.listdir(schema_dir):
-            if filename.endswith(".json"):
-                stem = os.path.splitext(filename)[0]
-                tables.append(stem)
-                if include_meta:
-                    try:
-                        with open(os.path.join(schema_dir, filename), "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                        metas.append({
-                            "table": stem,
-                            "table_name": data.get("table_name"),
-                            "original_filename": data.get("original_filename"),
-                            "source_file_hash": data.get("source_file_hash")
-                        })
-                    except Exception:
-                        metas.append({
-                            "table": stem,
-                            "table_name": stem,
-                            "original_filename": None,
-                            "source_file_hash": None
-                        })
-    result = {"tables": sorted(tables), "count": len(tables), "schema_dir": schema_dir}
-    if include_meta:
-        # Align metas to sorted order
-        order = {t: i for i, t in enumerate(sorted(tables))}
-        metas_sorted = sorted(metas, key=lambda m: order.get(m.get("table", ""), 0))
-        result["meta"] = metas_sorted
-    return result
+    if not schema_dir:
+        return {"tables": [], "count": 0, "total": 0, "offset": offset, "limit": limit, "schema_dir": schema_dir}
 
+    page, total, view = TABLE_CATALOG.query(schema_dir, prefix=prefix, contains=q, limit=limit, offset=offset)
+    # 进程间一致（不用内置 hash），多 worker 部署时同一内容给出同一 ETag
+    params_key = hashlib.sha1(repr((schema_dir, include_meta, prefix, q, limit, offset)).encode("utf-8")).hexdigest()[:8]
+    etag = f'"{view.etag}-{params_key}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
 
+    result = {"tables": page, "count": total, "total": total, "offset": offset, "limit": limit, "schema_dir": schema_dir}
+    if include_meta:
+        result["meta"] = [view.metas[t] for t in page]
+    return result
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from ..tasks import GLOBAL_TASK_QUEUE, TERMINAL_STATUSES
+
+
+router = APIRouter()
+
+# 长轮询/SSE 检查内存中任务版本的间隔（秒），只读进程内状态，不产生额外请求
+_WATCH_INTERVAL = 0.25
+# SSE 心跳间隔（秒），防止代理因空闲断开连接
+_SSE_HEARTBEAT = 15.0
+
+
+@router.get("")
+def list_tasks(
+    status: Optional[str] = None,
+    task_type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    # 按创建时间倒序分页；单个任务的 result 通过 /{kind}/tasks/{task_id} 查询
+    return GLOBAL_TASK_QUEUE.list(status=status, task_type=task_type, limit=limit, offset=offset)
+
+
+@router.get("/{task_id}")
+def get_task(task_id: str):
+    res = GLOBAL_TASK_QUEUE.get(task_id)
+    if not res:
+        raise HTTPException(status_code=404, detail="task not found")
+    return res
+
+
+async def _next_change(task_id: str, since: int, timeout: float) -> Optional[dict]:
+    """等到任务 version 大于 since、任务结束或超时，返回当时的任务记录；任务不存在时返回 None。"""
+    deadline = time.monotonic() + timeout
+    while True:
+        res = GLOBAL_TASK_QUEUE.get(task_id)
+        if not res or res["version"] > since or res["status"] in TERMINAL_STATUSES:
+            return res
+        if time.monotonic() >= deadline:
+            return res
+        await asyncio.sleep(_WATCH_INTERVAL)
+
+
+@router.get("/{task_id}/wait")
+async def wait_task(task_id: str, since: int = -1, timeout: float = Query(30.0, ge=0, le=120)):
+    """长轮询：任务状态或进度较 since 版本有变化（或已结束）时立即返回，否则最多等待 timeout 秒。"""
+    res = await _next_change(task_id, since, timeout)
+    if not res:
+        raise HTTPException(status_code=404, detail="task not found")
+    return res
+
+
+@router.get("/{task_id}/events")
+async def task_events(task_id: str, request: Request):
+    """SSE：每次状态/进度变化推送一条 `event: task`，任务结束时推送 `event: done` 后关闭。"""
+    first = GLOBAL_TASK_QUEUE.get(task_id)
+    if not first:
+        raise HTTPException(status_code=404, detail="task not found")
+
+    async def stream():
+        since = -1
+        while True:
+            if await request.is_disconnected():
+                return
+            res = await _next_change(task_id, since, _SSE_HEARTBEAT)
+            if not res:
+                return
+            if res["version"] <= since and res["status"] not in TERMINAL_STATUSES:
+                yield ": keep-alive\n\n"
+                continue
+            since = res["version"]
+            event = "done" if res["status"] in TERMINAL_STATUSES else "task"
+            yield f"event: {event}\ndata: {json.dumps(res, ensure_ascii=False, default=str)}\n\n"
+            if event == "done":
+                return
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List, Optional
+import os
+
+from ..deps import merge_config
+from ..uploads import (
+    UploadOffsetMismatch, UploadVerificationError, abort_session, complete_sessions, init_session, load_session,
+    session_status, write_part,
+)
+from .data import SUPPORTED_UPLOAD_EXTENSIONS, submit_import_and_rebuild_task, submit_import_task
+
+
+router = APIRouter()
+
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    excel_dir: Optional[str] = None
+    doc_dir: Optional[str] = None
+    force: bool = False
+
+
+class UploadCompleteRequest(BaseModel):
+    upload_ids: List[str]
+    rebuild: bool = False
+    policy: Optional[str] = None
+    save_path: Optional[str] = None
+    doc_dir: Optional[str] = None
+    bge_dir: Optional[str] = None
+    force: bool = False
+
+
+def _load_or_404(upload_id: str) -> dict:
+    try:
+        return load_session(upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload not found")
+
+
+@router.post("")
+def init_upload(req: UploadInitRequest):
+    """创建或恢复上传会话；返回 upload_id 与服务端已收到的偏移，内容未变化时返回 skipped。"""
+    cfg = merge_config({"excel_dir": req.excel_dir, "doc_dir": req.doc_dir})
+    dest_root = cfg.get("excel_dir")
+    if not dest_root:
+        raise HTTPException(status_code=400, detail="excel_dir is not configured")
+    if not os.path.basename(req.filename).lower().endswith(SUPPORTED_UPLOAD_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only .xlsx, .xls or .csv files are supported")
+    if req.size < 0:
+        raise HTTPException(status_code=400, detail="size must be >= 0")
+    os.makedirs(dest_root, exist_ok=True)
+    return init_session(dest_root, req.filename, req.size, sha256=req.sha256, force=req.force,
+                        schema_dir=cfg.get("doc_dir"))
+
+
+@router.get("/{upload_id}")
+def get_upload(upload_id: str):
+    return session_status(_load_or_404(upload_id))
+
+
+@router.put("/{upload_id}")
+async def put_part(upload_id: str, offset: int, request: Request, x_part_sha256: Optional[str] = Header(None)):
+    """
+    请求体为原始字节，写到文件的 offset 处。offset 大于已收字节数时回 409 并给出当前偏移；
+    小于已收字节数视为重传，从 offset 处覆盖。可选请求头 X-Part-SHA256 校验分片。
+    """
+    try:
+        return await write_part(upload_id, offset, request.stream(), part_sha256=x_part_sha256)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload not found")
+    except UploadOffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "offset": e.offset})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{upload_id}")
+def delete_upload(upload_id: str):
+    _load_or_404(upload_id)
+    abort_session(upload_id)
+    return {"upload_id": upload_id, "status": "aborted"}
+
+
+@router.post("/complete")
+async def complete_uploads(req: UploadCompleteRequest):
+    """
+    完成一个或多个会话：全部校验通过后才落盘（任一会话未传完或哈希不符时回 409，所有会话保持原样），
+    内容未变化的计入 skipped，随后与 upload_many / upload_and_rebuild_many 一样只提交一个导入（或导入+重建）任务。
+    """
+    if not req.upload_ids:
+        raise HTTPException(status_code=400, detail="upload_ids is empty")
+    metas = [_load_or_404(upload_id) for upload_id in req.upload_ids]
+    dest_roots = {meta["dest_root"] for meta in metas}
+    if len(dest_roots) != 1:
+        raise HTTPException(status_code=400, detail="all uploads must target the same excel_dir")
+    dest_root = dest_roots.pop()
+    schema_dir = merge_config({"excel_dir": dest_root, "doc_dir": req.doc_dir}).get("doc_dir")
+
+    try:
+        results = await complete_sessions(req.upload_ids, force=req.force, schema_dir=schema_dir)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload not found")
+    except UploadVerificationError as e:
+        raise HTTPException(status_code=409, detail={"upload_id": e.upload_id, "error": str(e)})
+
+    saved_paths = []
+    skipped = []
+    for saved in results:
+        if saved["duplicate_of"]:
+            skipped.append(saved)
+        else:
+            saved_paths.append(saved["saved_path"])
+    if not saved_paths:
+        return {"task_id": None, "status": "skipped", "saved_paths": [], "skipped": skipped}
+
+    if req.rebuild:
+        cfg = merge_config({
+            "excel_dir": dest_root,
+            "embedding_policy": req.policy,
+            "embedding_save_path": req.save_path,
+            "doc_dir": req.doc_dir,
+            "bge_dir": req.bge_dir,
+        })
+        task_id = submit_import_and_rebuild_task(cfg, req.save_path, req.policy)
+    else:
+        task_id = submit_import_task(dest_root)
+    return {"task_id": task_id, "status": "queued", "saved_paths": saved_paths, "skipped": skipped}
@@ -21,18 +21,54 @@ document.querySelectorAll('nav.tabs button').forEach(btn => {
 })
 
 // Helpers
-async function waitTaskUntilDone(kind, taskId, onUpdate) {
-    const url = `${apiBase}/${kind}/tasks/${taskId}`
+const TERMINAL_STATUSES = ['succeeded', 'failed', 'cancelled']
+
+// 优先使用 SSE（/tasks/{id}/events）接收状态与进度；不可用时退回长轮询（/tasks/{id}/wait）
+function waitTaskUntilDone(kind, taskId, onUpdate) {
+    if (!window.EventSource) return waitTaskByLongPoll(taskId, onUpdate)
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${apiBase}/tasks/${taskId}/events`)
+        let settled = false
+        source.addEventListener('task', (e) => { if (onUpdate) onUpdate(JSON.parse(e.data)) })
+        source.addEventListener('done', (e) => {
+            settled = true
+            source.close()
+            const data = JSON.parse(e.data)
+            if (onUpdate) onUpdate(data)
+            resolve(data)
+        })
+        source.onerror = () => {
+            if (settled) return
+            settled = true
+            source.close()
+            waitTaskByLongPoll(taskId, onUpdate).then(resolve, reject)
+        }
+    })
+}
+
+async function waitTaskByLongPoll(taskId, onUpdate) {
+    let version = -1
     while (true) {
-        const r = await fetch(url)
+        const r = await fetch(`${apiBase}/tasks/${taskId}/wait?since=${version}&timeout=30`)
         if (!r.ok) { throw new Error('任务查询失败') }
         const data = await r.json()
-        if (onUpdate) onUpdate(data)
-        if (data.status === 'succeeded' || data.status === 'failed') return data
-        await new Promise(res => setTimeout(res, 1000))
+        if (data.version > version) {
+            version = data.version
+            if (onUpdate) onUpdate(data)
+        }
+        if (TERMINAL_STATUSES.includes(data.status)) return data
     }
 }
 
+function formatProgress(p) {
+    if (!p || !p.stage) return ''
+    let text = `，${p.stage}`
+    if (p.total != null) text += ` ${p.done}/${p.total} ${p.unit || ''}`
+    if (p.rows_inserted != null) text += `，已写入 ${p.rows_inserted} 行`
+    if (p.eta_seconds != null) text += `，预计剩余 ${Math.round(p.eta_seconds)} 秒`
+    return text
+}
+
 function setProgress(el, msg) { el.textContent = msg }
 
 // Upload - single
@@ -48,10 +84,13 @@ $('#single-upload-form').addEventListener('submit', async(e) => {
     const resp = await fetch(`${apiBase}/data/upload`, { method: 'POST', body: form })
     if (!resp.ok) { setProgress($('#single-upload-progress'), '上传失败'); return }
     const info = await resp.json()
-    setProgress($('#single-upload-progress'), `已提交导入任务：${info.task_id}，轮询中...`)
+    if (info.status === 'skipped') {
+        return setProgress($('#single-upload-progress'), `文件内容与已有文件 ${info.duplicate_of} 相同，已跳过导入`)
+    }
+    setProgress($('#single-upload-progress'), `已提交导入任务：${info.task_id}，等待中...`)
     try {
         const done = await waitTaskUntilDone('data', info.task_id, (d) => {
-            setProgress($('#single-upload-progress'), `任务状态：${d.status}`)
+            setProgress($('#single-upload-progress'), `任务状态：${d.status}${formatProgress(d.progress)}`)
         })
         const detail = done.error || done.result || null
         const detailText = detail ? `\n详情：\n${JSON.stringify(detail, null, 2)}` : ''
@@ -74,10 +113,14 @@ $('#multi-upload-form').addEventListener('submit', async(e) => {
     const resp = await fetch(`${apiBase}/data/upload_many`, { method: 'POST', body: form })
     if (!resp.ok) { setProgress($('#multi-upload-progress'), '上传失败'); return }
     const info = await resp.json()
-    setProgress($('#multi-upload-progress'), `已提交导入任务：${info.task_id}，轮询中...`)
+    if (info.status === 'skipped') {
+        return setProgress($('#multi-upload-progress'), '所有文件内容均与已有文件相同，已跳过导入')
+    }
+    const skippedText = info.skipped && info.skipped.length ? `（跳过 ${info.skipped.length} 个未变化文件）` : ''
+    setProgress($('#multi-upload-progress'), `已提交导入任务：${info.task_id}${skippedText}，等待中...`)
     try {
         const done = await waitTaskUntilDone('data', info.task_id, (d) => {
-            setProgress($('#multi-upload-progress'), `任务状态：${d.status}`)
+            setProgress($('#multi-upload-progress'), `任务状态：${d.status}${formatProgress(d.progress)}`)
         })
         const detail = done.error || done.result || null
         const detailText = detail ? `\n详情：\n${JSON.stringify(detail, null, 2)}` : ''
@@ -138,7 +181,7 @@ async function doCleanup(filename) {
     const info = await resp.json()
     try {
         const done = await waitTaskUntilDone('cleanup', info.task_id, (d) => {
-            setProgress($('#cleanup-progress'), `任务状态：${d.status}`)
+            setProgress($('#cleanup-progress'), `任务状态：${d.status}${formatProgress(d.progress)}`)
         })
         setProgress($('#cleanup-progress'), `完成：${done.status}`)
         refreshTables().catch(() => {})
@@ -168,7 +211,7 @@ $('#embed-form').addEventListener('submit', async(e) => {
     const info = await r.json()
     try {
         const done = await waitTaskUntilDone('embeddings', info.task_id, (d) => {
-            setProgress($('#embed-progress'), `任务状态：${d.status}`)
+            setProgress($('#embed-progress'), `任务状态：${d.status}${formatProgress(d.progress)}`)
         })
         setProgress($('#embed-progress'), `完成：${done.status}`)
     } catch (err) {
@@ -0,0 +1,134 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+# 两次完整校验之间的最长间隔（秒）。期间只 stat 目录本身（能发现增删文件），
+# 原地覆盖写入的 schema 靠导入/清理任务结束时的 invalidate() 或到期校验发现
+TABLE_CATALOG_REVALIDATE_SECONDS = float(os.getenv("TABLE_CATALOG_REVALIDATE_SECONDS", "5"))
+
+
+def _read_meta(path: str, stem: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {
+            "table": stem,
+            "table_name": data.get("table_name"),
+            "original_filename": data.get("original_filename"),
+            "source_file_hash": data.get("source_file_hash"),
+        }
+    except Exception:
+        return {"table": stem, "table_name": stem, "original_filename": None, "source_file_hash": None}
+
+
+class CatalogView(NamedTuple):
+    """一次刷新产出的不可变快照：排序后的表名、小写表名（子串过滤用）、元数据与 ETag。"""
+    tables: List[str]
+    tables_lower: List[str]
+    metas: Dict[str, Dict[str, Any]]
+    etag: str
+
+
+class _DirCatalog:
+    """单个 schema 目录的缓存状态；view 整体替换，读请求拿到引用后不受并发刷新影响。"""
+
+    def __init__(self) -> None:
+        self.dir_mtime_ns: Optional[int] = None
+        self.checked_at = 0.0
+        self.stale = True
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.view: Optional[CatalogView] = None
+
+
+class TableCatalog:
+    """
+    /tables 的目录缓存。请求路径上只有一次目录 stat；目录 mtime 变化、到期或被 invalidate() 后
+    才扫描目录，并且只重新读取 (mtime_ns, size) 变化的 schema 文件。
+    """
+
+    def __init__(self, revalidate_seconds: float = TABLE_CATALOG_REVALIDATE_SECONDS) -> None:
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._dirs: Dict[str, _DirCatalog] = {}
+
+    def invalidate(self, schema_dir: Optional[str] = None) -> None:
+        """标记缓存需要重新扫描；不传 schema_dir 时作用于全部目录。导入/清理任务结束后调用。"""
+        with self._lock:
+            entries = self._dirs.values() if schema_dir is None else [self._dirs.get(schema_dir)]
+            for entry in entries:
+                if entry is not None:
+                    entry.stale = True
+
+    def snapshot(self, schema_dir: str) -> CatalogView:
+        try:
+            dir_mtime_ns = os.stat(schema_dir).st_mtime_ns
+        except OSError:
+            dir_mtime_ns = None
+        with self._lock:
+            entry = self._dirs.setdefault(schema_dir, _DirCatalog())
+            expired = time.monotonic() - entry.checked_at >= self.revalidate_seconds
+            if entry.stale or expired or entry.dir_mtime_ns != dir_mtime_ns:
+                self._refresh(schema_dir, entry, dir_mtime_ns)
+            return entry.view
+
+    @staticmethod
+    def _refresh(schema_dir: str, entry: _DirCatalog, dir_mtime_ns: Optional[int]) -> None:
+        files: Dict[str, Tuple[int, int]] = {}
+        if dir_mtime_ns is not None:
+            try:
+                with os.scandir(schema_dir) as it:
+                    for de in it:
+                        if de.name.endswith(".json") and de.is_file():
+                            st = de.stat()
+                            files[de.name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                files = {}
+        previous = entry.view.metas if entry.view else {}
+        metas: Dict[str, Dict[str, Any]] = {}
+        for filename, sig in files.items():
+            stem = os.path.splitext(filename)[0]
+            cached = previous.get(stem)
+            if cached is not None and entry.files.get(filename) == sig:
+                metas[stem] = cached
+            else:
+                metas[stem] = _read_meta(os.path.join(schema_dir, filename), stem)
+        if entry.view is None or files != entry.files:
+            tables = sorted(metas)
+            digest = hashlib.sha1()
+            for filename in sorted(files):
+                digest.update(f"{filename}\0{files[filename][0]}\0{files[filename][1]}\n".encode("utf-8"))
+            entry.view = CatalogView(tables, [t.lower() for t in tables], metas, digest.hexdigest()[:20])
+        entry.files = files
+        entry.dir_mtime_ns = dir_mtime_ns
+        entry.checked_at = time.monotonic()
+        entry.stale = False
+
+    def query(self, schema_dir: str, prefix: Optional[str] = None, contains: Optional[str] = None,
+              limit: Optional[int] = None, offset: int = 0) -> Tuple[List[str], int, CatalogView]:
+        """
+        返回 (当前页表名, 符合条件的总数, 快照)。prefix 在排序数组上二分定位（区分大小写），
+        contains 为不区分大小写的子串匹配；无 contains 时只切出当前页，不复制整个列表。
+        """
+        view = self.snapshot(schema_dir)
+        tables = view.tables
+        lo, hi = 0, len(tables)
+        if prefix:
+            lo = bisect.bisect_left(tables, prefix, lo, hi)
+            hi = bisect.bisect_left(tables, prefix + "\U0010ffff", lo, hi)
+        if contains:
+            needle = contains.lower()
+            lowered = view.tables_lower
+            matched = [tables[i] for i in range(lo, hi) if needle in lowered[i]]
+            end = len(matched) if limit is None else offset + limit
+            return matched[offset:end], len(matched), view
+        start = min(lo + offset, hi)
+        end = hi if limit is None else min(start + limit, hi)
+        return tables[start:end], hi - lo, view
+
+
+TABLE_CATALOG = TableCatalog()
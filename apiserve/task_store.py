@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .deps import PROJECT_ROOT
+
+
+# 任务记录持久化位置；设为 ":memory:" 时仅保存在进程内
+TASK_STORE_PATH = os.getenv("TASK_STORE_PATH", os.path.join(PROJECT_ROOT, "apiserve", "data", "tasks.sqlite3"))
+# 已结束任务的保留时长（秒）与最多保留条数，超出部分按结束时间从旧到新删除
+TASK_RECORD_TTL_SECONDS = float(os.getenv("TASK_RECORD_TTL_SECONDS", str(7 * 24 * 3600)))
+TASK_STORE_MAX_RECORDS = int(os.getenv("TASK_STORE_MAX_RECORDS", "5000"))
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+ACTIVE_STATUSES = ("queued", "running")
+
+_COLUMNS = (
+    "task_id", "status", "task_type", "priority", "result", "error", "created_at",
+    "started_at", "ended_at", "coalesced", "cancel_requested", "progress", "version", "owner", "owner_pid",
+)
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteTaskStore:
+    """
+    任务记录的 SQLite 存储。每次状态变化写入一行，结束的任务只保留在这里（内存中不再持有 result），
+    并按 TTL 与总条数淘汰。owner 为进程级随机标识，用于重启后识别上一进程遗留的未完成任务。
+    同主机多个 worker 进程可共用一个库文件（WAL 模式）。
+    """
+
+    def __init__(self, path: str = TASK_STORE_PATH, ttl_seconds: float = TASK_RECORD_TTL_SECONDS,
+                 max_records: int = TASK_STORE_MAX_RECORDS, owner: Optional[str] = None) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_records = max_records
+        self.owner = owner or f"{os.getpid()}-{os.urandom(4).hex()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    task_type TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    ended_at REAL,
+                    coalesced INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    progress TEXT,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    owner_pid INTEGER
+                )
+                """
+            )
+            # 旧库补列
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+            for column, ddl in (("progress", "TEXT"), ("version", "INTEGER NOT NULL DEFAULT 0")):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {ddl}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_ended_at ON tasks(ended_at)")
+
+    def save(self, task: Dict[str, Any]) -> None:
+        """按 task_id 插入或覆盖一条记录；task 为 TaskRecord.to_dict() 的结果。"""
+        row = dict(task)
+        row["result"] = None if task.get("result") is None else json.dumps(task["result"], ensure_ascii=False, default=str)
+        row["progress"] = json.dumps(task.get("progress") or {}, ensure_ascii=False, default=str)
+        row["cancel_requested"] = int(bool(task.get("cancel_requested")))
+        row["owner"] = self.owner
+        row["owner_pid"] = os.getpid()
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO tasks ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                [row.get(c) for c in _COLUMNS],
+            )
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = {c: row[c] for c in _COLUMNS if c not in ("owner", "owner_pid")}
+        for field in ("result", "progress"):
+            if data[field] is not None:
+                try:
+                    data[field] = json.loads(data[field])
+                except ValueError:
+                    pass
+        data["progress"] = data["progress"] or {}
+        data["cancel_requested"] = bool(data["cancel_requested"])
+        waited_until = data["started_at"] or data["ended_at"] or time.time()
+        data["wait_seconds"] = round(waited_until - data["created_at"], 3)
+        return data
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_tasks(self, status: Optional[str] = None, task_type: Optional[str] = None,
+                   limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """按创建时间倒序分页列出任务，返回 (当前页, 符合条件的总数)。列表项不含 result。"""
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if task_type:
+            where.append("task_type = ?")
+            params.append(task_type)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM tasks {clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM tasks {clause} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = self._row_to_dict(row)
+            item.pop("result", None)
+            items.append(item)
+        return items, total
+
+    def evict(self) -> int:
+        """删除超过 TTL 的已结束任务，并把已结束任务数压到 max_records 以内，返回删除条数。"""
+        finished = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                f"DELETE FROM tasks WHERE status IN ({finished}) AND ended_at < ?",
+                [*FINISHED_STATUSES, time.time() - self.ttl_seconds],
+            ).rowcount
+            removed += self._conn.execute(
+                f"""
+                DELETE FROM tasks WHERE task_id IN (
+                    SELECT task_id FROM tasks WHERE status IN ({finished})
+                    ORDER BY ended_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                [*FINISHED_STATUSES, self.max_records],
+            ).rowcount
+        return removed
+
+    def recover_interrupted(self) -> int:
+        """
+        把上一进程遗留的 queued/running 记录标记为 failed：其可调用对象已随进程丢失，无法重新入队。
+        仍存活的其它 worker 进程的任务不受影响（按 owner 与 pid 判断）。
+        """
+        active = ", ".join("?" for _ in ACTIVE_STATUSES)
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT task_id, owner, owner_pid FROM tasks WHERE status IN ({active})", ACTIVE_STATUSES
+            ).fetchall()
+        orphaned = [
+            row["task_id"] for row in rows
+            if row["owner"] != self.owner and (row["owner_pid"] == os.getpid() or not _pid_alive(row["owner_pid"]))
+        ]
+        if not orphaned:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE tasks SET status = 'failed', error = ?, ended_at = ? WHERE task_id = ?",
+                [("interrupted: service restarted before the task finished", now, task_id) for task_id in orphaned],
+            )
+        return len(orphaned)
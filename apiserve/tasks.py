@@ -1,47 +1,268 @@
+import heapq
+import sqlite3
+import itertools
+import os
 import threading
 import uuid
 import time
-from typing import Any, Callable, Dict, Optional
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Hashable, Optional
 import traceback
 
+from .task_store import SQLiteTaskStore
+
 
 class TaskStatus:
     QUEUED = "queued"
     RUNNING = "running"
     SUCCEEDED = "succeeded"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class TaskPriority:
+    # 数值越小越先执行
+    HIGH = 0
+    NORMAL = 5
+    LOW = 10
+
+
+class TaskType:
+    DEFAULT = "default"
+    IMPORT = "import"
+    EMBEDDING = "embedding"
+    CLEANUP = "cleanup"
+
+
+def _parse_type_limits(value: str) -> Dict[str, int]:
+    """解析 "embedding=1,import=1" 形式的按任务类型并发上限。"""
+    limits: Dict[str, int] = {}
+    for part in (value or "").split(","):
+        if "=" not in part:
+            continue
+        name, _, limit = part.partition("=")
+        try:
+            limits[name.strip()] = max(1, int(limit))
+        except ValueError:
+            continue
+    return limits
+
+
+# 后台工作线程数；同类型任务的并发上限（未列出的类型只受线程数限制）
+TASK_QUEUE_WORKERS = int(os.getenv("TASK_QUEUE_WORKERS", "2"))
+TASK_TYPE_LIMITS = _parse_type_limits(os.getenv("TASK_TYPE_LIMITS", "embedding=1,import=1"))
+# 进度更新写入 store 的最小间隔（秒）；内存中的进度实时更新
+TASK_PROGRESS_PERSIST_INTERVAL = float(os.getenv("TASK_PROGRESS_PERSIST_INTERVAL", "2"))
+
+TERMINAL_STATUSES = (TaskStatus.SUCCEEDED, TaskStatus.FAILED, TaskStatus.CANCELLED)
+
+_current = threading.local()
 
 
 class TaskRecord:
-    def __init__(self, target: Callable[[], Any]):
+    def __init__(self, target: Callable[[], Any], task_type: str = TaskType.DEFAULT,
+                 priority: int = TaskPriority.NORMAL, dedupe_key: Optional[Hashable] = None):
         self.id = str(uuid.uuid4())
         self.target = target
+        self.task_type = task_type
+        self.priority = priority
+        self.dedupe_key = dedupe_key
         self.status = TaskStatus.QUEUED
         self.result: Optional[Any] = None
         self.error: Optional[str] = None
         self.created_at = time.time()
         self.started_at: Optional[float] = None
         self.ended_at: Optional[float] = None
+        # 被合并进本任务的重复提交次数
+        self.coalesced = 0
+        # 运行中的任务无法强制中断，只记录取消请求
+        self.cancel_requested = False
+        # 任务上报的进度（阶段、done/total、吞吐、ETA 等）；version 每次变化加一，供长轮询/SSE 判断
+        self.progress: Dict[str, Any] = {}
+        self.version = 0
+        self.stage_started_at: Optional[float] = None
+        self.persisted_at = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        waited_until = self.started_at or self.ended_at or time.time()
+        return {
+            "task_id": self.id,
+            "status": self.status,
+            "task_type": self.task_type,
+            "priority": self.priority,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "wait_seconds": round(waited_until - self.created_at, 3),
+            "coalesced": self.coalesced,
+            "cancel_requested": self.cancel_requested,
+            "progress": dict(self.progress),
+            "version": self.version,
+        }
 
 
 class InMemoryTaskQueue:
-    def __init__(self) -> None:
+    """
+    固定大小工作线程池 + 优先级队列：
+    - 按任务类型限制并发（如同一时间只跑一个向量重建）；
+    - 排队中且 dedupe_key 相同的同类型任务合并为一个；
+    - 排队中的任务可取消；提供队列深度与等待时间统计。
+    内存中只保留排队/运行中的任务，每次状态变化写入 store，结束后的记录只在 store 中查询。
+    """
+
+    # 每结束多少个任务做一次 store 淘汰
+    EVICT_EVERY = 50
+
+    def __init__(self, workers: int = TASK_QUEUE_WORKERS, type_limits: Optional[Dict[str, int]] = None,
+                 store: Optional[SQLiteTaskStore] = None) -> None:
         self._tasks: Dict[str, TaskRecord] = {}
+        self._store = store or SQLiteTaskStore()
+        self._finished_since_evict = 0
         self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._queue: list = []  # heap of (priority, seq, task_id)
+        self._seq = itertools.count()
+        self._pending_keys: Dict[tuple, str] = {}
+        self._running_by_type: Counter = Counter()
+        self._wait_times: deque = deque(maxlen=200)
+        self._num_workers = max(1, workers)
+        self._type_limits = dict(TASK_TYPE_LIMITS if type_limits is None else type_limits)
+        self._workers: list = []
+        self._store.recover_interrupted()
+        self._store.evict()
 
-    def submit(self, target: Callable[[], Any]) -> str:
-        record = TaskRecord(target)
-        with self._lock:
+    def _ensure_workers(self) -> None:
+        if self._workers:
+            return
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"task-worker-{i}", daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    def submit(self, target: Callable[[], Any], task_type: str = TaskType.DEFAULT,
+               priority: int = TaskPriority.NORMAL, dedupe_key: Optional[Hashable] = None) -> str:
+        """
+        提交任务，返回 task_id。dedupe_key 不为空且已有同类型、同 key 的任务在排队时，
+        不再新建任务而是返回已排队任务的 id（该任务执行时会处理到最新数据）。
+        """
+        with self._cond:
+            if dedupe_key is not None:
+                existing_id = self._pending_keys.get((task_type, dedupe_key))
+                if existing_id is not None:
+                    existing = self._tasks[existing_id]
+                    existing.coalesced += 1
+                    # 合并后的任务按两者中较高的优先级执行
+                    if priority < existing.priority:
+                        existing.priority = priority
+                        heapq.heappush(self._queue, (priority, next(self._seq), existing_id))
+                    self._persist(existing)
+                    return existing_id
+            record = TaskRecord(target, task_type, priority, dedupe_key)
             self._tasks[record.id] = record
-        thread = threading.Thread(target=self._run_task, args=(record.id,), daemon=True)
-        thread.start()
+            if dedupe_key is not None:
+                self._pending_keys[(task_type, dedupe_key)] = record.id
+            heapq.heappush(self._queue, (priority, next(self._seq), record.id))
+            self._persist(record)
+            self._ensure_workers()
+            self._cond.notify()
         return record.id
 
-    def _run_task(self, task_id: str) -> None:
+    def _has_capacity(self, task_type: str) -> bool:
+        limit = self._type_limits.get(task_type)
+        return limit is None or self._running_by_type[task_type] < limit
+
+    def _next_runnable(self) -> Optional[TaskRecord]:
+        """取出优先级最高、且其类型仍有并发余量的排队任务；已取消/已出队的条目顺带清理。"""
+        skipped = []
+        found = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            record = self._tasks.get(entry[2])
+            if record is None or record.status != TaskStatus.QUEUED or entry[0] != record.priority:
+                continue
+            if self._has_capacity(record.task_type):
+                found = record
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return found
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                record = self._next_runnable()
+                while record is None:
+                    self._cond.wait()
+                    record = self._next_runnable()
+                record.status = TaskStatus.RUNNING
+                record.started_at = time.time()
+                self._running_by_type[record.task_type] += 1
+                if record.dedupe_key is not None:
+                    self._pending_keys.pop((record.task_type, record.dedupe_key), None)
+                self._wait_times.append(record.started_at - record.created_at)
+                self._persist(record)
+            self._run_task(record)
+            with self._cond:
+                self._running_by_type[record.task_type] -= 1
+                self._finish(record)
+                self._cond.notify_all()
+
+    def _persist(self, record: TaskRecord) -> None:
+        record.version += 1
+        record.persisted_at = time.time()
+        # 写库失败不应中断工作线程
+        try:
+            self._store.save(record.to_dict())
+        except sqlite3.Error:
+            traceback.print_exc()
+
+    def _finish(self, record: TaskRecord) -> None:
+        """写入最终状态并从内存中移除，结果只保存在 store 中。"""
+        self._persist(record)
+        self._tasks.pop(record.id, None)
+        self._finished_since_evict += 1
+        if self._finished_since_evict >= self.EVICT_EVERY:
+            self._finished_since_evict = 0
+            try:
+                self._store.evict()
+            except sqlite3.Error:
+                traceback.print_exc()
+
+    def _report_progress(self, record: TaskRecord, event: Dict[str, Any]) -> None:
+        """
+        合并任务上报的进度事件。事件含 stage，以及可选的 done/total/unit 与其它字段；
+        按阶段开始时间计算 elapsed_seconds、throughput（unit/秒）与 eta_seconds。阶段切换时重置进度。
+        """
+        now = time.time()
         with self._lock:
-            record = self._tasks[task_id]
-            record.status = TaskStatus.RUNNING
-            record.started_at = time.time()
+            if record.status != TaskStatus.RUNNING:
+                return
+            stage = event.get("stage")
+            if record.stage_started_at is None:
+                # 第一个阶段从任务开始计时
+                record.stage_started_at = record.started_at or now
+            elif stage != record.progress.get("stage"):
+                record.progress = {}
+                record.stage_started_at = now
+            record.progress.update(event)
+            elapsed = now - record.stage_started_at
+            record.progress["elapsed_seconds"] = round(elapsed, 3)
+            done, total = record.progress.get("done"), record.progress.get("total")
+            if isinstance(done, (int, float)) and done > 0 and elapsed > 0:
+                rate = done / elapsed
+                record.progress["throughput"] = round(rate, 3)
+                if isinstance(total, (int, float)):
+                    record.progress["eta_seconds"] = round(max(total - done, 0) / rate, 1)
+            if now - record.persisted_at >= TASK_PROGRESS_PERSIST_INTERVAL:
+                self._persist(record)
+            else:
+                record.version += 1
+
+    def _run_task(self, record: TaskRecord) -> None:
+        _current.reporter = lambda event: self._report_progress(record, event)
         try:
             result = record.target()
             with self._lock:
@@ -54,23 +275,67 @@ class InMemoryTaskQueue:
                 record.error = f"{e}\n{tb}"
                 record.status = TaskStatus.FAILED
                 record.ended_at = time.time()
+        finally:
+            _current.reporter = None
+
+    def cancel(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """取消排队中的任务；运行中的任务仅标记 cancel_requested。任务不存在时返回 None。"""
+        with self._cond:
+            record = self._tasks.get(task_id)
+            if not record:
+                # 已结束（或属于其它进程）的任务无需取消
+                return self._store.get(task_id)
+            if record.status == TaskStatus.QUEUED:
+                record.status = TaskStatus.CANCELLED
+                record.ended_at = time.time()
+                if record.dedupe_key is not None:
+                    self._pending_keys.pop((record.task_type, record.dedupe_key), None)
+                self._finish(record)
+                return record.to_dict()
+            if record.status == TaskStatus.RUNNING:
+                record.cancel_requested = True
+                self._persist(record)
+            return record.to_dict()
 
     def get(self, task_id: str) -> Optional[Dict[str, Any]]:
         with self._lock:
             record = self._tasks.get(task_id)
-            if not record:
-                return None
+            if record:
+                return record.to_dict()
+        return self._store.get(task_id)
+
+    def list(self, status: Optional[str] = None, task_type: Optional[str] = None,
+             limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """分页列出任务（按创建时间倒序，不含 result）。"""
+        items, total = self._store.list_tasks(status=status, task_type=task_type, limit=limit, offset=offset)
+        return {"items": items, "total": total, "limit": limit, "offset": offset}
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、运行中任务数（按类型）与等待时间统计。"""
+        with self._lock:
+            now = time.time()
+            queued = [r for r in self._tasks.values() if r.status == TaskStatus.QUEUED]
+            recent = list(self._wait_times)
             return {
-                "task_id": record.id,
-                "status": record.status,
-                "result": record.result,
-                "error": record.error,
-                "created_at": record.created_at,
-                "started_at": record.started_at,
-                "ended_at": record.ended_at,
+                "workers": self._num_workers,
+                "type_limits": dict(self._type_limits),
+                "queue_depth": len(queued),
+                "queued_by_type": dict(Counter(r.task_type for r in queued)),
+                "running_by_type": {k: v for k, v in self._running_by_type.items() if v},
+                "oldest_queued_wait_seconds": round(max((now - r.created_at for r in queued), default=0.0), 3),
+                "recent_wait_seconds_avg": round(sum(recent) / len(recent), 3) if recent else 0.0,
+                "recent_wait_seconds_max": round(max(recent), 3) if recent else 0.0,
             }
 
 
-GLOBAL_TASK_QUEUE = InMemoryTaskQueue()
+def current_progress() -> Callable[[Dict[str, Any]], None]:
+    """
+    返回当前工作线程所执行任务的进度回调（非任务线程中返回空操作）。
+    需在任务函数开头调用并显式传给耗时函数：它们可能在其它线程中回调。
+    """
+    reporter = getattr(_current, "reporter", None)
+    return reporter or (lambda event: None)
 
 
+GLOBAL_TASK_QUEUE = InMemoryTaskQueue()
+
@@ -0,0 +1,383 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from .deps import PROJECT_ROOT
+from .table_catalog import TABLE_CATALOG
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 每个 excel_dir 下记录已上传文件内容哈希的清单
+MANIFEST_NAME = ".upload_manifest.json"
+
+# 断点续传：会话元数据目录；分片数据暂存在目标 excel_dir 下的隐藏目录（与最终文件同一文件系统，可原子替换）
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(PROJECT_ROOT, "apiserve", "data", "uploads"))
+UPLOAD_STAGING_NAME = ".uploads"
+# 建议分片大小与单片上限（MB）；未完成会话的保留时长（秒）
+UPLOAD_PART_SIZE_MB = int(os.getenv("UPLOAD_PART_SIZE_MB", "8"))
+UPLOAD_MAX_PART_MB = int(os.getenv("UPLOAD_MAX_PART_MB", "64"))
+UPLOAD_SESSION_TTL_SECONDS = float(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+
+
+class UploadOffsetMismatch(Exception):
+    """分片偏移超过服务端已收到的字节数；offset 为服务端当前偏移，客户端应从这里继续。"""
+
+    def __init__(self, offset: int) -> None:
+        super().__init__(f"expected offset <= {offset}")
+        self.offset = offset
+
+
+class UploadVerificationError(ValueError):
+    """complete 时某个会话未传完或整体哈希不符；upload_id 指出是哪一个。"""
+
+    def __init__(self, upload_id: str, message: str) -> None:
+        super().__init__(message)
+        self.upload_id = upload_id
+
+
+_manifest_lock = threading.Lock()
+
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _load_manifest(dest_root: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(os.path.join(dest_root, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(dest_root: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+    path = os.path.join(dest_root, MANIFEST_NAME)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _entry_is_current(dest_root: str, name: str, entry: Dict[str, Any]) -> bool:
+    try:
+        st = os.stat(os.path.join(dest_root, name))
+    except OSError:
+        return False
+    return st.st_size == entry.get("size") and st.st_mtime_ns == entry.get("mtime_ns")
+
+
+def _current_manifest(dest_root: str) -> Dict[str, Dict[str, Any]]:
+    """读取清单并丢弃已被删除或修改过的文件条目。"""
+    return {
+        name: entry for name, entry in _load_manifest(dest_root).items()
+        if _entry_is_current(dest_root, name, entry)
+    }
+
+
+def is_ingested(schema_dir: Optional[str], filename: str) -> bool:
+    """schema 目录中是否已有 original_filename 为 filename 的表（即该文件已成功导入过）。"""
+    if not schema_dir:
+        return True
+    metas = TABLE_CATALOG.snapshot(schema_dir).metas
+    return any(meta.get("original_filename") == filename for meta in metas.values())
+
+
+def find_duplicate(dest_root: str, sha256: str, schema_dir: Optional[str] = None) -> Optional[str]:
+    """
+    返回目录中内容哈希为 sha256、且已导入的已有文件名（仅查清单）；没有则返回 None。
+    传入 schema_dir 时，文件虽在但尚未导入（导入失败或任务被取消）不算重复。
+    """
+    with _manifest_lock:
+        manifest = _current_manifest(dest_root)
+    name = next((name for name, entry in manifest.items() if entry["sha256"] == sha256), None)
+    return name if name is not None and is_ingested(schema_dir, name) else None
+
+
+def _manifest_entry(path: str, sha256: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _commit_upload(dest_root: str, tmp_path: str, safe_name: str, sha256: str, size: int, force: bool,
+                   schema_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    在清单锁内判断内容是否已存在：
+    - 已有相同内容的文件（同名或不同名）且未 force：删除临时文件；该文件已导入（schema_dir 中有对应表）时
+      返回 duplicate_of，尚未导入时 duplicate_of 为 None、saved_path 指向已有文件，由调用方照常提交导入；
+    - 否则把临时文件原子替换为目标文件并更新清单。
+    清单里没有、但目标目录已有同名同大小文件（如历史数据）时，补算一次哈希再比较。
+    """
+    saved_path = os.path.join(dest_root, safe_name)
+    with _manifest_lock:
+        manifest = _current_manifest(dest_root)
+        if safe_name not in manifest and os.path.isfile(saved_path) and os.path.getsize(saved_path) == size:
+            manifest[safe_name] = _manifest_entry(saved_path, _file_sha256(saved_path))
+
+        existing = None
+        if not force:
+            existing = next((name for name, entry in manifest.items() if entry["sha256"] == sha256), None)
+        if existing is not None:
+            os.remove(tmp_path)
+            saved_path = os.path.join(dest_root, existing)
+        else:
+            os.replace(tmp_path, saved_path)
+            manifest[safe_name] = _manifest_entry(saved_path, sha256)
+        _save_manifest(dest_root, manifest)
+
+    duplicate_of = existing if existing is not None and is_ingested(schema_dir, existing) else None
+    return {
+        "file": safe_name,
+        "saved_path": saved_path,
+        "sha256": sha256,
+        "size": size,
+        "duplicate_of": duplicate_of,
+    }
+
+
+async def save_upload(file: UploadFile, dest_root: str, force: bool = False,
+                      schema_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    流式保存上传文件：分块读取，写盘放到线程池，边写边算 SHA-256；写入同目录临时文件后再原子替换，
+    上传中断不会留下半个文件。与目录中已有文件内容完全相同时不覆盖；该文件已导入时返回的 duplicate_of 为已有文件名。
+    """
+    safe_name = os.path.basename(file.filename)
+    tmp_path = os.path.join(dest_root, f".{safe_name}.{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    fout = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            size += len(chunk)
+            await run_in_threadpool(fout.write, chunk)
+    except BaseException:
+        await run_in_threadpool(fout.close)
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise
+    finally:
+        await file.close()
+    await run_in_threadpool(fout.close)
+    return await run_in_threadpool(_commit_upload, dest_root, tmp_path, safe_name, hasher.hexdigest(), size, force,
+                                   schema_dir)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# 断点续传：init → 按偏移 PUT 分片 → complete
+# ---------------------------------------------------------------------------
+
+_session_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _meta_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_SESSION_DIR, f"{upload_id}.json")
+
+
+def _part_path(meta: Dict[str, Any]) -> str:
+    return os.path.join(meta["dest_root"], UPLOAD_STAGING_NAME, f"{meta['upload_id']}.part")
+
+
+def _received(meta: Dict[str, Any]) -> int:
+    try:
+        return os.path.getsize(_part_path(meta))
+    except OSError:
+        return 0
+
+
+def load_session(upload_id: str) -> Dict[str, Any]:
+    """读取会话元数据；upload_id 非法或会话不存在时抛 FileNotFoundError。"""
+    if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+        raise FileNotFoundError(upload_id)
+    with open(_meta_path(upload_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def session_status(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "upload_id": meta["upload_id"],
+        "status": "uploading",
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "offset": _received(meta),
+        "part_size": UPLOAD_PART_SIZE_MB * 1024 * 1024,
+    }
+
+
+def _remove_session(meta: Dict[str, Any]) -> None:
+    _remove_quietly(_part_path(meta))
+    _remove_quietly(_meta_path(meta["upload_id"]))
+    _session_locks.pop(meta["upload_id"], None)
+
+
+def _expire_sessions() -> None:
+    """删除超过 TTL 未更新的会话及其分片。"""
+    if not os.path.isdir(UPLOAD_SESSION_DIR):
+        return
+    cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+    for name in os.listdir(UPLOAD_SESSION_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            meta = load_session(name[:-5])
+            part = _part_path(meta)
+            updated = os.path.getmtime(part) if os.path.exists(part) else meta.get("created_at", 0)
+        except (OSError, ValueError, KeyError):
+            continue
+        if updated < cutoff:
+            _remove_session(meta)
+
+
+def init_session(dest_root: str, filename: str, size: int, sha256: Optional[str] = None,
+                 force: bool = False, schema_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    创建或恢复上传会话。带 sha256 时会话 id 由 (目录, 文件名, 大小, 哈希) 决定，客户端重启后再次 init
+    会拿到同一会话与已收到的偏移；内容与目录中已导入的文件相同（且未 force）时直接返回 skipped，不需要上传任何字节。
+    """
+    safe_name = os.path.basename(filename)
+    if sha256 and not force:
+        duplicate_of = find_duplicate(dest_root, sha256, schema_dir=schema_dir)
+        if duplicate_of is not None:
+            return {
+                "upload_id": None,
+                "status": "skipped",
+                "filename": safe_name,
+                "duplicate_of": duplicate_of,
+                "saved_path": os.path.join(dest_root, duplicate_of),
+                "sha256": sha256,
+            }
+    _expire_sessions()
+    if sha256:
+        upload_id = hashlib.sha256(f"{dest_root}\0{safe_name}\0{size}\0{sha256}".encode("utf-8")).hexdigest()[:32]
+    else:
+        upload_id = uuid.uuid4().hex
+    try:
+        meta = load_session(upload_id)
+    except FileNotFoundError:
+        meta = {
+            "upload_id": upload_id,
+            "dest_root": dest_root,
+            "filename": safe_name,
+            "size": size,
+            "sha256": sha256,
+            "created_at": time.time(),
+        }
+        os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+        os.makedirs(os.path.join(dest_root, UPLOAD_STAGING_NAME), exist_ok=True)
+        with open(_meta_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        # 预先创建空分片文件（空文件无需 PUT 也能 complete）
+        open(_part_path(meta), "ab").close()
+    return session_status(meta)
+
+
+def _write_part(meta: Dict[str, Any], offset: int, data: bytes) -> int:
+    """把一个分片写到 offset 处（offset 小于已收字节数视为重传，先截断），返回新的偏移。"""
+    path = _part_path(meta)
+    mode = "r+b" if os.path.exists(path) else "wb"
+    with open(path, mode) as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+        return f.tell()
+
+
+async def write_part(upload_id: str, offset: int, chunks: AsyncIterator[bytes],
+                     part_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """
+    接收一个分片。分片先完整读入内存（受 UPLOAD_MAX_PART_MB 限制）并校验 part_sha256，
+    通过后才写盘，因此网络中断或校验失败的分片不会污染已收数据。
+
+    Raises:
+        FileNotFoundError: 会话不存在
+        UploadOffsetMismatch: offset 大于已收字节数
+        ValueError: 分片过大、超出文件大小或分片哈希不符
+    """
+    meta = await run_in_threadpool(load_session, upload_id)
+    lock = _session_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        # 等锁期间会话可能已被 complete/abort 删除
+        meta = await run_in_threadpool(load_session, upload_id)
+        received = await run_in_threadpool(_received, meta)
+        if offset < 0 or offset > received:
+            raise UploadOffsetMismatch(received)
+        max_part = UPLOAD_MAX_PART_MB * 1024 * 1024
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            if len(buffer) > max_part:
+                raise ValueError(f"part exceeds {UPLOAD_MAX_PART_MB} MB")
+        if offset + len(buffer) > meta["size"]:
+            raise ValueError("part exceeds declared file size")
+        if part_sha256 and hashlib.sha256(buffer).hexdigest() != part_sha256.lower():
+            raise ValueError("part sha256 mismatch")
+        new_offset = await run_in_threadpool(_write_part, meta, offset, bytes(buffer))
+    status = session_status(meta)
+    status["offset"] = new_offset
+    return status
+
+
+def abort_session(upload_id: str) -> None:
+    _remove_session(load_session(upload_id))
+
+
+def _verify_session(meta: Dict[str, Any]) -> str:
+    """校验大小与整体 SHA-256（init 时声明了哈希则必须一致），返回实际哈希；哈希不符时丢弃分片。"""
+    received = _received(meta)
+    if received != meta["size"]:
+        raise UploadVerificationError(meta["upload_id"], f"upload incomplete: {received}/{meta['size']} bytes")
+    sha256 = _file_sha256(_part_path(meta))
+    if meta.get("sha256") and sha256 != meta["sha256"].lower():
+        _remove_quietly(_part_path(meta))
+        raise UploadVerificationError(meta["upload_id"], "file sha256 mismatch, upload discarded")
+    return sha256
+
+
+def _commit_session(meta: Dict[str, Any], sha256: str, force: bool, schema_dir: Optional[str]) -> Dict[str, Any]:
+    saved = _commit_upload(meta["dest_root"], _part_path(meta), meta["filename"], sha256, meta["size"], force, schema_dir)
+    _remove_session(meta)
+    return saved
+
+
+async def complete_sessions(upload_ids: List[str], force: bool = False,
+                            schema_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    完成一批会话：持有全部会话锁（与 write_part 同一把，按 id 排序获取），先校验每个会话，
+    全部通过后才按与普通上传相同的规则去重并落盘，因此任一会话失败时不会有文件被部分提交。
+    返回与 save_upload 同格式的结果列表。校验失败的会话丢弃分片但保留，以便从头重传。
+
+    Raises:
+        FileNotFoundError: 会话不存在
+        UploadVerificationError: 某个会话尚未传完或哈希不符
+    """
+    upload_ids = list(dict.fromkeys(upload_ids))
+    async with contextlib.AsyncExitStack() as stack:
+        for upload_id in sorted(upload_ids):
+            await stack.enter_async_context(_session_locks.setdefault(upload_id, asyncio.Lock()))
+        metas = [await run_in_threadpool(load_session, upload_id) for upload_id in upload_ids]
+        hashes = [await run_in_threadpool(_verify_session, meta) for meta in metas]
+        return [
+            await run_in_threadpool(_commit_session, meta, sha256, force, schema_dir)
+            for meta, sha256 in zip(metas, hashes)
+        ]
@@ -0,0 +1,230 @@
+"""
+NL2SQL 服务的 ASGI 部署入口，接口与 interface.py（Flask）一致：
+- LLM 调用为异步 HTTP，等待模型期间不占用线程；schema 解析与 SQL 执行放到有界线程池；
+- 在途请求数超过 NL2SQL_MAX_IN_FLIGHT 时立即返回 503（批量请求按条目数计），由客户端退避重试；
+- 收到 SIGTERM/SIGINT 后不再接收新请求，等待在途请求完成（最长 NL2SQL_SHUTDOWN_TIMEOUT 秒）再退出；
+- 遵循 X-Deadline-Ms 请求头的剩余时间；客户端断线时取消处理协程，进行中的 LLM 请求随之中止。
+
+启动（项目根目录）：python -m offline_data_ingestion_and_query_interface.src.asgi_app --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from offline_data_ingestion_and_query_interface.src.handle_requests import close_async_client, get_llm_response_async
+from offline_data_ingestion_and_query_interface.src.log_service import logger
+from offline_data_ingestion_and_query_interface.src.prompt import NL2SQL_SYSTEM_PROMPT
+from offline_data_ingestion_and_query_interface.src.service import (
+    BATCH_CONCURRENCY,
+    DEADLINE_HEADER,
+    check_standalone_backend,
+    deadline_exceeded,
+    deadline_from_header,
+    finish_nl2sql,
+    parse_batch_items,
+    prepare_nl2sql,
+    resolve_batch_schemas,
+)
+
+
+# duckdb 后端由 apiserve 进程独占，每个 worker 导入本模块时都会拒绝启动
+check_standalone_backend()
+
+NL2SQL_HOST = os.getenv("NL2SQL_HOST", "0.0.0.0")
+NL2SQL_PORT = int(os.getenv("NL2SQL_PORT", "5000"))
+NL2SQL_WORKERS = int(os.getenv("NL2SQL_WORKERS", "4"))
+# 单个 worker 的最大在途请求数（背压阈值）
+MAX_IN_FLIGHT = int(os.getenv("NL2SQL_MAX_IN_FLIGHT", "256"))
+# schema 解析与 SQL 执行的线程数
+DB_THREADS = int(os.getenv("NL2SQL_DB_THREADS", "16"))
+SHUTDOWN_TIMEOUT = float(os.getenv("NL2SQL_SHUTDOWN_TIMEOUT", "30"))
+# 检查客户端是否断线的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class InFlightLimiter:
+    """单事件循环内使用的在途请求计数器，无需加锁。"""
+
+    def __init__(self, max_in_flight: int) -> None:
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self.draining = False
+
+    def try_acquire(self, weight: int = 1) -> bool:
+        if self.draining or self.in_flight + weight > self.max_in_flight:
+            self.rejected += 1
+            return False
+        self.in_flight += weight
+        return True
+
+    def release(self, weight: int = 1) -> None:
+        self.in_flight -= weight
+
+    async def drain(self, timeout: float) -> None:
+        self.draining = True
+        deadline = time.time() + timeout
+        while self.in_flight > 0 and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight > 0:
+            logger.warning(f"关闭时仍有 {self.in_flight} 个在途请求未完成")
+
+
+limiter = InFlightLimiter(MAX_IN_FLIGHT)
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="nl2sql-db")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(f"NL2SQL ASGI worker started: pid={os.getpid()}, max_in_flight={MAX_IN_FLIGHT}, db_threads={DB_THREADS}")
+    yield
+    await limiter.drain(SHUTDOWN_TIMEOUT)
+    await close_async_client()
+    _db_executor.shutdown(wait=True)
+    logger.info(f"NL2SQL ASGI worker stopped: pid={os.getpid()}")
+
+
+app = FastAPI(title="TableRAG NL2SQL", lifespan=lifespan)
+
+
+def _overloaded() -> JSONResponse:
+    return JSONResponse({'error': 'Server busy, retry later'}, status_code=503, headers={'Retry-After': '1'})
+
+
+async def _run_in_db_thread(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, func, *args)
+
+
+async def _run_until_disconnect(request: Request, coro):
+    """执行处理协程；客户端断线时取消它，不再为无人接收的响应继续调用 LLM。"""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            logger.info("Client disconnected, request cancelled")
+            return JSONResponse({'error': 'Client disconnected'}, status_code=499)
+
+
+async def process_tablerag_request_async(table_name_list, query, loaded_schemas=None, deadline=None):
+    """service.process_tablerag_request 的异步版本：LLM 调用 await，其余阶段在线程池执行。"""
+    if deadline_exceeded(deadline):
+        return {'error': 'Deadline exceeded', 'query': query}
+    context, error_dict = await _run_in_db_thread(prepare_nl2sql, table_name_list, query, loaded_schemas)
+    if context is None:
+        return error_dict
+    nl2sql_start_time = time.time()
+    resp_content = await get_llm_response_async(
+        system_prompt=NL2SQL_SYSTEM_PROMPT,
+        user_prompt=context['nl2sql_prompt'],
+        deadline=deadline
+    )
+    nl2sql_time_cusumed = time.time() - nl2sql_start_time
+    return await _run_in_db_thread(finish_nl2sql, context, resp_content, nl2sql_time_cusumed, deadline)
+
+
+@app.post('/get_tablerag_response')
+async def get_tablerag_response(request: Request):
+    try:
+        json_body = await request.json()
+    except Exception:
+        json_body = None
+    if not json_body or 'query' not in json_body or 'table_name_list' not in json_body:
+        return JSONResponse({'error': 'Invalid input'}, status_code=400)
+
+    if not limiter.try_acquire():
+        return _overloaded()
+    try:
+        deadline = deadline_from_header(request.headers.get(DEADLINE_HEADER))
+        return await _run_until_disconnect(
+            request, process_tablerag_request_async(json_body['table_name_list'], json_body['query'], deadline=deadline)
+        )
+    finally:
+        limiter.release()
+
+
+async def _process_batch_async(items, deadline=None):
+    """相同表名列表的条目共享 schema 解析，各条目的 LLM 调用按 BATCH_CONCURRENCY 并发。"""
+    batch_start_time = time.time()
+    resolved = await _run_in_db_thread(resolve_batch_schemas, items)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(item):
+        async with semaphore:
+            item_start_time = time.time()
+            try:
+                res_dict = await process_tablerag_request_async(
+                    item['table_name_list'], item['query'], resolved[tuple(item['table_name_list'])], deadline
+                )
+            except Exception as e:
+                logger.error(f"Batch item failed: query={item['query']}, error={e}")
+                res_dict = {'error': str(e), 'query': item['query']}
+            res_dict['elapsed_seconds'] = round(time.time() - item_start_time, 3)
+            return res_dict
+
+    results = await asyncio.gather(*(run_item(item) for item in items))
+    return {
+        'results': results,
+        'count': len(results),
+        'schema_groups': len(resolved),
+        'elapsed_seconds': round(time.time() - batch_start_time, 3)
+    }
+
+
+@app.post('/get_tablerag_response_batch')
+async def get_tablerag_response_batch(request: Request):
+    try:
+        json_body = await request.json()
+    except Exception:
+        json_body = None
+    items, error_message = parse_batch_items(json_body)
+    if items is None:
+        return JSONResponse({'error': error_message}, status_code=400)
+
+    if not limiter.try_acquire(len(items)):
+        return _overloaded()
+    try:
+        deadline = deadline_from_header(request.headers.get(DEADLINE_HEADER))
+        return await _run_until_disconnect(request, _process_batch_async(items, deadline))
+    finally:
+        limiter.release(len(items))
+
+
+@app.get('/health')
+async def health():
+    return {
+        'status': 'draining' if limiter.draining else 'ok',
+        'pid': os.getpid(),
+        'in_flight': limiter.in_flight,
+        'max_in_flight': limiter.max_in_flight,
+        'rejected': limiter.rejected
+    }
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the NL2SQL service with uvicorn workers.")
+    parser.add_argument('--host', default=NL2SQL_HOST)
+    parser.add_argument('--port', type=int, default=NL2SQL_PORT)
+    parser.add_argument('--workers', type=int, default=NL2SQL_WORKERS)
+    args = parser.parse_args()
+    uvicorn.run(
+        "offline_data_ingestion_and_query_interface.src.asgi_app:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=int(SHUTDOWN_TIMEOUT),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,25 @@ import os
 import sys
 import json
 import argparse
-from typing import List, Tuple, Dict, Set, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple, Dict, Set, Optional
 
 from offline_data_ingestion_and_query_interface.src.common_utils import SCHEMA_DIR, transfer_name, sql_alchemy_helper, PROJECT_ROOT
 from offline_data_ingestion_and_query_interface.src.log_service import logger
+from offline_data_ingestion_and_query_interface.src.snapshot_store import snapshot_path
+from offline_data_ingestion_and_query_interface.src.result_cache import invalidate_tables
+from offline_data_ingestion_and_query_interface.src.index_advisor import forget_tables
+
+# 并行读取 schema / 删除文件的线程数
+CLEANUP_IO_WORKERS = int(os.getenv("CLEANUP_IO_WORKERS", "8"))
 
 
 def normalize_excel_filename(name: str) -> str:
     """
-    Normalize input to an Excel filename.
+    Normalize input to an Excel/CSV filename.
     If no extension is provided, default to .xlsx
     """
-    if name.lower().endswith('.xlsx') or name.lower().endswith('.xls'):
+    if name.lower().endswith(('.xlsx', '.xls', '.csv')):
         return name
     return f"{name}.xlsx"
 
@@ -28,27 +35,66 @@ def get_base_table_name_from_excel(excel_filename: str) -> str:
     return transfer_name(original_name)
 
 
-def list_matching_schema_files(base_table_name: str) -> List[str]:
+def _matched_base(stem: str, base_names: Set[str]) -> Optional[str]:
     """
-    List schema JSON files that match the base table name.
-    A match is either exactly base_table_name.json or startswith base_table_name + '_'.
-    Returns absolute file paths.
+    Return the base name that a schema file stem belongs to (exactly base or base + '_' + suffix),
+    by checking each '_'-delimited prefix of the stem against the set. None if unrelated.
     """
-    if not os.path.isdir(SCHEMA_DIR):
-        return []
+    if stem in base_names:
+        return stem
+    pos = stem.find('_')
+    while pos != -1:
+        if stem[:pos] in base_names:
+            return stem[:pos]
+        pos = stem.find('_', pos + 1)
+    return None
+
+
+def _read_schema_header(path: str) -> Tuple[str, Optional[str], Optional[str], Optional[str]]:
+    """Return (path, table_name, original_filename, error)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        table_name = data.get('table_name')
+        if not table_name:
+            raise ValueError('Missing table_name in schema JSON')
+        return path, table_name, data.get('original_filename'), None
+    except Exception as e:
+        return path, None, None, str(e)
 
-    result = []
-    for filename in os.listdir(SCHEMA_DIR):
-        if not filename.endswith('.json'):
-            continue
-        if filename == f"{base_table_name}.json" or filename.startswith(f"{base_table_name}_"):
-            result.append(os.path.join(SCHEMA_DIR, filename))
-    return result
+
+def build_schema_index(base_table_names: Iterable[str]) -> Tuple[Dict[str, List[Tuple[str, str]]], List[str]]:
+    """
+    Index schema files by original_filename with a single scan of SCHEMA_DIR.
+    Only files whose name matches one of the base table names are read (in parallel).
+    Returns (original_filename -> [(schema_path, table_name), ...], failed_files).
+    """
+    bases = set(base_table_names)
+    if not bases or not os.path.isdir(SCHEMA_DIR):
+        return {}, []
+
+    candidates: List[str] = []
+    with os.scandir(SCHEMA_DIR) as it:
+        for entry in it:
+            if entry.name.endswith('.json') and _matched_base(entry.name[:-len('.json')], bases) is not None:
+                candidates.append(entry.path)
+    candidates.sort()
+
+    index: Dict[str, List[Tuple[str, str]]] = {}
+    failed: List[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(CLEANUP_IO_WORKERS, len(candidates) or 1))) as executor:
+        for path, table_name, original_filename, error in executor.map(_read_schema_header, candidates):
+            if error is not None:
+                logger.error(f"Failed to read schema file {path}: {error}")
+                failed.append(path)
+                continue
+            index.setdefault(original_filename, []).append((path, table_name))
+    return index, failed
 
 
 def list_matching_excel_files(original_targets: List[str]) -> List[str]:
     """
-    Find Excel files in dataset/dev_excel matching the provided original filenames.
+    Find Excel/CSV files in dataset/dev_excel matching the provided original filenames.
     Returns absolute file paths.
     """
     excel_dir = os.path.join(PROJECT_ROOT, 'dataset', 'dev_excel')
@@ -61,7 +107,7 @@ def list_matching_excel_files(original_targets: List[str]) -> List[str]:
     candidates = set(normalized)
     results: List[str] = []
     for fname in os.listdir(excel_dir):
-        if not (fname.lower().endswith('.xlsx') or fname.lower().endswith('.xls')):
+        if not fname.lower().endswith(('.xlsx', '.xls', '.csv')):
             continue
         if fname in candidates:
             results.append(os.path.join(excel_dir, fname))
@@ -69,52 +115,12 @@ def list_matching_excel_files(original_targets: List[str]) -> List[str]:
     return results
 
 
-def resolve_table_names_from_schema_files(
-    schema_files: List[str],
-    allowed_original_filenames: Optional[Set[str]] = None,
-) -> Tuple[Set[str], Dict[str, str], List[str], List[str]]:
-    """
-    Read each schema JSON and extract table_name.
-    If allowed_original_filenames is provided, only keep schema whose
-    original_filename is in the allowed set.
-    Returns (table_names_set, file_to_table_name_map, failed_files, filtered_schema_files)
-    """
-    table_names: Set[str] = set()
-    mapping: Dict[str, str] = {}
-    failed: List[str] = []
-    filtered_schema_files: List[str] = []
-
-    for path in schema_files:
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            table_name = data.get('table_name')
-            original_filename = data.get('original_filename')
-            if not table_name:
-                raise ValueError('Missing table_name in schema JSON')
-            if allowed_original_filenames is not None and original_filename not in allowed_original_filenames:
-                # Skip schemas that do not belong to requested Excel filenames
-                continue
-            mapping[path] = table_name
-            table_names.add(table_name)
-            filtered_schema_files.append(path)
-        except Exception as e:
-            logger.error(f"Failed to read schema file {path}: {e}")
-            failed.append(path)
-
-    return table_names, mapping, failed, filtered_schema_files
-
-
-def drop_tables(table_names: Set[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
-    """
-    Drop each table if exists. Returns (dropped, errors)
-    errors contains tuples of (table_name, error_message)
-    """
+def _drop_tables_one_by_one(names: List[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
     dropped: List[str] = []
     errors: List[Tuple[str, str]] = []
-    for name in sorted(table_names):
+    for name in names:
         try:
-            sql_alchemy_helper.execute_sql(f"DROP TABLE IF EXISTS `{name}`")
+            sql_alchemy_helper.drop_table(name)
             logger.info(f"Dropped table: {name}")
             dropped.append(name)
         except Exception as e:
@@ -123,24 +129,52 @@ def drop_tables(table_names: Set[str]) -> Tuple[List[str], List[Tuple[str, str]]
     return dropped, errors
 
 
+def drop_tables(table_names: Set[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Drop all tables in one batched statement/transaction (see drop_tables on the SQL helper).
+    If the batch fails, fall back to dropping one by one so errors are reported per table.
+    Returns (dropped, errors); errors contains tuples of (table_name, error_message)
+    """
+    names = sorted(table_names)
+    if not names:
+        return [], []
+    try:
+        sql_alchemy_helper.drop_tables(names)
+    except Exception as e:
+        logger.error(f"Batch drop of {len(names)} tables failed, retrying one by one: {e}")
+        return _drop_tables_one_by_one(names)
+    logger.info(f"Dropped {len(names)} tables: {', '.join(names)}")
+    return names, []
+
+
+def _remove_one(path: str) -> Tuple[str, bool, Optional[str]]:
+    try:
+        os.remove(path)
+        logger.info(f"Removed file: {path}")
+        return path, True, None
+    except FileNotFoundError:
+        logger.info(f"File already absent: {path}")
+        return path, False, None
+    except Exception as e:
+        logger.error(f"Failed to remove file {path}: {e}")
+        return path, False, str(e)
+
+
 def remove_files(file_paths: List[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
     """
-    Delete files. Returns (removed, errors)
+    Delete files in parallel (CLEANUP_IO_WORKERS threads). Returns (removed, errors)
     errors contains tuples of (path, error_message)
     """
     removed: List[str] = []
     errors: List[Tuple[str, str]] = []
-    for path in file_paths:
-        try:
-            if os.path.exists(path):
-                os.remove(path)
-                logger.info(f"Removed schema file: {path}")
+    if not file_paths:
+        return removed, errors
+    with ThreadPoolExecutor(max_workers=max(1, min(CLEANUP_IO_WORKERS, len(file_paths)))) as executor:
+        for path, ok, error in executor.map(_remove_one, file_paths):
+            if ok:
                 removed.append(path)
-            else:
-                logger.info(f"Schema file already absent: {path}")
-        except Exception as e:
-            logger.error(f"Failed to remove file {path}: {e}")
-            errors.append((path, str(e)))
+            elif error is not None:
+                errors.append((path, error))
     return removed, errors
 
 
@@ -187,28 +221,23 @@ def run_cleanup(targets: List[str], assume_yes: bool, dry_run: bool) -> int:
     normalized = [normalize_excel_filename(t) for t in targets]
     base_names = [get_base_table_name_from_excel(t) for t in normalized]
 
-    # gather all matching schema files (by base prefix)
-    all_schema_files: List[str] = []
-    for base in base_names:
-        matches = list_matching_schema_files(base)
-        all_schema_files.extend(matches)
+    # one scan of SCHEMA_DIR for all targets, indexed by original_filename
+    schema_index, failed_files = build_schema_index(base_names)
 
     # find matching excel files
     excel_files = list_matching_excel_files(normalized)
 
-    # de-duplicate while preserving order
-    seen = set()
-    dedup_schema_files: List[str] = []
-    for p in all_schema_files:
-        if p not in seen:
-            dedup_schema_files.append(p)
-            seen.add(p)
-
     # Only keep schemas whose original_filename exactly matches requested targets
-    allowed_originals: Set[str] = set(normalized)
-    table_names, file_to_table, failed_files, filtered_schema_files = resolve_table_names_from_schema_files(
-        dedup_schema_files, allowed_original_filenames=allowed_originals
-    )
+    table_names: Set[str] = set()
+    file_to_table: Dict[str, str] = {}
+    filtered_schema_files: List[str] = []
+    for original in dict.fromkeys(normalized):
+        for path, table_name in schema_index.get(original, []):
+            if path in file_to_table:
+                continue
+            file_to_table[path] = table_name
+            table_names.add(table_name)
+            filtered_schema_files.append(path)
 
     present_plan(normalized, base_names, filtered_schema_files, file_to_table, excel_files)
 
@@ -221,13 +250,21 @@ def run_cleanup(targets: List[str], assume_yes: bool, dry_run: bool) -> int:
         return 1
 
     dropped, drop_errors = drop_tables(table_names)
+    invalidate_tables(dropped)
+    forget_tables(dropped)
     removed, remove_errors = remove_files(filtered_schema_files)
     removed_excels, remove_excel_errors = remove_files(excel_files)
+    # 同步删除列式快照
+    removed_snapshots, remove_snapshot_errors = remove_files(
+        [snapshot_path(t) for t in sorted(table_names) if os.path.exists(snapshot_path(t))]
+    )
+    remove_errors = remove_errors + remove_snapshot_errors
 
     print("=== Summary ===")
     print(f"Tables dropped: {len(dropped)}")
     print(f"Schema files removed: {len(removed)}")
     print(f"Excel files removed: {len(removed_excels)}")
+    print(f"Snapshot files removed: {len(removed_snapshots)}")
     if failed_files:
         print(f"Schema files failed to read: {len(failed_files)}")
     if drop_errors:
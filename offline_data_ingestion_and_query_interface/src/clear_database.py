@@ -17,26 +17,13 @@ def clear_all_tables():
     
     try:
         # 获取所有表名
-        result = sql_alchemy_helper.fetchall('SHOW TABLES')
-        print(f"找到 {len(result)} 个表")
+        table_names = sql_alchemy_helper.list_tables()
+        print(f"找到 {len(table_names)} 个表")
         
-        if not result:
+        if not table_names:
             print("数据库中没有表，无需清空")
             return
         
-        # 解析JSON字符串结果
-        if isinstance(result, str):
-            result_data = json.loads(result)
-        else:
-            result_data = result
-        
-        # 提取表名
-        table_names = []
-        for row in result_data:
-            # 表名在 'Tables_in_tablerag' 键中
-            table_name = list(row.values())[0]
-            table_names.append(table_name)
-        
         print("准备清空的表:")
         for i, table_name in enumerate(table_names, 1):
             print(f"  {i}. {table_name}")
@@ -53,7 +40,7 @@ def clear_all_tables():
         for i, table_name in enumerate(table_names, 1):
             try:
                 print(f"正在删除表 {i}/{len(table_names)}: {table_name}")
-                sql_alchemy_helper.execute_sql(f'DROP TABLE IF EXISTS `{table_name}`')
+                sql_alchemy_helper.drop_table(table_name)
                 print(f"  ✓ 表 {table_name} 已删除")
             except Exception as e:
                 print(f"  ✗ 删除表 {table_name} 失败: {e}")
@@ -61,7 +48,7 @@ def clear_all_tables():
         print(f"\n清空完成！共处理了 {len(table_names)} 个表")
         
         # 验证清空结果
-        remaining_tables = sql_alchemy_helper.fetchall('SHOW TABLES')
+        remaining_tables = sql_alchemy_helper.list_tables()
         if not remaining_tables:
             print("✓ 数据库已完全清空")
         else:
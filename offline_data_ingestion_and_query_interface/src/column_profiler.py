@@ -0,0 +1,218 @@
+"""
+列统计画像：一次向量化扫描得到空值率、基数、最值、高频值与字符串长度。
+- 每批只做一次 factorize，计数、最值、字符串长度都在唯一值与计数数组上向量化完成；
+- 基数：单批直接取唯一值个数；多批时对各批唯一值做 64 位哈希，小列保留精确哈希集合，超过阈值后改用 HyperLogLog 估算；
+- 高频值：只把计数最高的若干唯一值转成字符串，避免对全部唯一值做 str()；
+- 支持跨批次合并，流式导入逐块调用 update() 即可。
+"""
+import os
+import random
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# 精确基数集合的上限，超过后改用 HLL 估算
+EXACT_DISTINCT_LIMIT = int(os.getenv("PROFILE_EXACT_DISTINCT_LIMIT", "100000"))
+# schema 中记录的高频值个数
+TOP_K = int(os.getenv("PROFILE_TOP_K", "5"))
+# HLL 精度：2^14 个寄存器，标准误差约 0.8%
+HLL_PRECISION = 14
+# 跨批次合并时保留的高频候选数（Space-Saving 风格截断）
+_TOPK_CAPACITY = 64
+# 样例值候选上限，样例值只取短字符串
+_MAX_SAMPLE_CANDIDATES = 64
+_MAX_SAMPLE_LENGTH = 64
+
+_UINT64_SHIFTS = [np.uint64(s) for s in (32, 16, 8, 4, 2, 1)]
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """uint64 数组逐元素的 bit_length，二分移位实现，避免浮点 log2 的精度问题。"""
+    x = values.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in _UINT64_SHIFTS:
+        mask = x >= (np.uint64(1) << shift)
+        n[mask] += int(shift)
+        x = np.where(mask, x >> shift, x)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    """向量化更新的 HyperLogLog 基数估算器。"""
+
+    def __init__(self, precision: int = HLL_PRECISION) -> None:
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if hashes.size == 0:
+            return
+        hashes = hashes.astype(np.uint64, copy=False)
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes << np.uint64(self.p)
+        # rank = 前导零个数 + 1，rest 为 0 时取最大值
+        rank = np.where(rest == 0, 64 - self.p + 1, 64 - _bit_length(rest) + 1)
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 小基数区间用线性计数修正
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+def _hash_values(values: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _to_json_scalar(value):
+    if isinstance(value, (pd.Timestamp,)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class ColumnProfile:
+    """单列统计，可跨批次累积。"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self._batches = 0
+        # 只有一个批次时直接用 factorize 的唯一值个数，不必哈希；出现第二批时再转入哈希集合/HLL
+        self._first_uniques = None
+        self._exact: Optional[set] = set()
+        self._hll = HyperLogLog()
+        self._top: Counter = Counter()
+        self._len_min: Optional[int] = None
+        self._len_max: Optional[int] = None
+        self._len_sum = 0
+        self._len_count = 0
+        self._samples: set = set()
+
+    def _add_uniques(self, uniques) -> None:
+        hashes = _hash_values(pd.Series(uniques))
+        self._hll.add_hashes(hashes)
+        if self._exact is not None:
+            self._exact.update(hashes.tolist())
+            if len(self._exact) > EXACT_DISTINCT_LIMIT:
+                self._exact = None
+
+    def update(self, series: pd.Series) -> None:
+        # factorize 一次得到唯一值与每行编码，后续统计都在唯一值与计数数组上完成
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.count += len(codes)
+        valid = codes[codes >= 0]
+        self.nulls += len(codes) - len(valid)
+        if len(uniques) == 0:
+            return
+        counts = np.bincount(valid, minlength=len(uniques))
+
+        self._batches += 1
+        if self._batches == 1:
+            self._first_uniques = uniques
+        else:
+            if self._first_uniques is not None:
+                self._add_uniques(self._first_uniques)
+                self._first_uniques = None
+            self._add_uniques(uniques)
+
+        if pd.api.types.is_numeric_dtype(uniques) or pd.api.types.is_datetime64_any_dtype(uniques):
+            lo, hi = uniques.min(), uniques.max()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        else:
+            # 长度只对唯一值计算，再按出现次数加权
+            lengths = pd.Series(uniques).astype(str).str.len().to_numpy()
+            lo, hi = int(lengths.min()), int(lengths.max())
+            self._len_min = lo if self._len_min is None else min(self._len_min, lo)
+            self._len_max = hi if self._len_max is None else max(self._len_max, hi)
+            self._len_sum += int((lengths * counts).sum())
+            self._len_count += int(counts.sum())
+
+        # 高频值：只把计数最高的若干唯一值转成字符串
+        if len(counts) > _TOPK_CAPACITY:
+            top_idx = np.argpartition(-counts, _TOPK_CAPACITY)[:_TOPK_CAPACITY]
+        else:
+            top_idx = np.arange(len(counts))
+        top_idx = top_idx[np.argsort(-counts[top_idx], kind='stable')]
+        for i in top_idx:
+            self._top[str(_to_json_scalar(uniques[i]))] += int(counts[i])
+        if len(self._top) > _TOPK_CAPACITY:
+            self._top = Counter(dict(self._top.most_common(_TOPK_CAPACITY)))
+
+        if len(self._samples) < _MAX_SAMPLE_CANDIDATES:
+            for text in self._top:
+                if len(text) < _MAX_SAMPLE_LENGTH:
+                    self._samples.add(text)
+                if len(self._samples) >= _MAX_SAMPLE_CANDIDATES:
+                    break
+
+    @property
+    def distinct(self) -> int:
+        if self._first_uniques is not None:
+            return len(self._first_uniques)
+        if self._exact is not None:
+            return len(self._exact)
+        return self._hll.estimate()
+
+    def sample_values(self, k: int = 3) -> List[str]:
+        candidates = sorted(self._samples)
+        return random.sample(candidates, min(k, len(candidates)))
+
+    def to_dict(self) -> dict:
+        stats = {
+            'null_ratio': round(self.nulls / self.count, 4) if self.count else 0.0,
+            'distinct': self.distinct,
+            'distinct_estimated': self._first_uniques is None and self._exact is None,
+        }
+        if self.min is not None:
+            stats['min'] = _to_json_scalar(self.min)
+            stats['max'] = _to_json_scalar(self.max)
+        if self._len_count:
+            stats['length'] = {
+                'min': self._len_min,
+                'max': self._len_max,
+                'mean': round(self._len_sum / self._len_count, 2),
+            }
+        # 全部唯一的列（如主键）高频值没有信息量，不记录
+        stats['top_values'] = [[value, c] for value, c in self._top.most_common(TOP_K) if c > 1]
+        return stats
+
+
+class TableProfiler:
+    """整表统计：按列持有 ColumnProfile，支持逐批 update()。"""
+
+    def __init__(self, columns: List[str]) -> None:
+        self.columns = list(columns)
+        self.profiles: Dict[str, ColumnProfile] = {col: ColumnProfile(col) for col in self.columns}
+        self.row_count = 0
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.row_count += len(df)
+        for col in self.columns:
+            self.profiles[col].update(df[col])
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {col: profile.to_dict() for col, profile in self.profiles.items()}
+
+
+def profile_dataframe(df: pd.DataFrame) -> TableProfiler:
+    """对已在内存中的整表做一次画像。"""
+    profiler = TableProfiler(list(df.columns))
+    profiler.update(df)
+    return profiler
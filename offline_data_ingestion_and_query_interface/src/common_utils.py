@@ -3,9 +3,9 @@ import json
 import hashlib
 import os
 try:
-    from .sql_alchemy_helper import SQL_Alchemy_Helper
+    from .sql_alchemy_helper import create_sql_helper
 except ImportError:
-    from sql_alchemy_helper import SQL_Alchemy_Helper
+    from sql_alchemy_helper import create_sql_helper
 
 # 获取项目根目录路径
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -14,7 +14,8 @@ SCHEMA_DIR = os.path.join(PROJECT_ROOT, 'data', 'schema')
 DATABASE_CONFIG_DIR = os.path.join(PROJECT_ROOT, 'config', 'database_config.json')
 
 database_config = json.load(open(DATABASE_CONFIG_DIR, 'r', encoding='utf-8'))
-sql_alchemy_helper = SQL_Alchemy_Helper(database_config)
+# 执行后端：mysql（默认）/ sqlite / duckdb，见 database_config.json 的 backend 字段或环境变量 SQL_BACKEND
+sql_alchemy_helper = create_sql_helper(database_config, data_dir=os.path.join(PROJECT_ROOT, 'data'))
 
 
 def transfer_name(original_name, file_content_hash=None):
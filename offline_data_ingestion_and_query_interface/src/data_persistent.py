@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pandas as pd
 import json
 import random as randum
@@ -23,8 +24,26 @@ try:
 except ImportError:
     from offline_data_ingestion_and_query_interface.src.common_utils import transfer_name, SCHEMA_DIR, sql_alchemy_helper, PROJECT_ROOT
 import hashlib
+import threading
+import time
 from .log_service import logger
+from .streaming_reader import (
+    iter_xlsx_row_batches,
+    iter_csv_row_batches,
+    list_nonempty_xlsx_sheets,
+    detect_csv_encoding,
+    IncrementalTypeInferer
+)
+from .index_advisor import create_indexes_for_table, forget_tables
+from .column_profiler import TableProfiler, profile_dataframe
+from .result_cache import invalidate_tables
+from .snapshot_store import SnapshotWriter, snapshots_available, snapshot_file_name, snapshot_path, write_snapshot
+from .cleanup import build_schema_index, drop_tables, remove_files
+import datetime
 import io
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator
 
 # Optional: detect xlrd availability and version for better diagnostics
 try:
@@ -40,6 +59,15 @@ try:
 except Exception:
     msoffcrypto = None  # type: ignore
 
+# 超过该大小（MB）的 .xlsx 改用 openpyxl 只读模式流式读取，避免整本工作簿载入内存
+STREAMING_THRESHOLD_MB = float(os.getenv("EXCEL_STREAMING_THRESHOLD_MB", "64"))
+# 流式读取时每批行数，同时也是分块写库的粒度
+STREAMING_BATCH_ROWS = int(os.getenv("EXCEL_STREAMING_BATCH_ROWS", "5000"))
+# 同一工作簿内并行处理的工作表数
+SHEET_WORKERS = int(os.getenv("INGEST_SHEET_WORKERS", "4"))
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
 
 def _is_zip_xlsx(path: str) -> bool:
     """粗略判断文件是否为 ZIP 结构（xlsx 常见），用于误后缀 .xls 但实际是 .xlsx 的情况。"""
@@ -74,16 +102,21 @@ def _try_decrypt_excel_if_needed(path: str) -> io.BytesIO | None:
 
 
 def infer_and_convert(series):
+    # 已是日期列时保持不变，否则 to_numeric 会把它转成纳秒整数（与流式路径的推断一致）
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
     # 尝试转换为整数
+    # pyarrow 解析 CSV 时日期列为 datetime.date 对象，to_numeric 会抛 TypeError
     try:
         return pd.to_numeric(series, downcast='integer')
-    except ValueError:
+    except (ValueError, TypeError):
         pass
 
     # 尝试转换为浮点数
     try:
         return pd.to_numeric(series, downcast='float')
-    except ValueError:
+    except (ValueError, TypeError):
         pass
 
     # 尝试转换为日期时间
@@ -91,7 +124,7 @@ def infer_and_convert(series):
         with warnings.catch_warnings():
             warnings.simplefilter("ignore", UserWarning)  # 忽略特定类型的警告
             return pd.to_datetime(series)
-    except ValueError:
+    except (ValueError, TypeError):
         pass
 
     # 如果都不行，返回原始数据
@@ -130,7 +163,8 @@ def get_sample_values(series):
     sample_values = randum.sample(valid_values, min(3, len(valid_values)))
     return sample_values if sample_values else ['no sample values available']
 
-def get_schema_and_data(df):
+def get_schema_and_data(df, profiler: TableProfiler = None):
+    """生成 [列名, MySQL 类型, 样例值] 三元组；传入 profiler 时样例值取自其高频值，省去对整列 unique()。"""
     column_list = []
     for col in df.columns:
         cur_column_list = []
@@ -139,30 +173,65 @@ def get_schema_and_data(df):
             raise ValueError(f"Column {col} is a DataFrame, which is not supported.")   
         cur_column_list.append(col)
         cur_column_list.append(pandas_to_mysql_dtype(df[col].dtype))
-        cur_column_list.append('sample values:' + str(get_sample_values(df[col])))
+        if profiler is not None:
+            samples = profiler.profiles[col].sample_values() or ['no sample values available']
+        else:
+            samples = get_sample_values(df[col])
+        cur_column_list.append('sample values:' + str(samples))
 
         # 形成三元组
         column_list.append(cur_column_list)
 
     return column_list
 
-def generate_schema_info(df: pd.DataFrame, file_name: str, file_content_hash: str = None):
+def generate_schema_info(df: pd.DataFrame, file_name: str, file_content_hash: str = None,
+                         table_name: str = None, sheet_name: str = None):
     try:
-        column_list = get_schema_and_data(df)
+        if df.columns.duplicated().any():
+            raise ValueError("duplicated columns")
+        profiler = profile_dataframe(df)
+        column_list = get_schema_and_data(df, profiler)
     except:
         print(f"{file_name} 列存在问题")
         raise ValueError(f"Error processing file: {file_name}")
 
-    table_name = transfer_name(file_name, file_content_hash)
+    if table_name is None:
+        table_name = transfer_name(file_name, file_content_hash)
 
+    schema_dict = _build_schema_dict(table_name, column_list, file_name, file_content_hash, sheet_name,
+                                     column_stats=profiler.to_dict())
+    return schema_dict, table_name
+
+
+def _build_schema_dict(table_name: str, column_list: list, file_name: str, file_content_hash: str,
+                       sheet_name: str = None, column_stats: dict = None) -> dict:
     schema_dict = {
         'table_name': table_name,
         'column_list': column_list,
         'original_filename': file_name,
         'source_file_hash': file_content_hash
     }
+    # 工作簿来源记录工作表名，CSV 无此字段
+    if sheet_name is not None:
+        schema_dict['sheet_name'] = sheet_name
+    # 列统计：空值率、基数、最值、高频值、字符串长度，供 NL2SQL 提示与索引/缓存层使用
+    if column_stats is not None:
+        schema_dict['column_stats'] = column_stats
+    return schema_dict
 
-    return schema_dict, table_name
+
+def _sheet_table_name(file_name: str, file_content_hash: str, sheet_name: str = None,
+                      sheet_index: int = 0, multi_sheet: bool = False) -> str:
+    """
+    单工作表（或 CSV）沿用原有表名 transfer_name(file_name, hash)；
+    多工作表时追加工作表后缀，无法转成 ASCII 的工作表名用 sheet{序号} 代替，总长不超过 64。
+    """
+    base = transfer_name(file_name, file_content_hash)
+    if not multi_sheet:
+        return base
+    slug = re.sub(r'[^a-zA-Z0-9]+', '_', str(sheet_name or '')).strip('_').lower()
+    suffix = f"_{(slug or f'sheet{sheet_index + 1}')[:20]}"
+    return f"{base[:64 - len(suffix)]}{suffix}"
 
 
 def transfer_df_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -205,17 +274,353 @@ def transfer_df_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def _read_excel_with_fallbacks(full_path: str, file_name: str) -> pd.DataFrame:
+def _write_schema_file(schema_dict: dict, table_name: str) -> str:
+    """写入 schema JSON 并校验文件存在且非空，返回绝对路径。"""
+    schema_path = f"{SCHEMA_DIR}/{table_name}.json"
+    try:
+        with open(schema_path, 'w', encoding='utf-8') as f:
+            json.dump(schema_dict, f, ensure_ascii=False)
+        # 写入后校验文件是否存在且非空
+        exists = os.path.exists(schema_path)
+        size = os.path.getsize(schema_path) if exists else 0
+        if not exists or size == 0:
+            raise IOError(f"schema 文件校验失败: exists={exists}, size={size}")
+        logger.info(f"Schema 已写入: {schema_path}, size={size} bytes")
+        return os.path.abspath(schema_path)
+    except Exception as write_err:
+        raise RuntimeError(f"写入 schema 失败: path={schema_path}, error={write_err}")
+
+
+def _cell_text(value) -> str:
+    """内容哈希用的单元格规范文本：与读取方式推断出的 dtype 无关（1 与 1.0、datetime 与 Timestamp 结果相同）。"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return ''
+    if isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return ''
+        if float(value).is_integer():
+            return str(int(value))
+        return repr(float(value))
+    if isinstance(value, np.integer):
+        return str(value.item())
+    if isinstance(value, (datetime.datetime, datetime.date, np.datetime64)):
+        ts = pd.Timestamp(value)
+        return ts.date().isoformat() if ts == ts.normalize() else ts.isoformat()
+    return str(value)
+
+
+def _column_texts(series: pd.Series) -> pd.Series:
+    """整列向量化地转成 _cell_text 定义的规范文本；混合类型的对象列才逐个单元格回退到 _cell_text。"""
+    if pd.api.types.is_object_dtype(series):
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred in ('string', 'empty'):
+            return series.where(series.notna(), '').astype(str)
+        try:
+            if inferred in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+                series = pd.to_numeric(series)
+            elif inferred in ('datetime', 'datetime64', 'date'):
+                series = pd.to_datetime(series)
+        except (ValueError, TypeError, OverflowError):
+            pass
+        if pd.api.types.is_object_dtype(series):
+            return series.map(_cell_text)
+    if pd.api.types.is_bool_dtype(series):
+        series = series.astype('boolean').astype('Int8')
+    if pd.api.types.is_integer_dtype(series):
+        missing = series.isna().to_numpy()
+        texts = series.fillna(0).astype(str).to_numpy(dtype=object)
+        texts[missing] = ''
+        return pd.Series(texts, index=series.index)
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        integral = np.isfinite(values) & (values == np.floor(values))
+        small = integral & (np.abs(values) < 2 ** 63)
+        texts = values.astype(str).astype(object)
+        texts[small] = values[small].astype('int64').astype(str)
+        texts[integral & ~small] = [str(int(v)) for v in values[integral & ~small]]
+        texts[np.isnan(values)] = ''
+        return pd.Series(texts, index=series.index)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, 'tz', None) is not None:
+            return series.map(_cell_text)
+        values = series.to_numpy(dtype='datetime64[ns]')
+        present = ~np.isnat(values)
+        midnight = present & (values == values.astype('datetime64[D]'))
+        whole = present & ~midnight & (values == values.astype('datetime64[s]'))
+        fraction = present & ~midnight & ~whole
+        texts = np.full(len(values), '', dtype=object)
+        texts[midnight] = values[midnight].astype('datetime64[D]').astype(str)
+        texts[whole] = values[whole].astype('datetime64[s]').astype(str)
+        texts[fraction] = [pd.Timestamp(v).isoformat() for v in values[fraction]]
+        return pd.Series(texts, index=series.index)
+    return series.map(_cell_text)
+
+
+def _update_content_hash(hasher, df: pd.DataFrame) -> None:
+    """
+    把一批数据行按规范文本累加进哈希（不含表头，跳过全空行）。流式与整表两条路径都用它，
+    同一工作表无论按批还是整表读取、分多少批，得到的 source_file_hash 与表名都相同。
+    按列向量化转换后再按行拼接，结果与逐单元格调用 _cell_text 相同。
+    """
+    if df.empty or len(df.columns) == 0:
+        return
+    columns = [_column_texts(df.iloc[:, i]).to_numpy(dtype=object) for i in range(len(df.columns))]
+    lines = columns[0]
+    nonblank = lines != ''
+    for texts in columns[1:]:
+        lines = lines + '\x1f' + texts
+        nonblank |= texts != ''
+    lines = lines[nonblank]
+    if len(lines):
+        hasher.update(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def _should_stream(file_name: str, file_size: int) -> bool:
+    """.xlsx 走 openpyxl 只读流式读取，.csv 走分块 read_csv；.xls 仍整本读取。"""
+    if not file_name.lower().endswith(('.xlsx', '.csv')):
+        return False
+    return file_size >= STREAMING_THRESHOLD_MB * 1024 * 1024
+
+
+def _ingest_streaming(make_batches: Callable[[], Iterator[pd.DataFrame]], file_name: str,
+                      sheet_name: str = None, sheet_index: int = 0, multi_sheet: bool = False,
+                      on_rows: Callable[[int], None] = None) -> tuple[str, str, int]:
+    """
+    大文件流式导入，峰值内存与批大小相关而与工作表大小无关：
+    1) 第一遍逐批增量推断列类型、累计内容哈希与样例值；
+    2) 写入 schema；
+    3) 第二遍按最终类型逐批转换并分块写库（首块 replace，后续 append），同时累积列统计、写 Parquet 快照，结束后补写进 schema。
+    DuckDB 后端不重复写库，直接把表定义为快照上的视图。
+
+    make_batches 每次调用返回一个新的批次迭代器，供两遍读取使用；on_rows 在每块写入后以该块行数回调。
+    返回 (schema 路径, table_name, 行数)。
+    """
+    inferer = None
+    hasher = hashlib.md5()
+    for batch in make_batches():
+        if inferer is None:
+            inferer = IncrementalTypeInferer(list(batch.columns))
+        inferer.update(batch)
+        _update_content_hash(hasher, batch)
+    if inferer is None:
+        raise ValueError(f"工作表为空: {file_name}")
+    file_content_hash = hasher.hexdigest()
+    logger.info(f"流式类型推断完成: {file_name}, sheet={sheet_name}, rows={inferer.row_count}, kinds={inferer.kinds}")
+
+    # 列名清洗与非流式路径保持一致
+    cleaned_columns = list(transfer_df_columns(pd.DataFrame(columns=inferer.columns)).columns)
+    final_dtypes = inferer.convert(pd.DataFrame(columns=inferer.columns)).dtypes
+    column_list = []
+    for raw_col, col in zip(inferer.columns, cleaned_columns):
+        dtype = final_dtypes[raw_col]
+        candidates = inferer.sample_values(raw_col)
+        samples = randum.sample(candidates, min(3, len(candidates))) or ['no sample values available']
+        column_list.append([col, pandas_to_mysql_dtype(dtype), 'sample values:' + str(samples)])
+
+    table_name = _sheet_table_name(file_name, file_content_hash, sheet_name, sheet_index, multi_sheet)
+    schema_dict = _build_schema_dict(table_name, column_list, file_name, file_content_hash, sheet_name)
+    schema_path = _write_schema_file(schema_dict, table_name)
+
+    inserted = 0
+    first = True
+    profiler = TableProfiler(cleaned_columns)
+    writer = SnapshotWriter(table_name, inferer.columns) if snapshots_available() else None
+    attach = writer is not None and sql_alchemy_helper.dialect == 'duckdb'
+    for batch in make_batches():
+        chunk = inferer.convert(batch)
+        chunk.columns = cleaned_columns
+        profiler.update(chunk)
+        if writer is not None:
+            try:
+                writer.write(chunk)
+            except Exception as e:
+                writer.abort()
+                if attach:
+                    raise
+                logger.warning(f"写快照失败，仅写库: table={table_name}, error={e}")
+                writer = None
+        if not attach:
+            sql_alchemy_helper.insert_dataframe_batch(chunk, table_name, if_exists='replace' if first else 'append')
+        first = False
+        inserted += len(chunk)
+        logger.info(f"分块写库: table={table_name}, rows={inserted}/{inferer.row_count}")
+        if on_rows:
+            on_rows(len(chunk))
+
+    if writer is not None:
+        writer.close()
+        schema_dict['snapshot_file'] = snapshot_file_name(table_name)
+        if attach:
+            sql_alchemy_helper.attach_parquet(table_name, writer.path)
+    schema_dict['column_stats'] = profiler.to_dict()
+    schema_path = _write_schema_file(schema_dict, table_name)
+
+    _build_indexes(table_name, schema_dict, inserted)
+    return schema_path, table_name, inserted
+
+
+def _ingest_dataframe(df: pd.DataFrame, file_name: str, sheet_name: str = None,
+                      sheet_index: int = 0, multi_sheet: bool = False,
+                      on_rows: Callable[[int], None] = None) -> tuple[str, str, int]:
+    """整表已在内存中的导入路径：类型推断 → 列清洗 → schema → 写库。返回 (schema 路径, table_name, 行数)。"""
+    # 计算内容哈希值，确保唯一性（与流式路径同一定义）
+    hasher = hashlib.md5()
+    _update_content_hash(hasher, df)
+    file_content_hash = hasher.hexdigest()
+
+    df_convert = df.apply(infer_and_convert)
+    df_convert = transfer_df_columns(df_convert)
+    logger.info(f"列清洗完成: {file_name}, sheet={sheet_name}, columns_count={len(df_convert.columns)}, columns={list(df_convert.columns)}")
+
+    table_name = _sheet_table_name(file_name, file_content_hash, sheet_name, sheet_index, multi_sheet)
+    schema_dict, table_name = generate_schema_info(df_convert, file_name, file_content_hash,
+                                                   table_name=table_name, sheet_name=sheet_name)
+    logger.info(f"生成 schema 信息: table_name={table_name}, columns={len(schema_dict.get('column_list', []))}")
+
+    snapshot = None
+    try:
+        snapshot = write_snapshot(df_convert, table_name, original_columns=list(df.columns))
+    except Exception as e:
+        logger.warning(f"写快照失败，仅写库: table={table_name}, error={e}")
+    if snapshot:
+        schema_dict['snapshot_file'] = snapshot_file_name(table_name)
+    schema_path = _write_schema_file(schema_dict, table_name)
+
+    # 插入数据库（DuckDB 后端直接以快照为表）
+    if snapshot and sql_alchemy_helper.dialect == 'duckdb':
+        sql_alchemy_helper.attach_parquet(table_name, snapshot)
+    else:
+        sql_alchemy_helper.insert_dataframe_batch(df_convert, table_name)
+    if on_rows:
+        on_rows(len(df_convert))
+
+    _build_indexes(table_name, schema_dict, len(df_convert))
+    return schema_path, table_name, len(df_convert)
+
+
+def _build_indexes(table_name: str, schema_dict: dict, row_count: int) -> None:
+    """写库后的建索引阶段，基数取自 schema 中的列统计；失败不影响导入。"""
+    # 表数据已变更，同进程内的结果缓存与热点列统计随之失效
+    invalidate_tables([table_name])
+    forget_tables([table_name])
+    stats = schema_dict.get('column_stats', {})
+    column_stats = {
+        col[0]: {"sql_type": col[1], "distinct": stats.get(col[0], {}).get('distinct')}
+        for col in schema_dict.get('column_list', [])
+    }
+    try:
+        created = create_indexes_for_table(table_name, column_stats, row_count)
+        if created:
+            logger.info(f"自动建索引完成: table={table_name}, columns={created}")
+    except Exception as e:
+        logger.warning(f"自动建索引失败: table={table_name}, error={e}")
+
+
+def _remove_superseded_tables(file_name: str, current_tables: list[str]) -> list[str]:
+    """
+    同一原始文件重新导入成功后，删除其旧版本留下的表、schema 与快照，返回被删除的表名。
+    表名含内容哈希，文件内容变化（或内容哈希定义变化）后旧表不会被覆盖，不清理会在库中留下重复的表。
+    """
+    schema_index, _ = build_schema_index([transfer_name(file_name)])
+    keep = set(current_tables)
+    stale = {path: table for path, table in schema_index.get(file_name, []) if table not in keep}
+    if not stale:
+        return []
+    dropped, drop_errors = drop_tables(set(stale.values()))
+    invalidate_tables(dropped)
+    forget_tables(dropped)
+    # 删表失败的保留 schema，避免库里的表失去描述
+    failed = {name for name, _ in drop_errors}
+    remove_files([path for path, table in stale.items() if table not in failed])
+    remove_files([snapshot_path(t) for t in dropped if os.path.exists(snapshot_path(t))])
+    logger.info(f"已清理旧版本表: file={file_name}, tables={dropped}, errors={drop_errors}")
+    return dropped
+
+
+def _read_csv_fast(full_path: str) -> pd.DataFrame:
+    """优先使用 pyarrow 多线程解析 CSV，pyarrow 不可用或解析失败时回退到 C 引擎。"""
+    encoding = detect_csv_encoding(full_path)
+    try:
+        return pd.read_csv(full_path, engine='pyarrow', encoding=encoding)
+    except Exception as e:
+        logger.info(f"pyarrow 解析 CSV 不可用，回退 C 引擎: path={full_path}, error={e}")
+        return pd.read_csv(full_path, engine='c', encoding=encoding, low_memory=False)
+
+
+def _ingest_file(full_path: str, file_name: str, file_size: int,
+                 on_rows: Callable[[int], None] = None) -> tuple[list[dict], dict[str, str]]:
+    """
+    导入单个文件：每个非空工作表（CSV 视为单个工作表）各生成一张表与一份 schema，
+    同一工作簿的多个工作表并行处理。
+
+    返回 (成功的表信息列表, {工作表: 错误信息})。
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    streaming = _should_stream(file_name, file_size)
+    if streaming:
+        logger.info(f"文件超过流式阈值 {STREAMING_THRESHOLD_MB} MB，使用流式导入: {file_name}")
+
+    # 每个任务为 (工作表名, 序号, DataFrame 或返回批次迭代器的函数)
+    jobs: list[tuple] = []
+    if ext == '.csv':
+        if streaming:
+            jobs.append((None, 0, lambda: iter_csv_row_batches(full_path, STREAMING_BATCH_ROWS)))
+        else:
+            jobs.append((None, 0, _read_csv_fast(full_path)))
+    elif streaming:
+        for idx, sheet in enumerate(list_nonempty_xlsx_sheets(full_path)):
+            jobs.append((sheet, idx, lambda sheet=sheet: iter_xlsx_row_batches(full_path, STREAMING_BATCH_ROWS, sheet_name=sheet)))
+    else:
+        sheets = _read_excel_with_fallbacks(full_path, file_name, sheet_name=None)
+        for idx, (sheet, df) in enumerate(sheets.items()):
+            # 完全空白的工作表没有任何列，跳过
+            if df is None or len(df.columns) == 0:
+                continue
+            jobs.append((str(sheet), idx, df))
+    logger.info(f"读取完成: {file_name}, sheets={[j[0] for j in jobs]}")
+
+    if not jobs:
+        raise ValueError(f"没有非空工作表: {file_name}")
+    multi_sheet = len(jobs) > 1
+
+    def _run_job(job):
+        sheet, idx, source = job
+        if callable(source):
+            return _ingest_streaming(source, file_name, sheet, idx, multi_sheet, on_rows=on_rows)
+        return _ingest_dataframe(source, file_name, sheet, idx, multi_sheet, on_rows=on_rows)
+
+    tables: list[dict] = []
+    errors: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(SHEET_WORKERS, len(jobs)))) as executor:
+        futures = {executor.submit(_run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            sheet = futures[future][0]
+            label = sheet if sheet is not None else file_name
+            try:
+                schema_path, table_name, rows = future.result()
+                logger.info(f"数据库写入完成: table={table_name}, sheet={sheet}, rows={rows}")
+                tables.append({"sheet": sheet, "table_name": table_name, "schema_path": schema_path, "rows": rows})
+            except Exception as e:
+                errors[label] = str(e)
+                logger.exception(f"工作表处理失败: file={file_name}, sheet={sheet}, error={e}")
+    return tables, errors
+
+
+def _read_excel_with_fallbacks(full_path: str, file_name: str, sheet_name=0):
     """尽可能健壮地读取 Excel：
     - .xlsx: 优先 openpyxl
     - .xls: 依次尝试 pandas 默认(None) → xlrd → 手工 xlrd 解析 → 最后报出清晰提示
+
+    sheet_name 透传给 pd.read_excel；为 None 时返回 {工作表名: DataFrame}。
     """
     ext = os.path.splitext(file_name)[1].lower()
     errors = []
 
     if ext == '.xlsx':
         try:
-            return pd.read_excel(full_path, engine='openpyxl')
+            return pd.read_excel(full_path, engine='openpyxl', sheet_name=sheet_name)
         except Exception as e:
             logger.exception(f"读取 .xlsx 失败: path={full_path}, engine=openpyxl, error={e}")
             raise
@@ -230,14 +635,14 @@ def _read_excel_with_fallbacks(full_path: str, file_name: str) -> pd.DataFrame:
             if _XLRD_VERSION and str(_XLRD_VERSION).split('.')[0].isdigit() and int(str(_XLRD_VERSION).split('.')[0]) >= 2:
                 raise RuntimeError(f"xlrd 版本为 {_XLRD_VERSION}，不再支持 .xls（请安装 xlrd==1.2.0）")
             logger.info(f"使用 xlrd 读取已解密的 .xls BytesIO")
-            return pd.read_excel(decrypted, engine='xlrd')
+            return pd.read_excel(decrypted, engine='xlrd', sheet_name=sheet_name)
 
         if _xlrd is None:
             raise RuntimeError("xlrd 未安装")
         if _XLRD_VERSION and str(_XLRD_VERSION).split('.')[0].isdigit() and int(str(_XLRD_VERSION).split('.')[0]) >= 2:
             raise RuntimeError(f"xlrd 版本为 {_XLRD_VERSION}，不再支持 .xls（请安装 xlrd==1.2.0）")
         logger.info(f"严格模式：使用 xlrd 读取 .xls: path={full_path}, xlrd_version={_XLRD_VERSION}")
-        return pd.read_excel(full_path, engine='xlrd')
+        return pd.read_excel(full_path, engine='xlrd', sheet_name=sheet_name)
     except Exception as e:
         errors.append(f"xlrd 失败: {e}")
         logger.warning(f"严格模式 xlrd 读取 .xls 失败: path={full_path}, error={e}")
@@ -251,7 +656,12 @@ def _read_excel_with_fallbacks(full_path: str, file_name: str) -> pd.DataFrame:
     raise RuntimeError(hint)
 
 
-def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str):
+def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str, progress_callback: Callable[[dict], None] = None):
+    """
+    导入目录下全部支持的文件。progress_callback 不为空时，在每个文件开始/结束及每次写库后以进度字典回调：
+    {"stage": "import", "unit": "files", "done", "total", "current_file", "rows_inserted", "rows_per_second"}；
+    可能在工作表线程中调用，回调异常不影响导入。
+    """
     if not os.path.exists(excel_file_outer_dir):
         raise FileNotFoundError(f"File not found: {excel_file_outer_dir}")
     
@@ -278,12 +688,41 @@ def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str):
     succeeded = []
     failed: dict[str, str] = {}
     schema_written_paths: list[str] = []
+    tables_by_file: dict[str, list[str]] = {}
+    superseded_by_file: dict[str, list[str]] = {}
     # 不再进行 .xls -> .xlsx 的自动转换，也不删除原始 .xls
 
-    for file_name in tqdm(os.listdir(excel_file_outer_dir)):
-        lower_name = file_name.lower()
-        if not (lower_name.endswith('.xlsx') or lower_name.endswith('.xls')):
-            continue
+    file_names = [f for f in os.listdir(excel_file_outer_dir) if f.lower().endswith(SUPPORTED_EXTENSIONS)]
+    started = time.monotonic()
+    progress_lock = threading.Lock()
+    progress = {"rows_inserted": 0, "current_file": None}
+
+    def _report():
+        if progress_callback is None:
+            return
+        elapsed = time.monotonic() - started
+        event = {
+            "stage": "import",
+            "unit": "files",
+            "done": processed,
+            "total": len(file_names),
+            "current_file": progress["current_file"],
+            "rows_inserted": progress["rows_inserted"],
+            "rows_per_second": round(progress["rows_inserted"] / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        try:
+            progress_callback(event)
+        except Exception as e:
+            logger.warning(f"进度回调失败: {e}")
+
+    def _on_rows(rows: int):
+        with progress_lock:
+            progress["rows_inserted"] += rows
+            _report()
+
+    for file_name in tqdm(file_names):
+        progress["current_file"] = file_name
+        _report()
         full_path = os.path.join(excel_file_outer_dir, file_name)
         try:
             file_size = os.path.getsize(full_path)
@@ -291,42 +730,21 @@ def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str):
             file_size = -1
         logger.info(f"开始处理: path={full_path}, size={file_size} bytes")
         try:
-            df = _read_excel_with_fallbacks(full_path, file_name)
-            logger.info(f"读取完成: {file_name}, shape={getattr(df, 'shape', None)}")
-            
-            # 计算文件内容的哈希值，确保唯一性
-            file_content = df.to_string()
-            file_content_hash = hashlib.md5(file_content.encode('utf-8')).hexdigest()
-            
-            df_convert = df.apply(infer_and_convert)
-            df_convert = transfer_df_columns(df_convert)
-            logger.info(f"列清洗完成: {file_name}, columns_count={len(df_convert.columns)}, columns={list(df_convert.columns)}")
-
             # 直接使用原始文件名作为后续 schema/表名依据（不再转换为 .xlsx）
-            canonical_filename = file_name
-
-            schema_dict, table_name = generate_schema_info(df_convert, canonical_filename, file_content_hash)
-            logger.info(f"生成 schema 信息: table_name={table_name}, columns={len(schema_dict.get('column_list', []))}")
-
-            schema_path = f"{SCHEMA_DIR}/{table_name}.json"
-            try:
-                with open(schema_path, 'w', encoding='utf-8') as f:
-                    json.dump(schema_dict, f, ensure_ascii=False)
-                # 写入后校验文件是否存在且非空
-                exists = os.path.exists(schema_path)
-                size = os.path.getsize(schema_path) if exists else 0
-                if not exists or size == 0:
-                    raise IOError(f"schema 文件校验失败: exists={exists}, size={size}")
-                logger.info(f"Schema 已写入: {schema_path}, size={size} bytes")
-                schema_written_paths.append(os.path.abspath(schema_path))
-            except Exception as write_err:
-                raise RuntimeError(f"写入 schema 失败: path={schema_path}, error={write_err}")
-            
-            # 插入数据库
-            sql_alchemy_helper.insert_dataframe_batch(df_convert, table_name)
-            logger.info(f"数据库写入完成: table={table_name}, rows={len(df_convert)}")
-
-            succeeded.append(canonical_filename)
+            tables, sheet_errors = _ingest_file(full_path, file_name, file_size, on_rows=_on_rows)
+            schema_written_paths.extend(t["schema_path"] for t in tables)
+            tables_by_file[file_name] = [t["table_name"] for t in tables]
+            if sheet_errors:
+                failed[file_name] = "; ".join(f"{sheet}: {err}" for sheet, err in sheet_errors.items())
+            else:
+                succeeded.append(file_name)
+                # 全部工作表成功才清理旧版本，部分失败时保留旧表以免数据缺失
+                try:
+                    superseded = _remove_superseded_tables(file_name, tables_by_file[file_name])
+                    if superseded:
+                        superseded_by_file[file_name] = superseded
+                except Exception as e:
+                    logger.warning(f"清理旧版本表失败: file={file_name}, error={e}")
             processed += 1
         except Exception as e:
             failed[file_name] = str(e)
@@ -334,6 +752,9 @@ def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str):
             processed += 1
             # 不中断，继续处理其他文件
             continue
+        finally:
+            progress["current_file"] = None
+            _report()
 
     summary = {
         "processed": processed,
@@ -342,6 +763,8 @@ def parse_excel_file_and_insert_to_db(excel_file_outer_dir: str):
         "schema_dir": SCHEMA_DIR,
         "excel_dir": excel_file_outer_dir,
         "schema_written": schema_written_paths,
+        "tables": tables_by_file,
+        "superseded": superseded_by_file,
     }
     logger.info(f"导入完成: {json.dumps(summary, ensure_ascii=False)}")
     return summary
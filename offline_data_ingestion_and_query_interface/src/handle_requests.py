@@ -1,8 +1,14 @@
 import requests
+import asyncio
 import time
 import json
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 # Load model configuration from config file
 def load_model_config():
@@ -31,12 +37,25 @@ def load_model_config():
 llm_config = load_model_config()
 model_request_config = llm_config["models"]
 
+# 覆盖模型 endpoint（压测时指向 mock LLM）
+LLM_ENDPOINT_OVERRIDE = os.getenv("LLM_ENDPOINT_OVERRIDE")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))
+
+
+def _attempt_timeout(deadline: Optional[float]) -> Optional[float]:
+    """单次请求超时：不超过剩余时间（deadline 为 time.monotonic() 时间戳）；已超时返回 None。"""
+    if deadline is None:
+        return LLM_REQUEST_TIMEOUT
+    remaining = deadline - time.monotonic()
+    return min(LLM_REQUEST_TIMEOUT, remaining) if remaining > 0 else None
+
 def call_llm_api(
     endpoint: str,
     payload: Dict[str, Any],
     headers: Optional[Dict[str, str]] = None,
     max_retries: int = 3,
-    initial_retry_delay: float = 1.0
+    initial_retry_delay: float = 1.0,
+    deadline: Optional[float] = None
 ) -> Optional[Dict[str, Any]]:
     """
     调用大模型推理接口，包含异常捕获和指数退避重试机制
@@ -46,18 +65,23 @@ def call_llm_api(
     :param headers: 请求头(可选)
     :param max_retries: 最大重试次数
     :param initial_retry_delay: 初始重试延迟(秒)
+    :param deadline: 截止时间(time.monotonic() 时间戳，可选)，超时与重试等待不超过剩余时间
     :return: 响应数据或None(失败时)
     """
     retry_delay = initial_retry_delay
     headers = headers or {"Content-Type": "application/json"}
     
     for attempt in range(max_retries + 1):
+        timeout = _attempt_timeout(deadline)
+        if timeout is None:
+            print("Request deadline exceeded, giving up.")
+            return None
         try:
             response = requests.post(
                 endpoint,
                 json=payload,
                 headers=headers,
-                timeout=30
+                timeout=timeout
             )
             response.raise_for_status()
             resp_json_body = response.json()
@@ -74,6 +98,9 @@ def call_llm_api(
                 print(f"Request failed after {max_retries} retries. Error: {str(e)}")
                 return None
             
+            if deadline is not None and time.monotonic() + retry_delay >= deadline:
+                print(f"Request failed and no time left for a retry. Error: {str(e)}")
+                return None
             print(f"Attempt {attempt + 1} failed. Retrying in {retry_delay:.1f}s... Error: {str(e)}")
             time.sleep(retry_delay)
             retry_delay *= 2  # 指数退避
@@ -81,18 +108,19 @@ def call_llm_api(
     return None
 
 
-def get_llm_response(
+def build_llm_request(
     system_prompt: Optional[str],
     user_prompt: str,
     model: str = None,
-) -> Optional[str]:
+) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+    """根据模型配置组装 (endpoint, payload, headers)，同步与异步调用共用。"""
     if model is None:
         model = llm_config.get("default_model", "qwen2.57b")
     
     model_config = model_request_config.get(model)
     if not model_config:
         raise ValueError(f"Model '{model}' is not supported.")
-    model_endpoint = model_config["endpoint"]
+    model_endpoint = LLM_ENDPOINT_OVERRIDE or model_config["endpoint"]
     model_headers = model_config["headers"]
     model_name = model_config["model"]
     temperature = model_config.get("temperature", 0.01)
@@ -110,15 +138,109 @@ def get_llm_response(
     # 添加no_think参数到payload中
     if no_think:
         payload["no_think"] = True
+    return model_endpoint, payload, model_headers
+
+
+def get_llm_response(
+    system_prompt: Optional[str],
+    user_prompt: str,
+    model: str = None,
+    deadline: Optional[float] = None,
+) -> Optional[str]:
+    model_endpoint, payload, model_headers = build_llm_request(system_prompt, user_prompt, model)
 
     resp_content = call_llm_api(
         endpoint=model_endpoint,
         payload=payload,
-        headers=model_headers
+        headers=model_headers,
+        deadline=deadline
     )
     return resp_content
 
 
+# 异步调用共享的连接池客户端，由 ASGI 服务的 lifespan 负责关闭
+_async_client = None
+
+
+def _get_async_client():
+    global _async_client
+    if httpx is None:
+        raise RuntimeError("httpx is required for async LLM calls")
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=LLM_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")))
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def call_llm_api_async(
+    endpoint: str,
+    payload: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None,
+    max_retries: int = 3,
+    initial_retry_delay: float = 1.0,
+    deadline: Optional[float] = None
+) -> Optional[str]:
+    """
+    call_llm_api 的异步版本：等待模型响应时不占用线程，重试、指数退避与 deadline 处理相同
+    """
+    retry_delay = initial_retry_delay
+    headers = headers or {"Content-Type": "application/json"}
+    client = _get_async_client()
+
+    for attempt in range(max_retries + 1):
+        timeout = _attempt_timeout(deadline)
+        if timeout is None:
+            print("Request deadline exceeded, giving up.")
+            return None
+        try:
+            response = await client.post(endpoint, json=payload, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            resp_json_body = response.json()
+            return resp_json_body['choices'][0]['message']['content']
+        except (httpx.HTTPError,
+                json.JSONDecodeError,
+                ValueError,
+                KeyError,
+                IndexError,
+                TypeError) as e:
+            if attempt == max_retries:
+                print(f"Request failed after {max_retries} retries. Error: {str(e)}")
+                return None
+
+            if deadline is not None and time.monotonic() + retry_delay >= deadline:
+                print(f"Request failed and no time left for a retry. Error: {str(e)}")
+                return None
+            print(f"Attempt {attempt + 1} failed. Retrying in {retry_delay:.1f}s... Error: {str(e)}")
+            await asyncio.sleep(retry_delay)
+            retry_delay *= 2  # 指数退避
+
+    return None
+
+
+async def get_llm_response_async(
+    system_prompt: Optional[str],
+    user_prompt: str,
+    model: str = None,
+    deadline: Optional[float] = None,
+) -> Optional[str]:
+    model_endpoint, payload, model_headers = build_llm_request(system_prompt, user_prompt, model)
+    return await call_llm_api_async(
+        endpoint=model_endpoint,
+        payload=payload,
+        headers=model_headers,
+        deadline=deadline
+    )
+
+
 if __name__ == "__main__":
     # Example usage
     system_prompt = "You are a helpful assistant."
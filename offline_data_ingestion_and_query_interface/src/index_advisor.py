@@ -0,0 +1,337 @@
+"""
+自动二级索引：
+- 导入阶段：按列统计（基数、类型）与列名启发式（id/code/date/year 等）为新表建索引；
+- 查询阶段：统计已执行 SQL 中 WHERE/JOIN ON/GROUP BY 出现的列，热点列在后台补建索引。
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from offline_data_ingestion_and_query_interface.src.common_utils import SCHEMA_DIR, sql_alchemy_helper
+from offline_data_ingestion_and_query_interface.src.log_service import logger
+
+
+# 导入阶段是否自动建索引
+AUTO_INDEX_ENABLED = os.getenv("INGEST_AUTO_INDEX", "1").lower() not in ("0", "false", "no")
+# 行数少于该值的表全表扫描足够快，不建索引
+INDEX_MIN_ROWS = int(os.getenv("INDEX_MIN_ROWS", "1000"))
+# 每张表导入阶段最多建立的索引数
+INDEX_MAX_PER_TABLE = int(os.getenv("INDEX_MAX_PER_TABLE", "5"))
+# 列在查询谓词中出现多少次后视为热点列
+HOT_COLUMN_THRESHOLD = int(os.getenv("HOT_COLUMN_THRESHOLD", "3"))
+# 热点统计最多跟踪的 (表, 列) 数，超出后按 LRU 淘汰最久未出现的列
+HOT_COLUMN_MAX_TRACKED = int(os.getenv("HOT_COLUMN_MAX_TRACKED", "10000"))
+# MySQL 对 TEXT/BLOB 列只能建前缀索引
+TEXT_PREFIX_LENGTH = 64
+
+_NAME_HINT_PATTERN = re.compile(
+    r'(^|_)(id|code|no|num|key|date|day|year|month|quarter|time|type|category|name)(_\d+)?$'
+)
+_CLAUSE_PATTERN = re.compile(
+    r'\b(SELECT|FROM|JOIN|ON|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|UNION)\b', re.IGNORECASE
+)
+_TABLE_REF_PATTERN = re.compile(
+    r'\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?`?(\w+)`?)?', re.IGNORECASE
+)
+_COLUMN_REF_PATTERN = re.compile(r'(?:(`[^`]+`|\w+)\s*\.\s*)?`([^`]+)`')
+_SQL_KEYWORDS = {
+    'where', 'join', 'inner', 'left', 'right', 'outer', 'cross', 'on', 'group', 'order',
+    'limit', 'having', 'union', 'as', 'natural', 'full',
+}
+
+
+def _is_text_type(sql_type: str) -> bool:
+    return str(sql_type).upper().startswith(('VARCHAR', 'CHAR', 'TEXT', 'MEDIUMTEXT', 'LONGTEXT'))
+
+
+def _is_float_type(sql_type: str) -> bool:
+    return str(sql_type).upper().startswith(('FLOAT', 'DOUBLE', 'REAL', 'DECIMAL'))
+
+
+def score_column(name: str, sql_type: str, distinct: Optional[int], rows: int) -> float:
+    """
+    为列打分，分数 <= 0 表示不值得建索引。
+    - 列名命中 id/code/date/year 等启发式加分；
+    - 选择度（distinct/rows）高的整数、日期、短字符串列加分；
+    - 浮点列、常量列不建索引。
+    distinct 为 None 时（未统计基数）只依据列名与类型。
+    """
+    lower_name = str(name).lower()
+    name_hint = bool(_NAME_HINT_PATTERN.search(lower_name))
+    if distinct is not None and distinct <= 1:
+        return 0.0
+    if _is_float_type(sql_type) and not name_hint:
+        return 0.0
+
+    score = 2.0 if name_hint else 0.0
+    if str(sql_type).upper().startswith(('DATETIME', 'DATE', 'TIMESTAMP')):
+        score += 1.0
+    if distinct is not None and rows > 0:
+        selectivity = distinct / rows
+        if selectivity >= 0.05:
+            score += 1.0 + selectivity
+        elif not name_hint:
+            # 低基数且无列名提示的列，索引收益有限
+            return 0.0
+    return score
+
+
+def plan_indexes(column_stats: Dict[str, dict], row_count: int, max_indexes: int = None) -> List[str]:
+    """
+    根据列统计挑选要建索引的列，按分数从高到低返回。
+
+    参数：
+        column_stats: {列名: {"sql_type": str, "distinct": int | None}}
+        row_count: 表行数
+    """
+    if row_count < INDEX_MIN_ROWS:
+        return []
+    max_indexes = INDEX_MAX_PER_TABLE if max_indexes is None else max_indexes
+    scored = []
+    for col, stats in column_stats.items():
+        score = score_column(col, stats.get("sql_type", ""), stats.get("distinct"), row_count)
+        if score > 0:
+            scored.append((score, col))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [col for _, col in scored[:max_indexes]]
+
+
+def index_name(table_name: str, column: str) -> str:
+    """索引名 ix_<表>_<列>，超过 64 字符时截断并追加哈希保证唯一。"""
+    name = f"ix_{table_name}_{column}"
+    if len(name) <= 64:
+        return name
+    digest = hashlib.md5(name.encode('utf-8')).hexdigest()[:8]
+    return f"{name[:55]}_{digest}"
+
+
+def create_index(table_name: str, column: str) -> bool:
+    """为单列建索引；已有以该列开头的索引时跳过。返回是否新建。"""
+    columns = sql_alchemy_helper.get_columns(table_name)
+    if column not in columns:
+        logger.warning(f"跳过索引：列不存在 table={table_name}, column={column}")
+        return False
+    if column in sql_alchemy_helper.get_index_columns(table_name):
+        return False
+
+    quote = sql_alchemy_helper.quote_identifier
+    column_expr = quote(column)
+    if sql_alchemy_helper.dialect == 'mysql' and _is_text_type(columns[column]) and not columns[column].upper().startswith('VARCHAR'):
+        column_expr = f"{column_expr}({TEXT_PREFIX_LENGTH})"
+    sql = f"CREATE INDEX {quote(index_name(table_name, column))} ON {quote(table_name)} ({column_expr})"
+    sql_alchemy_helper.execute_sql(sql)
+    logger.info(f"已创建索引: table={table_name}, column={column}")
+    return True
+
+
+def create_indexes_for_table(table_name: str, column_stats: Dict[str, dict], row_count: int) -> List[str]:
+    """导入阶段的建索引入口：失败只记日志，不影响导入结果。返回新建索引的列。"""
+    # DuckDB 扫描依赖列式 min/max 过滤，且快照视图上无法建索引
+    if not AUTO_INDEX_ENABLED or sql_alchemy_helper.dialect == 'duckdb':
+        return []
+    created = []
+    for column in plan_indexes(column_stats, row_count):
+        try:
+            if create_index(table_name, column):
+                created.append(column)
+        except Exception as e:
+            logger.warning(f"创建索引失败: table={table_name}, column={column}, error={e}")
+    return created
+
+
+def _schema_columns(table_name: str) -> Set[str]:
+    schema_path = os.path.join(SCHEMA_DIR, f"{table_name}.json")
+    try:
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            return {col[0] for col in json.load(f).get('column_list', []) if col}
+    except Exception:
+        return set()
+
+
+def extract_predicate_columns(sql: str) -> Set[Tuple[str, str]]:
+    """
+    从 SQL 中提取 WHERE / JOIN ON / GROUP BY 子句引用的 (表名, 列名)。
+    依赖 NL2SQL 提示要求的反引号包裹列名；未限定表名的列按各表 schema 的列集合归属。
+    """
+    if not sql:
+        return set()
+    alias_to_table: Dict[str, str] = {}
+    tables: List[str] = []
+    for match in _TABLE_REF_PATTERN.finditer(sql):
+        table, alias = match.group(1), match.group(2)
+        tables.append(table)
+        alias_to_table[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            alias_to_table[alias] = table
+    if not tables:
+        return set()
+
+    # 切分子句，只保留谓词/分组相关部分
+    sections = []
+    parts = _CLAUSE_PATTERN.split(sql)
+    for i in range(1, len(parts) - 1, 2):
+        keyword = re.sub(r'\s+', ' ', parts[i].upper())
+        if keyword in ('WHERE', 'ON', 'GROUP BY', 'HAVING'):
+            sections.append(parts[i + 1])
+
+    schema_columns = {t: _schema_columns(t) for t in set(tables)}
+    result: Set[Tuple[str, str]] = set()
+    for section in sections:
+        for match in _COLUMN_REF_PATTERN.finditer(section):
+            qualifier, column = match.group(1), match.group(2)
+            if qualifier:
+                table = alias_to_table.get(qualifier.strip('`'))
+                if table:
+                    result.add((table, column))
+                continue
+            if column in alias_to_table:
+                continue
+            owners = [t for t in schema_columns if column in schema_columns[t]]
+            if not owners and len(schema_columns) == 1:
+                owners = list(schema_columns)
+            for table in owners:
+                result.add((table, column))
+    return result
+
+
+class HotColumnTracker:
+    """
+    统计谓词列出现次数，达到阈值的列交给后台线程补建索引（每列只尝试一次）。
+    计数按 LRU 限制在 max_tracked 个 (表, 列) 以内；表被重新导入或删除后其计数清零：
+    同进程内由 data_persistent / cleanup 调用 forget_tables，跨进程时由 record 传入的表数据版本
+    （与结果缓存相同的 source_file_hash + schema mtime）变化触发。
+    """
+
+    def __init__(self, threshold: int = HOT_COLUMN_THRESHOLD, max_tracked: int = HOT_COLUMN_MAX_TRACKED) -> None:
+        self.threshold = threshold
+        self.max_tracked = max(1, max_tracked)
+        # (表, 列) -> [出现次数, 是否已尝试建索引]
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._versions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def hits(self, key: Tuple[str, str]) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry else 0
+
+    def attempted(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return sorted(key for key, entry in self._entries.items() if entry[1])
+
+    def forget_tables(self, table_names: Iterable[str]) -> int:
+        """清除指定表的全部计数与建索引记录（表已重新导入或删除），返回清除的列数。"""
+        names = set(table_names)
+        with self._lock:
+            return self._forget_locked(names)
+
+    def _forget_locked(self, names: Set[str]) -> int:
+        stale = [key for key in self._entries if key[0] in names]
+        for key in stale:
+            del self._entries[key]
+        for name in names:
+            self._versions.pop(name, None)
+        return len(stale)
+
+    def record(self, sql: str, table_versions: Dict[str, tuple] = None) -> List[Tuple[str, str]]:
+        """
+        记录一条已成功执行的 SQL，返回本次新晋为热点的列。
+        table_versions 为 table_name -> 数据版本；某表版本与上次不同时先清除该表的旧计数。
+        """
+        try:
+            columns = extract_predicate_columns(sql)
+        except Exception as e:
+            logger.warning(f"解析谓词列失败: {e}")
+            return []
+        promoted = []
+        with self._lock:
+            if table_versions:
+                changed = {name for name, version in table_versions.items()
+                           if name in self._versions and self._versions[name] != version}
+                if changed:
+                    self._forget_locked(changed)
+                self._versions.update(table_versions)
+            for key in columns:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = [0, False]
+                else:
+                    self._entries.move_to_end(key)
+                entry[0] += 1
+                if entry[0] >= self.threshold and not entry[1]:
+                    entry[1] = True
+                    promoted.append(key)
+            while len(self._entries) > self.max_tracked:
+                self._entries.popitem(last=False)
+            # 版本表只保留仍有计数的表，避免随表数无限增长
+            if len(self._versions) > self.max_tracked:
+                live = {key[0] for key in self._entries}
+                self._versions = {name: v for name, v in self._versions.items() if name in live}
+            if promoted:
+                self._ensure_worker()
+        for key in promoted:
+            self._queue.put(key)
+        return promoted
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._drain, name="hot-column-indexer", daemon=True)
+            self._worker.start()
+
+    def _drain(self) -> None:
+        while True:
+            table_name, column = self._queue.get()
+            try:
+                if create_index(table_name, column):
+                    logger.info(f"热点列索引已创建: table={table_name}, column={column}, hits={self.hits((table_name, column))}")
+            except Exception as e:
+                logger.warning(f"热点列建索引失败: table={table_name}, column={column}, error={e}")
+            finally:
+                self._queue.task_done()
+
+
+hot_column_tracker = HotColumnTracker()
+
+
+def forget_tables(table_names: Iterable[str]) -> int:
+    """供 data_persistent / cleanup 调用：表被重新导入或删除后清除其热点列统计。"""
+    return hot_column_tracker.forget_tables(list(table_names))
+
+
+def replay_sql_log(log_path: str, tracker: HotColumnTracker = None) -> int:
+    """回放日志中 'Executed SQL: ...' 记录，用历史查询预热热点列统计。返回回放条数。"""
+    tracker = tracker or hot_column_tracker
+    count = 0
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            marker = line.find('Executed SQL: ')
+            if marker < 0:
+                continue
+            tracker.record(line[marker + len('Executed SQL: '):].strip())
+            count += 1
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Create indexes for hot predicate columns found in SQL service logs.")
+    parser.add_argument('--from-log', required=True, help='Path to the SQL service app.log')
+    parser.add_argument('--threshold', type=int, default=HOT_COLUMN_THRESHOLD)
+    args = parser.parse_args()
+
+    tracker = HotColumnTracker(threshold=args.threshold)
+    replayed = replay_sql_log(args.from_log, tracker)
+    tracker._queue.join()
+    print(f"Replayed {replayed} SQL statements, hot columns: {tracker.attempted()}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
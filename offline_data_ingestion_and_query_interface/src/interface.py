@@ -1,9 +1,9 @@
 from flask import Flask, request, jsonify
 try:
-    from .service import process_tablerag_request  # type: ignore
+    from .service import process_tablerag_request, process_tablerag_batch, parse_batch_items, deadline_from_header, DEADLINE_HEADER, check_standalone_backend  # type: ignore
 except Exception:
     try:
-        from service import process_tablerag_request  # type: ignore
+        from service import process_tablerag_request, process_tablerag_batch, parse_batch_items, deadline_from_header, DEADLINE_HEADER, check_standalone_backend  # type: ignore
     except Exception:
         import os
         import sys
@@ -11,7 +11,10 @@ except Exception:
         parent_dir = os.path.dirname(current_dir)
         if parent_dir not in sys.path:
             sys.path.insert(0, parent_dir)
-        from service import process_tablerag_request  # type: ignore
+        from service import process_tablerag_request, process_tablerag_batch, parse_batch_items, deadline_from_header, DEADLINE_HEADER, check_standalone_backend  # type: ignore
+
+# duckdb 后端由 apiserve 进程独占，独立 SQL 服务拒绝启动
+check_standalone_backend()
 
 app = Flask(__name__)
 
@@ -24,9 +27,20 @@ def get_tablerag_response():
     query = json_body['query']
     table_name_list = json_body['table_name_list']
 
-    res_dict = process_tablerag_request(table_name_list, query)
+    deadline = deadline_from_header(request.headers.get(DEADLINE_HEADER))
+    res_dict = process_tablerag_request(table_name_list, query, deadline=deadline)
     
     return jsonify(res_dict)
 
+@app.route('/get_tablerag_response_batch', methods=['POST'])
+def get_tablerag_response_batch():
+    """批量 NL2SQL，请求体格式见 service.parse_batch_items。"""
+    items, error_message = parse_batch_items(request.get_json())
+    if items is None:
+        return jsonify({'error': error_message}), 400
+
+    deadline = deadline_from_header(request.headers.get(DEADLINE_HEADER))
+    return jsonify(process_tablerag_batch(items, deadline=deadline))
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
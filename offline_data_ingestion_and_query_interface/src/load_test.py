@@ -0,0 +1,107 @@
+"""
+NL2SQL 服务压测：以固定并发发送请求，统计吞吐（requests/sec）与延迟分位数。
+--mock-llm-port 会在本进程内启动一个 OpenAI 兼容的 mock LLM（固定延迟、固定返回 SQL），
+被测服务需以 LLM_ENDPOINT_OVERRIDE=http://127.0.0.1:<port>/v1/chat/completions 启动，
+从而只衡量服务本身的并发能力。
+
+示例（项目根目录）：
+  LLM_ENDPOINT_OVERRIDE=http://127.0.0.1:11500/v1/chat/completions \\
+      python -m offline_data_ingestion_and_query_interface.src.asgi_app --workers 4 &
+  python -m offline_data_ingestion_and_query_interface.src.load_test \\
+      --mock-llm-port 11500 --table <已导入的表名> --concurrency 64 --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+
+def start_mock_llm(port: int, latency: float, sql: str) -> None:
+    """在后台线程启动 mock LLM：等待 latency 秒后返回包含 sql 的 chat completion。"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    mock_app = FastAPI()
+
+    @mock_app.post('/v1/chat/completions')
+    async def chat_completions():
+        await asyncio.sleep(latency)
+        return {'choices': [{'message': {'role': 'assistant', 'content': f"```sql\n{sql}\n```"}}]}
+
+    server = uvicorn.Server(uvicorn.Config(mock_app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+
+
+async def run_load(url: str, body: dict, concurrency: int, total: int, timeout: float) -> dict:
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, json=body)
+                    statuses[resp.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else float('nan')
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(statuses.get(200, 0) / elapsed, 2) if elapsed else 0.0,
+        'status': dict(statuses),
+        'latency_mean': round(statistics.mean(latencies), 4) if latencies else None,
+        'latency_p50': round(percentile(0.50), 4),
+        'latency_p95': round(percentile(0.95), 4),
+        'latency_p99': round(percentile(0.99), 4),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load-test the NL2SQL service at a fixed concurrency.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000/get_tablerag_response')
+    parser.add_argument('--table', action='append', required=True, help='Table name sent in table_name_list (repeatable)')
+    parser.add_argument('--query', default='How many rows are there?')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--mock-llm-port', type=int, default=None, help='Start a mock LLM on this port')
+    parser.add_argument('--mock-latency', type=float, default=0.5, help='Mock LLM response delay in seconds')
+    parser.add_argument('--mock-sql', default='SELECT 1')
+    args = parser.parse_args()
+
+    if args.mock_llm_port:
+        start_mock_llm(args.mock_llm_port, args.mock_latency, args.mock_sql)
+        print(f"Mock LLM listening on http://127.0.0.1:{args.mock_llm_port}/v1/chat/completions "
+              f"(latency {args.mock_latency}s)")
+
+    body = {'table_name_list': args.table, 'query': args.query}
+    report = asyncio.run(run_load(args.url, body, args.concurrency, args.requests, args.timeout))
+    for key, value in report.items():
+        print(f"{key:>20}: {value}")
+    return 0 if report['status'].get(200) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
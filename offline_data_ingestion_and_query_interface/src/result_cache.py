@@ -0,0 +1,145 @@
+"""
+NL2SQL 执行结果缓存。
+键 = 归一化 SQL（忽略空白、大小写、反引号，字符串字面量保持原样）+ 所引用各表的数据版本
+（schema 中的 source_file_hash 与 schema 文件 mtime）。重新导入或清理会改写/删除 schema，
+版本随之变化，跨进程也能自动失效；同进程内 data_persistent / cleanup 另会主动调用 invalidate_tables。
+按 LRU 淘汰，总占用不超过内存上限。
+"""
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from offline_data_ingestion_and_query_interface.src.log_service import logger
+
+
+RESULT_CACHE_ENABLED = os.getenv("SQL_RESULT_CACHE", "1").lower() not in ("0", "false", "no")
+# 缓存内存上限（MB）
+RESULT_CACHE_MAX_MB = float(os.getenv("SQL_RESULT_CACHE_MB", "64"))
+
+_LITERAL_PATTERN = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL：代码部分去反引号、压缩空白、转小写，去掉结尾分号；字符串字面量不变。"""
+    parts = _LITERAL_PATTERN.split(sql.strip().rstrip(';').strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            normalized.append(part)
+            continue
+        part = part.replace('`', '')
+        part = re.sub(r'\s+', ' ', part).lower()
+        # 去掉运算符、括号与逗号两侧的空白，使 "a=1" 与 "a = 1" 相同
+        part = re.sub(r'\s*([=<>!,()+\-*/])\s*', r'\1', part)
+        normalized.append(part)
+    return ''.join(normalized).strip()
+
+
+def referenced_tables(normalized_sql: str, table_versions: Dict[str, tuple]) -> Dict[str, tuple]:
+    """从候选表中找出归一化 SQL 实际引用的表。"""
+    result = {}
+    for table_name, version in table_versions.items():
+        if re.search(rf'(?<![\w]){re.escape(table_name.lower())}(?![\w])', normalized_sql):
+            result[table_name] = version
+    return result
+
+
+class SQLResultCache:
+    """线程安全的 LRU 结果缓存，按条目估算字节数控制总内存。"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, Tuple[object, int, frozenset]]" = OrderedDict()
+        self._by_table: Dict[str, set] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(sql: str, table_versions: Dict[str, tuple]) -> Optional[tuple]:
+        """生成缓存键；SQL 未引用任何已知表时返回 None（无法判断数据版本，不缓存）。"""
+        normalized = normalize_sql(sql)
+        tables = referenced_tables(normalized, table_versions)
+        if not tables:
+            return None
+        return (normalized, tuple(sorted(tables.items())))
+
+    def get(self, key: Optional[tuple]):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Optional[tuple], value) -> None:
+        if key is None:
+            return
+        size = sys.getsizeof(value) + sys.getsizeof(key[0]) + 64 * len(key[1])
+        if size > self.max_bytes:
+            return
+        tables = frozenset(name for name, _ in key[1])
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, tables)
+            self._bytes += size
+            for name in tables:
+                self._by_table.setdefault(name, set()).add(key)
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: tuple) -> None:
+        _, size, tables = self._entries.pop(key)
+        self._bytes -= size
+        for name in tables:
+            keys = self._by_table.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[name]
+
+    def invalidate_tables(self, table_names: Iterable[str]) -> int:
+        """删除引用了指定表的全部条目，返回删除条数。"""
+        removed = 0
+        with self._lock:
+            for name in table_names:
+                for key in list(self._by_table.get(name, ())):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        if removed:
+            logger.info(f"结果缓存失效: tables={list(table_names)}, entries={removed}")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+sql_result_cache = SQLResultCache(int(RESULT_CACHE_MAX_MB * 1024 * 1024))
+
+
+def invalidate_tables(table_names: Iterable[str]) -> int:
+    """供 data_persistent / cleanup 调用的失效入口。"""
+    return sql_result_cache.invalidate_tables(list(table_names))
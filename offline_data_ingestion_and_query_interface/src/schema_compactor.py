@@ -0,0 +1,180 @@
+"""
+NL2SQL 提示的 schema 压缩：
+- 按 table_name 去重（TableRAG 会为同一张表发送多个别名）；
+- 以类 DDL 的紧凑形式渲染，列注释中带样例值与列统计摘要；
+- 超出 token 预算时按与问题的词面相关度裁剪列，并报告节省的 token 数。
+"""
+import ast
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken  # type: ignore
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+# schema 部分的 token 预算，<= 0 表示不裁剪列
+SCHEMA_TOKEN_BUDGET = int(os.getenv("NL2SQL_SCHEMA_TOKEN_BUDGET", "3000"))
+# 裁剪时每张表至少保留的列数
+MIN_COLUMNS_PER_TABLE = int(os.getenv("NL2SQL_MIN_COLUMNS_PER_TABLE", "4"))
+
+_CJK_PATTERN = re.compile(r'[一-鿿]')
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+_KEY_COLUMN_PATTERN = re.compile(r'(^|_)(id|code|no|key|date|year|month|name)(_\d+)?$')
+_SAMPLE_PREFIX = 'sample values:'
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：有 tiktoken 时精确计算，否则中文按 1 字 1 token、其余按 4 字符 1 token 估算。"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _terms(text: str) -> set:
+    """词面切分：英文/数字按词，中文按单字与相邻二字组合。"""
+    text = str(text).lower()
+    terms = set(_WORD_PATTERN.findall(text))
+    chars = _CJK_PATTERN.findall(text)
+    terms.update(chars)
+    terms.update(a + b for a, b in zip(chars, chars[1:]))
+    return terms
+
+
+def dedupe_schemas(schema_list: List[dict]) -> List[dict]:
+    """按 table_name 去重并保持原顺序。"""
+    seen = set()
+    result = []
+    for schema in schema_list:
+        name = schema.get('table_name')
+        if name in seen:
+            continue
+        seen.add(name)
+        result.append(schema)
+    return result
+
+
+def _samples_of(column: list) -> List[str]:
+    if len(column) < 3 or not isinstance(column[2], str):
+        return []
+    text = column[2][len(_SAMPLE_PREFIX):] if column[2].startswith(_SAMPLE_PREFIX) else column[2]
+    try:
+        values = ast.literal_eval(text)
+    except Exception:
+        return [text]
+    return [str(v) for v in values if v != 'no sample values available']
+
+
+def _column_comment(column: list, stats: Optional[dict]) -> str:
+    parts = []
+    samples = _samples_of(column)
+    if samples:
+        parts.append('e.g. ' + ', '.join(samples))
+    if stats:
+        if stats.get('null_ratio'):
+            parts.append(f"null {stats['null_ratio']:.0%}")
+        if stats.get('distinct') is not None:
+            parts.append(f"distinct {'~' if stats.get('distinct_estimated') else ''}{stats['distinct']}")
+        if 'min' in stats:
+            parts.append(f"range {stats['min']}..{stats['max']}")
+        top = [str(v) for v, _ in stats.get('top_values', [])[:3]]
+        if top:
+            parts.append('top ' + ', '.join(top))
+    return '; '.join(parts)
+
+
+def _column_score(column: list, stats: Optional[dict], query_terms: set) -> float:
+    """列与问题的词面相关度：列名命中权重最高，样例值/高频值命中次之，键列略加分。"""
+    name = str(column[0])
+    score = 3.0 * len(_terms(name) & query_terms)
+    values = ' '.join(_samples_of(column))
+    if stats:
+        values += ' ' + ' '.join(str(v) for v, _ in stats.get('top_values', []))
+    score += len(_terms(values) & query_terms)
+    if _KEY_COLUMN_PATTERN.search(name.lower()):
+        score += 0.5
+    return score
+
+
+def render_table(schema: dict, keep: Optional[set] = None) -> str:
+    """渲染单表为类 DDL 文本；keep 为保留的列下标集合，None 表示全部保留。"""
+    columns = schema.get('column_list', [])
+    stats = schema.get('column_stats') or {}
+    header = f"-- file: {schema.get('original_filename', '')}"
+    if schema.get('sheet_name') is not None:
+        header += f", sheet: {schema['sheet_name']}"
+    lines = [header, f"CREATE TABLE `{schema.get('table_name')}` ("]
+    kept = [i for i in range(len(columns)) if keep is None or i in keep]
+    for pos, i in enumerate(kept):
+        column = columns[i]
+        comma = ',' if pos < len(kept) - 1 else ''
+        comment = _column_comment(column, stats.get(column[0]))
+        line = f"  `{column[0]}` {column[1] if len(column) > 1 else ''}{comma}"
+        lines.append(f"{line} -- {comment}" if comment else line)
+    omitted = len(columns) - len(kept)
+    if omitted:
+        lines.append(f"  -- {omitted} more columns omitted")
+    lines.append(");")
+    return '\n'.join(lines)
+
+
+def compact_schemas(schema_list: List[dict], query: str, token_budget: int = None) -> Tuple[str, Dict[str, int]]:
+    """
+    生成紧凑 schema 文本。
+    返回 (文本, 报告)，报告包含原始 JSON 形式与压缩后的 token 估算、节省量与裁掉的列数。
+    """
+    token_budget = SCHEMA_TOKEN_BUDGET if token_budget is None else token_budget
+    original_payload = [{k: v for k, v in s.items() if k != 'column_stats'} for s in schema_list]
+    original_tokens = estimate_tokens(json.dumps(original_payload, ensure_ascii=False))
+
+    schemas = dedupe_schemas(schema_list)
+    rendered = [render_table(s) for s in schemas]
+    keeps: List[Optional[set]] = [None] * len(schemas)
+    dropped = 0
+
+    if token_budget > 0 and sum(estimate_tokens(t) for t in rendered) > token_budget:
+        query_terms = _terms(query)
+        # 每表保留得分最高的若干列，其余列按全局得分依次加入，直到用完预算
+        candidates = []
+        keeps = []
+        for t, schema in enumerate(schemas):
+            columns = schema.get('column_list', [])
+            stats = schema.get('column_stats') or {}
+            ranked = sorted(range(len(columns)),
+                            key=lambda i: (-_column_score(columns[i], stats.get(columns[i][0]), query_terms), i))
+            keeps.append(set(ranked[:MIN_COLUMNS_PER_TABLE]))
+            for i in ranked[MIN_COLUMNS_PER_TABLE:]:
+                candidates.append((_column_score(columns[i], stats.get(columns[i][0]), query_terms), t, i))
+        candidates.sort(key=lambda x: -x[0])
+
+        costs = [estimate_tokens(render_table(s, keeps[t])) for t, s in enumerate(schemas)]
+        used = sum(costs)
+        for _, t, i in candidates:
+            columns = schemas[t]['column_list']
+            stats = schemas[t].get('column_stats') or {}
+            line = f"  `{columns[i][0]}` {columns[i][1]}, -- {_column_comment(columns[i], stats.get(columns[i][0]))}"
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                dropped += 1
+                continue
+            keeps[t].add(i)
+            used += cost
+        rendered = [render_table(s, keeps[t]) for t, s in enumerate(schemas)]
+
+    text = '\n\n'.join(rendered)
+    compact_tokens = estimate_tokens(text)
+    report = {
+        'tables': len(schemas),
+        'columns_dropped': dropped,
+        'original_tokens': original_tokens,
+        'compact_tokens': compact_tokens,
+        'tokens_saved': original_tokens - compact_tokens,
+    }
+    return text, report
@@ -3,10 +3,48 @@ import re
 import json
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from .log_service import logger
 from .prompt import *
 from .handle_requests import get_llm_response
 from .common_utils import transfer_name, SCHEMA_DIR, sql_alchemy_helper
+from .index_advisor import hot_column_tracker
+from .schema_compactor import compact_schemas
+from .result_cache import RESULT_CACHE_ENABLED, sql_result_cache
+from .sql_alchemy_helper import reject_standalone_duckdb
+
+# 为 1 时以紧凑的类 DDL 形式（去重 + 按 token 预算裁剪列）提供 schema，为 0 时沿用完整 JSON
+SCHEMA_COMPACT_ENABLED = os.getenv("NL2SQL_SCHEMA_COMPACT", "1").lower() not in ("0", "false", "no")
+# 批量接口：并发 LLM 调用数、单批最大条目数
+BATCH_CONCURRENCY = int(os.getenv("NL2SQL_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("NL2SQL_BATCH_MAX_ITEMS", "64"))
+# 同时执行的 SQL 数，默认与 MySQL 连接池大小一致，避免并发请求挤占溢出连接
+_sql_slots = threading.BoundedSemaphore(int(os.getenv("SQL_MAX_CONCURRENT_QUERIES", "10")))
+# 调用方通过该请求头传入剩余时间（毫秒），LLM 超时与重试以此为上限
+DEADLINE_HEADER = 'X-Deadline-Ms'
+
+
+def check_standalone_backend():
+    """独立 SQL 服务（interface.py / asgi_app）启动时调用；同一进程内（inproc）调用本模块时不检查。"""
+    reject_standalone_duckdb(sql_alchemy_helper.dialect)
+
+
+def deadline_from_header(value):
+    """将 X-Deadline-Ms 请求头转换为 time.monotonic() 截止时间；缺失或非法时返回 None。"""
+    try:
+        return time.monotonic() + max(0.0, float(value)) / 1000.0 if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def deadline_exceeded(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _deadline_error(query):
+    logger.error(f"Deadline exceeded for query: {query}")
+    return {'error': 'Deadline exceeded', 'query': query}
 
 
 def find_actual_schema_file(base_table_name):
@@ -32,6 +70,52 @@ def find_actual_schema_file(base_table_name):
     return None
 
 
+def find_actual_schema_files(table_name):
+    """
+    查找表名对应的全部 schema 文件：先精确匹配 table_name.json，再按转换后的基础表名前缀匹配；
+    同一工作簿的其他工作表（original_filename 相同）也一并返回，使多工作表可联合查询。
+
+    Args:
+        table_name (str): 原始表名/别名
+
+    Returns:
+        list: schema 文件名列表，找不到时为空列表
+    """
+    if not os.path.exists(SCHEMA_DIR):
+        return []
+
+    if os.path.basename(table_name) == table_name and os.path.exists(os.path.join(SCHEMA_DIR, table_name + '.json')):
+        first = table_name + '.json'
+    else:
+        first = find_actual_schema_file(transfer_name(table_name))
+    if first is None:
+        return []
+
+    try:
+        with open(os.path.join(SCHEMA_DIR, first), 'r', encoding='utf-8') as f:
+            original_filename = json.load(f).get('original_filename')
+    except Exception:
+        original_filename = None
+    result = [first]
+    if not original_filename:
+        return result
+
+    base_table_name = transfer_name(original_filename)
+    for filename in sorted(os.listdir(SCHEMA_DIR)):
+        if filename == first or not filename.endswith('.json'):
+            continue
+        if not filename.startswith(base_table_name + '_'):
+            continue
+        try:
+            with open(os.path.join(SCHEMA_DIR, filename), 'r', encoding='utf-8') as f:
+                sibling = json.load(f)
+        except Exception:
+            continue
+        if sibling.get('original_filename') == original_filename and sibling.get('sheet_name') is not None:
+            result.append(filename)
+    return result
+
+
 def extract_sql_statement(resp_content):  
     """
     从响应内容中提取SQL语句。
@@ -57,61 +141,101 @@ def extract_sql_statement(resp_content):
         return None
     
 
-def process_tablerag_request(table_name_list, query):
+def load_schema_list(table_name_list, schema_cache=None):
     """
-    Process the request for TableRAG.
-    
+    解析表名列表对应的全部 schema。
+
     Args:
-        table_name_list (list): List of table names related to the query.
-        query (str): The query string to be processed.
-    
+        table_name_list (list): 表名/别名列表
+        schema_cache (dict): 可选，批量请求内共享的 {schema 文件名: (schema_dict, 数据版本)}，避免重复读文件
+
     Returns:
-        str: A mock response for demonstration purposes.
+        tuple: (schema_list, table_versions)，table_versions 为 table_name -> (source_file_hash, schema mtime)，
+        作为结果缓存的数据版本
     """
-    # Here you would implement the actual logic to process the request
-    # For demonstration, we will just return a mock response
-
     schema_list = []
+    table_versions = {}
+    loaded_files = set()
     for table_name in table_name_list:
-        # 转换表名
-        converted_table_name = transfer_name(table_name)
-        
-        # 查找实际的schema文件
-        actual_filename = find_actual_schema_file(converted_table_name)
-        
-        if actual_filename is None:
-            logger.error(f"Schema file not found for table: {converted_table_name}")
-            continue
-            
-        schema_path = os.path.join(SCHEMA_DIR, actual_filename)
-        
-        try:
-            schema_dict = json.load(open(schema_path, 'r', encoding='utf-8'))
-            schema_list.append(schema_dict)
-        except Exception as e:
-            logger.error(f"Failed to load schema file {schema_path}: {e}")
+        # 查找实际的schema文件（多工作表工作簿会返回全部工作表）
+        actual_filenames = find_actual_schema_files(table_name)
+
+        if not actual_filenames:
+            logger.error(f"Schema file not found for table: {transfer_name(table_name)}")
             continue
+
+        for actual_filename in actual_filenames:
+            if actual_filename in loaded_files:
+                continue
+            if schema_cache is not None and actual_filename in schema_cache:
+                schema_dict, version = schema_cache[actual_filename]
+                schema_list.append(schema_dict)
+                table_versions[schema_dict.get('table_name')] = version
+                loaded_files.add(actual_filename)
+                continue
+            schema_path = os.path.join(SCHEMA_DIR, actual_filename)
+
+            try:
+                schema_dict = json.load(open(schema_path, 'r', encoding='utf-8'))
+                version = (schema_dict.get('source_file_hash'), os.stat(schema_path).st_mtime_ns)
+                schema_list.append(schema_dict)
+                table_versions[schema_dict.get('table_name')] = version
+                loaded_files.add(actual_filename)
+                if schema_cache is not None:
+                    schema_cache[actual_filename] = (schema_dict, version)
+            except Exception as e:
+                logger.error(f"Failed to load schema file {schema_path}: {e}")
+                continue
+    return schema_list, table_versions
+
+
+def prepare_nl2sql(table_name_list, query, loaded_schemas=None):
+    """
+    NL2SQL 的准备阶段：解析 schema 并生成提示。
+
+    Returns:
+        tuple: (context, error_dict)；失败时 context 为 None
+    """
+    if loaded_schemas is None:
+        loaded_schemas = load_schema_list(table_name_list)
+    schema_list, table_versions = loaded_schemas
     
     if not schema_list:
         logger.error("No valid schema files found")
-        return {
+        return None, {
             'error': 'No valid schema files found',
             'query': query
         }
     
+    compaction_report = None
+    if SCHEMA_COMPACT_ENABLED:
+        schema_text, compaction_report = compact_schemas(schema_list, query)
+        logger.info(f"Schema compaction: {compaction_report}")
+    else:
+        # 列统计体积较大，不原样放进 NL2SQL 提示
+        schema_text = json.dumps([{k: v for k, v in s.items() if k != 'column_stats'} for s in schema_list],
+                                 ensure_ascii=False)
+
     nl2sql_prompt = NL2SQL_USER_PROMPT.format(
-        schema_list=json.dumps(schema_list, ensure_ascii=False),
+        schema_list=schema_text,
         user_query=query
     )
+    context = {
+        'query': query,
+        'nl2sql_prompt': nl2sql_prompt,
+        'table_versions': table_versions,
+        'compaction_report': compaction_report
+    }
+    return context, None
 
-    nl2sql_start_time = time.time()
-    resp_content = get_llm_response(
-        system_prompt=NL2SQL_SYSTEM_PROMPT,
-        user_prompt=nl2sql_prompt
-    )
-    nl2sql_end_time = time.time()
-    nl2sql_time_cusumed = nl2sql_end_time - nl2sql_start_time
 
+def finish_nl2sql(context, resp_content, nl2sql_time_cusumed, deadline=None):
+    """
+    NL2SQL 的收尾阶段：从模型响应中提取 SQL 并执行（命中结果缓存时直接返回）；已超过 deadline 时不再执行。
+    """
+    query = context['query']
+    if deadline_exceeded(deadline):
+        return _deadline_error(query)
     sql_str = extract_sql_statement(resp_content)
     if not sql_str:
         return {
@@ -121,8 +245,18 @@ def process_tablerag_request(table_name_list, query):
         }
 
     sql_excution_start_time = time.time()
+    cache_key = sql_result_cache.make_key(sql_str, context['table_versions']) if RESULT_CACHE_ENABLED else None
+    sql_excution_result = sql_result_cache.get(cache_key)
+    cache_hit = sql_excution_result is not None
     try:
-        sql_excution_result = sql_alchemy_helper.fetchall(sql_str)
+        if not cache_hit:
+            with _sql_slots:
+                sql_excution_result = sql_alchemy_helper.fetchall(sql_str)
+            logger.info(f"Executed SQL: {' '.join(sql_str.split())}")
+            sql_result_cache.put(cache_key, sql_excution_result)
+        # 成功执行或命中缓存（缓存中只有成功的结果）都计入热点统计，谓词中的热点列会在后台补建索引；
+        # 否则最常重复的查询一直命中缓存，永远不会被计数
+        hot_column_tracker.record(sql_str, context['table_versions'])
     except Exception as e:
         logger.error(f"SQL execution failed: {e}")
         sql_excution_result = f"SQL execution failed: {str(e)}"
@@ -134,13 +268,122 @@ def process_tablerag_request(table_name_list, query):
 
     res_dict = {
         'query': query,
-        'nl2sql_prompt': nl2sql_prompt,
+        'nl2sql_prompt': context['nl2sql_prompt'],
         'nl2sql_response': resp_content,
         'sql_str': sql_str,
         'sql_execution_result': sql_excution_result,
-        'time_consumed': time_consumed_str
+        'time_consumed': time_consumed_str,
+        'sql_cache_hit': cache_hit
     }
+    if context['compaction_report'] is not None:
+        res_dict['schema_compaction'] = context['compaction_report']
     return res_dict
+
+
+def process_tablerag_request(table_name_list, query, loaded_schemas=None, deadline=None):
+    """
+    Process the request for TableRAG.
+    
+    Args:
+        table_name_list (list): List of table names related to the query.
+        query (str): The query string to be processed.
+        loaded_schemas (tuple): Optional (schema_list, table_versions) already resolved by the caller,
+            used by the batch endpoint to share schema resolution across items.
+        deadline (float): Optional time.monotonic() deadline; LLM timeouts/retries are capped by it
+            and no further work is done once it has passed.
     
+    Returns:
+        dict: NL2SQL prompt/response, generated SQL, execution result and timings.
+    """
+    if deadline_exceeded(deadline):
+        return _deadline_error(query)
+    context, error_dict = prepare_nl2sql(table_name_list, query, loaded_schemas)
+    if context is None:
+        return error_dict
 
-        
+    nl2sql_start_time = time.time()
+    resp_content = get_llm_response(
+        system_prompt=NL2SQL_SYSTEM_PROMPT,
+        user_prompt=context['nl2sql_prompt'],
+        deadline=deadline
+    )
+    nl2sql_end_time = time.time()
+    nl2sql_time_cusumed = nl2sql_end_time - nl2sql_start_time
+
+    return finish_nl2sql(context, resp_content, nl2sql_time_cusumed, deadline)
+
+
+def parse_batch_items(json_body):
+    """
+    校验批量请求体 {"items": [{"table_name_list": [...], "query": "..."}], "table_name_list": [...]}，
+    顶层 table_name_list 作为未单独指定表名的条目的默认值。
+
+    Returns:
+        tuple: (items, error_message)；校验失败时 items 为 None
+    """
+    if not json_body or not isinstance(json_body.get('items'), list) or not json_body['items']:
+        return None, 'Invalid input'
+    if len(json_body['items']) > BATCH_MAX_ITEMS:
+        return None, f'Too many items, max {BATCH_MAX_ITEMS}'
+
+    default_table_name_list = json_body.get('table_name_list')
+    items = []
+    for item in json_body['items']:
+        if not isinstance(item, dict) or 'query' not in item:
+            return None, 'Invalid input'
+        table_name_list = item.get('table_name_list', default_table_name_list)
+        if not isinstance(table_name_list, list):
+            return None, 'Invalid input'
+        items.append({'table_name_list': table_name_list, 'query': item['query']})
+    return items, None
+
+
+def resolve_batch_schemas(items):
+    """相同表名列表的条目共享一次 schema 解析，返回 {tuple(table_name_list): (schema_list, table_versions)}。"""
+    schema_cache = {}
+    resolved = {}
+    for item in items:
+        key = tuple(item['table_name_list'])
+        if key not in resolved:
+            resolved[key] = load_schema_list(item['table_name_list'], schema_cache)
+    return resolved
+
+
+def process_tablerag_batch(items, deadline=None):
+    """
+    批量处理 NL2SQL 请求：相同表名列表的条目共享一次 schema 解析，LLM 调用按 BATCH_CONCURRENCY 并发，
+    SQL 经共享连接池执行。
+
+    Args:
+        items (list): [{'table_name_list': [...], 'query': '...'}, ...]
+        deadline (float): Optional time.monotonic() deadline shared by all items
+
+    Returns:
+        dict: results 与 items 一一对应，每项附带 elapsed_seconds；另含批次总耗时
+    """
+    batch_start_time = time.time()
+    resolved = resolve_batch_schemas(items)
+
+    def run_item(item):
+        item_start_time = time.time()
+        try:
+            res_dict = process_tablerag_request(item['table_name_list'], item['query'],
+                                                loaded_schemas=resolved[tuple(item['table_name_list'])],
+                                                deadline=deadline)
+        except Exception as e:
+            logger.error(f"Batch item failed: query={item['query']}, error={e}")
+            res_dict = {'error': str(e), 'query': item['query']}
+        res_dict['elapsed_seconds'] = round(time.time() - item_start_time, 3)
+        return res_dict
+
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_CONCURRENCY, len(items)))) as executor:
+        results = list(executor.map(run_item, items))
+
+    batch_elapsed = time.time() - batch_start_time
+    logger.info(f"Batch NL2SQL: items={len(items)}, schema_groups={len(resolved)}, elapsed={batch_elapsed:.2f}s")
+    return {
+        'results': results,
+        'count': len(results),
+        'schema_groups': len(resolved),
+        'elapsed_seconds': round(batch_elapsed, 3)
+    }
@@ -0,0 +1,190 @@
+"""
+列式快照：导入时为每张表写一份 Parquet 文件（与 schema JSON 并列），
+下游的 Markdown 渲染、切块、统计与重建都读取可内存映射的快照，不再重新解析工作簿。
+快照列名与数据库表一致（清洗后列名），原始表头记录在 Parquet 元数据中。
+"""
+import argparse
+import json
+import os
+from typing import List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from offline_data_ingestion_and_query_interface.src.common_utils import PROJECT_ROOT, SCHEMA_DIR, sql_alchemy_helper
+from offline_data_ingestion_and_query_interface.src.log_service import logger
+from offline_data_ingestion_and_query_interface.src.sql_alchemy_helper import stringify_mixed_columns
+
+
+# 快照目录，默认与 schema 目录同级（data/snapshots），在线侧按同样规则定位
+SNAPSHOT_DIR = os.getenv("TABLE_SNAPSHOT_DIR") or os.path.join(PROJECT_ROOT, 'data', 'snapshots')
+SNAPSHOT_ENABLED = os.getenv("TABLE_SNAPSHOT_ENABLED", "1").lower() not in ("0", "false", "no")
+ORIGINAL_COLUMNS_KEY = b'tablerag.original_columns'
+
+
+def snapshots_available() -> bool:
+    return SNAPSHOT_ENABLED and pq is not None
+
+
+def snapshot_file_name(table_name: str) -> str:
+    return f"{table_name}.parquet"
+
+
+def snapshot_path(table_name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, snapshot_file_name(table_name))
+
+
+def _to_arrow(df: pd.DataFrame, original_columns: Optional[List[str]], schema=None):
+    table = pa.Table.from_pandas(stringify_mixed_columns(df), schema=schema, preserve_index=False)
+    if schema is None:
+        # 首块中全空的列会被推断为 null 类型，后续块出现字符串时无法写入，统一放宽为 string
+        fields = [pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema]
+        if any(pa.types.is_null(f.type) for f in table.schema):
+            table = table.cast(pa.schema(fields, metadata=table.schema.metadata))
+    if original_columns is not None:
+        metadata = dict(table.schema.metadata or {})
+        metadata[ORIGINAL_COLUMNS_KEY] = json.dumps([str(c) for c in original_columns], ensure_ascii=False).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+    return table
+
+
+class SnapshotWriter:
+    """
+    分块写入单表快照，每次 write() 追加一个 row group；close() 后原子替换正式文件。
+    首块确定 Arrow schema，后续块按同一 schema 转换（流式导入时各块 dtype 已统一）。
+    """
+
+    def __init__(self, table_name: str, original_columns: Optional[List[str]] = None) -> None:
+        self.table_name = table_name
+        self.path = snapshot_path(table_name)
+        self.tmp_path = self.path + '.tmp'
+        self.original_columns = original_columns
+        self._writer = None
+        self._schema = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        table = _to_arrow(df, self.original_columns, self._schema)
+        if self._writer is None:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression='zstd')
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self) -> str:
+        if self._writer is None:
+            return None
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        logger.info(f"快照已写入: table={self.table_name}, rows={self.rows}, path={self.path}")
+        return self.path
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def write_snapshot(df: pd.DataFrame, table_name: str, original_columns: Optional[List[str]] = None) -> Optional[str]:
+    """整表写快照，返回快照路径；未安装 pyarrow 或已关闭快照时返回 None。"""
+    if not snapshots_available():
+        return None
+    writer = SnapshotWriter(table_name, original_columns)
+    try:
+        writer.write(df)
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def read_snapshot(table_name: str = None, path: str = None, columns: Optional[List[str]] = None,
+                  max_rows: Optional[int] = None) -> pd.DataFrame:
+    """以内存映射方式读取快照；max_rows 只读取前若干行。"""
+    path = path or snapshot_path(table_name)
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    if max_rows is None:
+        return parquet_file.read(columns=columns).to_pandas()
+    batches = []
+    remaining = max_rows
+    for batch in parquet_file.iter_batches(columns=columns, batch_size=min(max_rows, 65536)):
+        batches.append(batch.slice(0, remaining))
+        remaining -= min(remaining, batch.num_rows)
+        if remaining <= 0:
+            break
+    if not batches:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return pa.Table.from_batches(batches).to_pandas()
+
+
+def remove_snapshot(table_name: str) -> bool:
+    path = snapshot_path(table_name)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
+
+
+def restore_tables_from_snapshots(table_names: Optional[List[str]] = None) -> List[str]:
+    """用快照重建当前执行后端中的表（如切换后端或库被清空后），无需重新解析原始文件。"""
+    restored = []
+    for file_name in sorted(os.listdir(SCHEMA_DIR)) if os.path.isdir(SCHEMA_DIR) else []:
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(SCHEMA_DIR, file_name), 'r', encoding='utf-8') as f:
+                schema = json.load(f)
+        except Exception as e:
+            logger.error(f"读取 schema 失败: {file_name}, error={e}")
+            continue
+        table_name = schema.get('table_name')
+        if table_names and table_name not in table_names:
+            continue
+        path = os.path.join(SNAPSHOT_DIR, schema.get('snapshot_file') or snapshot_file_name(table_name))
+        if not os.path.exists(path):
+            continue
+        load_snapshot_into_backend(table_name, path)
+        restored.append(table_name)
+    return restored
+
+
+def load_snapshot_into_backend(table_name: str, path: str) -> None:
+    """DuckDB 后端直接建立指向快照的视图（零拷贝）；其他后端分批写入。"""
+    if sql_alchemy_helper.dialect == 'duckdb':
+        sql_alchemy_helper.attach_parquet(table_name, path)
+        return
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    first = True
+    for batch in parquet_file.iter_batches(batch_size=50000):
+        sql_alchemy_helper.insert_dataframe_batch(batch.to_pandas(), table_name, if_exists='replace' if first else 'append')
+        first = False
+    if first:
+        sql_alchemy_helper.insert_dataframe_batch(parquet_file.schema_arrow.empty_table().to_pandas(), table_name)
+    logger.info(f"已由快照重建表: {table_name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild database tables from Parquet snapshots.")
+    parser.add_argument('--table', action='append', default=[], help='Table name to restore (repeatable); default all')
+    args = parser.parse_args()
+    if not snapshots_available():
+        print("pyarrow is not installed or snapshots are disabled.")
+        return 2
+    restored = restore_tables_from_snapshots(args.table or None)
+    print(f"Restored {len(restored)} tables: {restored}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
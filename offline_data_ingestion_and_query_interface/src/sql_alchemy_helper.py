@@ -1,6 +1,7 @@
+import os
+import threading
 import pandas as pd
-import pymysql
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 import math
 import json
 
@@ -8,6 +9,27 @@ from decimal import Decimal
 from datetime import date, datetime
 import uuid
 
+try:
+    from .sql_dialect import translate_mysql
+except ImportError:
+    from sql_dialect import translate_mysql
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# fetchall 返回给 NL2SQL 调用方的结果字符串上限
+RESULT_MAX_CHARS = 1000
+# 多表 DROP 单条语句包含的表数上限
+DROP_BATCH_SIZE = int(os.getenv("SQL_DROP_BATCH_SIZE", "200"))
+# DuckDB 数据库文件由单个进程独占（读写连接与只读连接跨进程互斥），只支持以下部署方式
+DUCKDB_DEPLOYMENT_HINT = (
+    "duckdb 后端只能由单个进程打开：以单 worker 运行 apiserve 并设置 SQL_SERVICE_TRANSPORT=inproc，"
+    "由它同时负责导入与查询；不要另外启动独立的 SQL 服务（interface.py / asgi_app），"
+    "需要多进程部署时请改用 mysql 后端"
+)
+
 def default_serializer(obj):
     if isinstance(obj, Decimal):
         return float(obj)
@@ -19,8 +41,37 @@ def default_serializer(obj):
         return obj.decode(errors='replace')  # 或使用 base64 编码
     raise TypeError(f"Type {type(obj)} not serializable")
 
+def stringify_mixed_columns(df):
+    """混合类型的 object 列统一转为字符串（空值保留为 None），列式存储要求单列类型一致"""
+    converted = None
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ('string', 'empty'):
+            if converted is None:
+                converted = df.copy()
+            converted[col] = df[col].map(lambda v: None if pd.isna(v) else str(v))
+    return df if converted is None else converted
+
+
+def _format_rows(json_result):
+    json_result_str = json.dumps(json_result, ensure_ascii=False,  default=default_serializer)
+
+    if len(json_result_str) > RESULT_MAX_CHARS:
+        return json_result_str[:RESULT_MAX_CHARS]
+    else:
+        return json_result_str
+
+
 class SQL_Alchemy_Helper:
-    def __init__(self, config):
+    """
+    基于 SQLAlchemy 的执行后端，支持 MySQL（默认）与 SQLite。
+    NL2SQL 生成的是 MySQL 方言，非 MySQL 后端在 fetchall 前自动翻译。
+    """
+    def __init__(self, config, backend='mysql', sqlite_path=None):
+        self.backend = backend
+        if backend == 'sqlite':
+            self.engine = create_engine(f'sqlite:///{sqlite_path}', connect_args={'check_same_thread': False})
+            return
+
         user = config["user"]
         password = config["password"]
         host = config["host"]
@@ -36,6 +87,13 @@ class SQL_Alchemy_Helper:
             max_overflow=20
         )
 
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    def quote_identifier(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
     def execute_sql(self, sql, args=None):
         """
         执行 insert/update/delete
@@ -45,20 +103,15 @@ class SQL_Alchemy_Helper:
 
     def fetchall(self, sql, args=None):
         """
-        执行 select 查询
+        执行 select 查询（MySQL 方言，必要时翻译为当前后端方言）
         """
+        sql = translate_mysql(sql, self.dialect)
         with self.engine.connect() as conn:
             result = conn.execute(text(sql), args or {})
             rows = result.fetchall()
 
             json_result = [dict(row._mapping) for row in rows]
-
-            json_result_str = json.dumps(json_result, ensure_ascii=False,  default=default_serializer)
-
-            if len(json_result_str) > 1000:
-                return json_result_str[:1000]
-            else:
-                return json_result_str
+            return _format_rows(json_result)
 
     def fetch_dataframe(self, sql, args=None):
         """
@@ -68,8 +121,231 @@ class SQL_Alchemy_Helper:
             df = pd.read_sql(text(sql), conn, params=args)
             return df
 
-    def insert_dataframe_batch(self, df, table_name, batch_size=1000):
+    def insert_dataframe_batch(self, df, table_name, batch_size=1000, if_exists='replace'):
+        """
+        DataFrame 批量插入；分块写入同一张表时，首块用 replace，后续块用 append
+        """
+        df.to_sql(table_name, self.engine, index=False, if_exists=if_exists, chunksize=batch_size, method='multi')
+
+    def list_tables(self):
+        return inspect(self.engine).get_table_names()
+
+    def get_columns(self, table_name):
+        """返回 {列名: 类型字符串}"""
+        return {c["name"]: str(c["type"]) for c in inspect(self.engine).get_columns(table_name)}
+
+    def get_index_columns(self, table_name):
+        """返回已有索引的首列集合"""
+        indexed = set()
+        for idx in inspect(self.engine).get_indexes(table_name):
+            columns = [c for c in idx.get("column_names") or [] if c]
+            if columns:
+                indexed.add(columns[0])
+        return indexed
+
+    def drop_table(self, table_name):
+        self.execute_sql(f"DROP TABLE IF EXISTS {self.quote_identifier(table_name)}")
+
+    def drop_tables(self, table_names, batch_size=DROP_BATCH_SIZE):
+        """
+        批量删表。MySQL/PostgreSQL 用一条 DROP TABLE IF EXISTS a, b, c（按 batch_size 分句）；
+        SQLite 不支持多表 DROP，在同一事务内逐表执行。
+        """
+        names = list(table_names)
+        with self.engine.begin() as conn:
+            if self.dialect == 'sqlite':
+                for name in names:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {self.quote_identifier(name)}"))
+                return
+            for i in range(0, len(names), batch_size):
+                quoted = ", ".join(self.quote_identifier(name) for name in names[i:i + batch_size])
+                conn.execute(text(f"DROP TABLE IF EXISTS {quoted}"))
+
+
+class DuckDB_Helper:
+    """
+    嵌入式 DuckDB 执行后端：列式存储 + 向量化执行，适合大表聚合，且无需单独部署数据库。
+    接口与 SQL_Alchemy_Helper 保持一致；每次调用使用独立 cursor，可在多线程中共享。
+    """
+    def __init__(self, database_path):
+        if duckdb is None:
+            raise ImportError("duckdb is not installed, run `pip install duckdb` to use the duckdb backend")
+        self.backend = 'duckdb'
+        self.database_path = database_path
+        try:
+            self._conn = duckdb.connect(database_path)
+        except duckdb.IOException as e:
+            # 文件锁被其他进程持有：多 worker、独立 SQL 服务或导入 CLI 与 apiserve 同时运行
+            raise RuntimeError(f"无法打开 DuckDB 数据库 {database_path}: {e}。{DUCKDB_DEPLOYMENT_HINT}") from e
+        # DDL 与写入串行化，避免并发导入时同一张表的 replace/append 交错
+        self._write_lock = threading.Lock()
+
+    @property
+    def dialect(self):
+        return 'duckdb'
+
+    def quote_identifier(self, name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def execute_sql(self, sql, args=None):
+        """
+        执行 insert/update/delete
+        """
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                cursor.execute(sql, args) if args else cursor.execute(sql)
+            finally:
+                cursor.close()
+
+    def fetchall(self, sql, args=None):
+        """
+        执行 select 查询（MySQL 方言，执行前翻译为 DuckDB 方言）
         """
-        DataFrame 批量插入
+        return _format_rows(self.fetch_dataframe(translate_mysql(sql, 'duckdb'), args).to_dict(orient='records'))
+
+    def fetch_dataframe(self, sql, args=None):
         """
-        df.to_sql(table_name, self.engine, index=False, if_exists='replace', chunksize=batch_size, method='multi')
\ No newline at end of file
+        查询结果转为 DataFrame
+        """
+        cursor = self._conn.cursor()
+        try:
+            result = cursor.execute(sql, args) if args else cursor.execute(sql)
+            df = result.fetchdf()
+        finally:
+            cursor.close()
+        # 与 SQLAlchemy 后端一致，空值以 None 返回
+        return df.astype(object).where(df.notna(), None)
+
+    def insert_dataframe_batch(self, df, table_name, batch_size=1000, if_exists='replace'):
+        """
+        DataFrame 整批写入（DuckDB 直接扫描 DataFrame，无需分块）；首块 replace，后续块 append
+        """
+        # 混合类型的 object 列统一转为字符串，避免 DuckDB 推断列类型失败
+        df = stringify_mixed_columns(df)
+        table = self.quote_identifier(table_name)
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                cursor.register('_incoming_df', df)
+                if if_exists == 'append':
+                    cursor.execute(f"INSERT INTO {table} SELECT * FROM _incoming_df")
+                else:
+                    cursor.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM _incoming_df")
+                cursor.unregister('_incoming_df')
+            finally:
+                cursor.close()
+
+    def _fetchall(self, sql, params=None):
+        """在独立游标上执行只读查询，用完即关闭"""
+        cursor = self._conn.cursor()
+        try:
+            return cursor.execute(sql, params or []).fetchall()
+        finally:
+            cursor.close()
+
+    def list_tables(self):
+        return [row[0] for row in self._fetchall(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' ORDER BY table_name"
+        )]
+
+    def get_columns(self, table_name):
+        """返回 {列名: 类型字符串}"""
+        rows = self._fetchall(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+            [table_name]
+        )
+        return {name: data_type for name, data_type in rows}
+
+    def get_index_columns(self, table_name):
+        """返回已有索引的首列集合"""
+        indexed = set()
+        rows = self._fetchall(
+            "SELECT expressions FROM duckdb_indexes() WHERE table_name = ?", [table_name]
+        )
+        for (expressions,) in rows:
+            if expressions:
+                first = expressions[0] if isinstance(expressions, list) else str(expressions).strip('[]').split(',')[0]
+                indexed.add(str(first).strip(" '\""))
+        return indexed
+
+    def attach_parquet(self, table_name, parquet_path):
+        """把表定义为指向 Parquet 快照的视图，查询时直接向量化扫描快照文件"""
+        path = os.path.abspath(parquet_path).replace("'", "''")
+        table = self.quote_identifier(table_name)
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                if self._table_type(cursor, table_name) == 'BASE TABLE':
+                    cursor.execute(f"DROP TABLE {table}")
+                cursor.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{path}')")
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _table_type(cursor, table_name):
+        row = cursor.execute(
+            "SELECT table_type FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [table_name]
+        ).fetchone()
+        return row[0] if row else None
+
+    def drop_table(self, table_name):
+        cursor = self._conn.cursor()
+        try:
+            kind = 'VIEW' if self._table_type(cursor, table_name) == 'VIEW' else 'TABLE'
+        finally:
+            cursor.close()
+        self.execute_sql(f"DROP {kind} IF EXISTS {self.quote_identifier(table_name)}")
+
+    def drop_tables(self, table_names, batch_size=DROP_BATCH_SIZE):
+        """批量删表：一次查询区分表与视图（快照视图），在同一事务内逐个 DROP。"""
+        names = list(table_names)
+        if not names:
+            return
+        with self._write_lock:
+            cursor = self._conn.cursor()
+            try:
+                views = {row[0] for row in cursor.execute(
+                    "SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' AND table_type = 'VIEW'"
+                ).fetchall()}
+                cursor.execute("BEGIN TRANSACTION")
+                try:
+                    for name in names:
+                        kind = 'VIEW' if name in views else 'TABLE'
+                        cursor.execute(f"DROP {kind} IF EXISTS {self.quote_identifier(name)}")
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                cursor.close()
+
+
+def resolve_backend(config):
+    """执行后端名：环境变量 SQL_BACKEND 优先，其次 database_config.json 的 backend 字段，默认 mysql。"""
+    return (os.getenv("SQL_BACKEND") or config.get("backend") or "mysql").lower()
+
+
+def reject_standalone_duckdb(backend):
+    """独立 SQL 服务进程启动时调用：duckdb 后端已由 apiserve 进程持有，拒绝启动。"""
+    if backend == 'duckdb':
+        raise RuntimeError(f"独立 SQL 服务不支持 duckdb 后端。{DUCKDB_DEPLOYMENT_HINT}")
+
+
+def create_sql_helper(config, data_dir):
+    """
+    按配置创建执行后端（见 resolve_backend）。
+    sqlite / duckdb 的数据库文件默认放在 data_dir 下，可用配置项 path 覆盖。
+    """
+    backend = resolve_backend(config)
+    if backend == 'mysql':
+        return SQL_Alchemy_Helper(config)
+    if backend == 'sqlite':
+        path = config.get("path") or os.path.join(data_dir, 'tablerag.sqlite')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQL_Alchemy_Helper(config, backend='sqlite', sqlite_path=path)
+    if backend == 'duckdb':
+        path = config.get("path") or os.path.join(data_dir, 'tablerag.duckdb')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return DuckDB_Helper(path)
+    raise ValueError(f"Unsupported SQL backend: {backend}")
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+MySQL 方言翻译：NL2SQL 提示要求模型生成 MySQL 语法，使用 DuckDB / SQLite 后端时在执行前翻译。
+优先使用 sqlglot（可选依赖）；未安装或翻译失败时回退到覆盖常见写法的规则翻译：
+反引号标识符、双引号字符串、LIMIT offset, n、DATE_FORMAT、YEAR/MONTH/DAY、NOW()、SHOW TABLES。
+"""
+import re
+from typing import List, Tuple
+
+try:
+    import sqlglot  # type: ignore
+except Exception:
+    sqlglot = None
+
+
+# MySQL DATE_FORMAT 与 strftime 格式符差异；一次扫描逐个替换，避免 %i→%M 的结果再被 %M 规则改写
+_DATE_FORMAT_MAPPING = {
+    '%M': '%B',  # 月份全名（strftime 的 %M 是分钟）
+    '%W': '%A',  # 星期全名（strftime 的 %W 是周数）
+    '%i': '%M',  # 分钟
+    '%s': '%S',  # 秒
+    '%c': '%m',
+    '%e': '%d',
+    '%k': '%H',
+}
+_DATE_FORMAT_TOKEN = re.compile(r'%.')
+
+_DATE_FORMAT_PATTERN = re.compile(r"\bDATE_FORMAT\(\s*([^,()]+?)\s*,\s*'([^']*)'\s*\)", re.IGNORECASE)
+_DATE_PART_PATTERN = re.compile(r"\b(YEAR|MONTH|DAY)\(\s*([^()]+?)\s*\)", re.IGNORECASE)
+_LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(\d+)\s*,\s*(\d+)", re.IGNORECASE)
+_NOW_PATTERN = re.compile(r"\bNOW\(\s*\)", re.IGNORECASE)
+_SHOW_TABLES_PATTERN = re.compile(r"^\s*SHOW\s+TABLES\s*;?\s*$", re.IGNORECASE)
+
+_SQLITE_DATE_PART = {'YEAR': '%Y', 'MONTH': '%m', 'DAY': '%d'}
+
+
+def _convert_date_format(fmt: str) -> str:
+    return _DATE_FORMAT_TOKEN.sub(lambda m: _DATE_FORMAT_MAPPING.get(m.group(0), m.group(0)), fmt)
+
+
+def _split_literals(sql: str) -> List[Tuple[str, str]]:
+    """
+    将 SQL 切分为 (类型, 文本) 片段：code / single / double / backtick。
+    引号内容不做规则替换；MySQL 的反斜杠转义会被还原为原字符。
+    """
+    pieces: List[Tuple[str, str]] = []
+    buf = []
+    i, n = 0, len(sql)
+    quotes = {"'": 'single', '"': 'double', '`': 'backtick'}
+    while i < n:
+        ch = sql[i]
+        if ch not in quotes:
+            buf.append(ch)
+            i += 1
+            continue
+        if buf:
+            pieces.append(('code', ''.join(buf)))
+            buf = []
+        kind = quotes[ch]
+        content = []
+        i += 1
+        while i < n:
+            c = sql[i]
+            if c == '\\' and kind != 'backtick' and i + 1 < n:
+                content.append(sql[i + 1])
+                i += 2
+                continue
+            if c == ch:
+                # 连续两个引号表示转义
+                if i + 1 < n and sql[i + 1] == ch:
+                    content.append(ch)
+                    i += 2
+                    continue
+                i += 1
+                break
+            content.append(c)
+            i += 1
+        pieces.append((kind, ''.join(content)))
+    if buf:
+        pieces.append(('code', ''.join(buf)))
+    return pieces
+
+
+def _rule_based_translate(sql: str, target: str) -> str:
+    if _SHOW_TABLES_PATTERN.match(sql):
+        if target == 'sqlite':
+            return "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"
+        return sql
+
+    def date_format(match: re.Match) -> str:
+        expr, fmt = match.group(1), _convert_date_format(match.group(2))
+        if target == 'sqlite':
+            return f"strftime('{fmt}', {expr})"
+        return f"strftime({expr}, '{fmt}')"
+
+    sql = _DATE_FORMAT_PATTERN.sub(date_format, sql)
+    if target == 'sqlite':
+        sql = _DATE_PART_PATTERN.sub(
+            lambda m: f"CAST(strftime('{_SQLITE_DATE_PART[m.group(1).upper()]}', {m.group(2)}) AS INTEGER)", sql
+        )
+
+    out = []
+    for kind, text in _split_literals(sql):
+        if kind == 'code':
+            text = _LIMIT_PATTERN.sub(lambda m: f"LIMIT {m.group(2)} OFFSET {m.group(1)}", text)
+            if target == 'sqlite':
+                text = _NOW_PATTERN.sub('CURRENT_TIMESTAMP', text)
+            out.append(text)
+        elif kind == 'backtick':
+            out.append('"' + text.replace('"', '""') + '"')
+        else:
+            # MySQL 中单双引号都是字符串字面量，目标方言只认单引号
+            out.append("'" + text.replace("'", "''") + "'")
+    return ''.join(out)
+
+
+def translate_mysql(sql: str, target: str) -> str:
+    """把 MySQL 方言的 SQL 翻译为 target（'duckdb' / 'sqlite'）方言；target 为 mysql 时原样返回。"""
+    if not sql or target == 'mysql':
+        return sql
+    if sqlglot is not None and not _SHOW_TABLES_PATTERN.match(sql):
+        try:
+            return sqlglot.transpile(sql, read='mysql', write=target)[0]
+        except Exception:
+            pass
+    return _rule_based_translate(sql, target)
@@ -0,0 +1,233 @@
+import codecs
+import warnings
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# 类型推断的格序：只会沿此方向放宽（整数 → 浮点 → 字符串；日期与数值冲突时退化为字符串）
+KIND_EMPTY = 'empty'
+KIND_INTEGER = 'integer'
+KIND_FLOAT = 'float'
+KIND_DATETIME = 'datetime'
+KIND_STRING = 'string'
+
+# 每列保留的候选样例值上限，避免大表时集合无限增长
+_MAX_SAMPLE_CANDIDATES = 64
+
+
+def _header_from_row(row) -> List[str]:
+    """按 pandas.read_excel 的习惯生成表头：空单元格命名为 'Unnamed: i'，重复列名追加 .1/.2。"""
+    header = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def iter_xlsx_row_batches(path: str, batch_rows: int = 5000, sheet_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    以 openpyxl 只读模式逐行读取 .xlsx，按 batch_rows 行一批产出 DataFrame。
+    首个非空行作为表头，全空行跳过；峰值内存只与批大小有关，与工作表大小无关。
+
+    参数：
+        path: .xlsx 文件路径。
+        batch_rows: 每批行数。
+        sheet_name: 工作表名，默认读取第一个工作表。
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = None
+        for row in rows:
+            if any(v is not None for v in row):
+                header = _header_from_row(row)
+                break
+        if header is None:
+            return
+
+        width = len(header)
+        yielded_any = False
+        buffer: List[tuple] = []
+        for row in rows:
+            if not any(v is not None for v in row):
+                continue
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            buffer.append(row[:width])
+            if len(buffer) >= batch_rows:
+                yield pd.DataFrame(buffer, columns=header)
+                yielded_any = True
+                buffer = []
+        if buffer or not yielded_any:
+            # 仅有表头的工作表也产出一个空批次，保证能建出空表
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def list_nonempty_xlsx_sheets(path: str) -> List[str]:
+    """返回至少包含一行非空单元格的工作表名（只读模式下逐表探测首个非空行，代价很小）。"""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        names = []
+        for sheet in workbook.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                if any(v is not None for v in row):
+                    names.append(sheet.title)
+                    break
+        return names
+    finally:
+        workbook.close()
+
+
+def detect_csv_encoding(path: str, probe_bytes: int = 1024 * 1024) -> str:
+    """探测 CSV 编码：优先 utf-8（含 BOM），失败回退 gbk。只读取文件开头一段。"""
+    with open(path, 'rb') as f:
+        head = f.read(probe_bytes)
+    try:
+        # 增量解码器：读到文件末尾时严格解码；只读了开头一段时，只容忍末尾被截断的多字节序列
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < probe_bytes)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+
+def iter_csv_row_batches(path: str, batch_rows: int = 5000) -> Iterator[pd.DataFrame]:
+    """用 C 引擎分块读取 CSV（pyarrow 引擎不支持 chunksize），每批 batch_rows 行。"""
+    encoding = detect_csv_encoding(path)
+    with pd.read_csv(path, chunksize=batch_rows, encoding=encoding, engine='c') as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def _classify(series: pd.Series) -> str:
+    """
+    判断一批非空值能容纳的最窄类型，尝试顺序与 data_persistent.infer_and_convert 一致
+    （数值 → 日期 → 字符串）；但单元格本身已是日期时直接判为日期，不再被转成纳秒整数。
+    """
+    if series.empty:
+        return KIND_EMPTY
+    if pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.infer_dtype(series, skipna=True) in ('datetime', 'datetime64', 'date'):
+        return KIND_DATETIME
+    try:
+        numeric = pd.to_numeric(series)
+        if pd.api.types.is_integer_dtype(numeric) or pd.api.types.is_bool_dtype(numeric):
+            return KIND_INTEGER
+        return KIND_FLOAT
+    except (ValueError, TypeError):
+        pass
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            pd.to_datetime(series)
+        return KIND_DATETIME
+    except (ValueError, TypeError, OverflowError):
+        pass
+    return KIND_STRING
+
+
+def _merge_kinds(current: str, new: str) -> str:
+    if current == KIND_EMPTY:
+        return new
+    if new == KIND_EMPTY or new == current:
+        return current
+    if {current, new} == {KIND_INTEGER, KIND_FLOAT}:
+        return KIND_FLOAT
+    return KIND_STRING
+
+
+class IncrementalTypeInferer:
+    """
+    跨批次增量推断列类型。第一遍对每批调用 update()，类型只会单调放宽；
+    第二遍用 convert() 按最终类型统一转换每一批，保证分块写库时各块 dtype 一致，
+    且与整表读取路径（data_persistent.infer_and_convert）得到的 dtype 相同。
+    """
+
+    def __init__(self, columns: List[str]) -> None:
+        self.columns = list(columns)
+        self.kinds: Dict[str, str] = {col: KIND_EMPTY for col in self.columns}
+        self.samples: Dict[str, set] = {col: set() for col in self.columns}
+        # 数值列的跨批统计，用于在 convert() 中选出与 infer_and_convert 相同的 dtype
+        self.has_null: Dict[str, bool] = {col: False for col in self.columns}
+        self.numeric_stats: Dict[str, dict] = {}
+        self.row_count = 0
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.row_count += len(df)
+        for col in self.columns:
+            values = df[col].dropna()
+            if len(values) < len(df):
+                self.has_null[col] = True
+            if self.kinds[col] != KIND_STRING:
+                batch_kind = _classify(values)
+                self.kinds[col] = _merge_kinds(self.kinds[col], batch_kind)
+                if batch_kind in (KIND_INTEGER, KIND_FLOAT):
+                    self._track_numeric(col, pd.to_numeric(values))
+            candidates = self.samples[col]
+            if len(candidates) < _MAX_SAMPLE_CANDIDATES:
+                for value in values.head(_MAX_SAMPLE_CANDIDATES).astype(str):
+                    if len(value) < 64:
+                        candidates.add(value)
+                    if len(candidates) >= _MAX_SAMPLE_CANDIDATES:
+                        break
+
+    def _track_numeric(self, col: str, numeric: pd.Series) -> None:
+        stats = self.numeric_stats.setdefault(col, {'boolean': True, 'integral': True, 'min': None, 'max': None})
+        if pd.api.types.is_bool_dtype(numeric):
+            numeric = numeric.astype('int64')
+        else:
+            stats['boolean'] = False
+        if stats['integral'] and pd.api.types.is_float_dtype(numeric):
+            stats['integral'] = bool((np.isfinite(numeric) & (numeric == np.floor(numeric))).all())
+        if stats['integral']:
+            low, high = numeric.min(), numeric.max()
+            stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+            stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+
+    def numeric_dtype(self, col: str) -> str:
+        """
+        与 infer_and_convert 的 pd.to_numeric(downcast='integer') 结果一致：
+        无空值且全为整数值时取能容纳全表最值的最窄有符号整数（纯布尔列保持 bool），否则 float64。
+        """
+        stats = self.numeric_stats.get(col)
+        if stats is None or self.has_null[col] or not stats['integral']:
+            return 'float64'
+        if stats['boolean']:
+            return 'bool'
+        for dtype in ('int8', 'int16', 'int32', 'int64'):
+            info = np.iinfo(dtype)
+            if info.min <= stats['min'] and stats['max'] <= info.max:
+                return dtype
+        return 'float64'
+
+    def convert(self, df: pd.DataFrame) -> pd.DataFrame:
+        converted = {}
+        for col in self.columns:
+            kind = self.kinds[col]
+            series = df[col]
+            if kind in (KIND_INTEGER, KIND_FLOAT):
+                # dtype 由全表统计决定，各块一致，且与整表读取路径相同
+                converted[col] = pd.to_numeric(series).astype(self.numeric_dtype(col))
+            elif kind == KIND_DATETIME:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)
+                    converted[col] = pd.to_datetime(series)
+            elif kind == KIND_STRING:
+                converted[col] = series.map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+            else:
+                # 全空列：整表读取时为全 NaN 的 float64
+                converted[col] = pd.to_numeric(series).astype('float64')
+        return pd.DataFrame(converted, columns=self.columns)
+
+    def sample_values(self, col: str) -> List[str]:
+        return sorted(self.samples.get(col, set()))
@@ -44,11 +44,16 @@ def get_chat_result(
     messages: object, 
     tools: object = None,
     tool_choice: object = None,
-    llm_config: Dict = None
+    llm_config: Dict = None,
+    deadline: object = None
     ) :
     """
     Get LLM generation result of different API backend, e.g. gpt-4o, ollama.
+
+    `deadline` (utils.deadline.Deadline) caps the request timeout at the remaining budget
+    and raises DeadlineExceeded before calling when the budget is gone.
     """
+    llm_timeout = deadline.timeout(300) if deadline is not None else 300
     # Check if it's Ollama API (no api_key needed)
     # We treat any endpoint that clearly targets an Ollama server or already points to
     # the full chat-completions path as a direct HTTP endpoint (not OpenAI SDK base_url).
@@ -102,7 +107,7 @@ def get_chat_result(
                 service_url,
                 json=payload,
                 headers=headers,
-                timeout=300
+                timeout=llm_timeout
             )
             response.raise_for_status()
             data = response.json()
@@ -122,7 +127,8 @@ def get_chat_result(
             messages=messages,
             model=llm_config.get('model', 'gpt-4o'),
             tools=tools,
-            temperature=0.1
+            temperature=0.1,
+            timeout=llm_timeout
         )
         return chat_completion.choices[0].message
     except Exception as e:
@@ -145,7 +151,7 @@ def get_chat_result(
             service_url,
             json=payload,
             headers=headers,
-            timeout=300
+            timeout=deadline.timeout(300) if deadline is not None else 300
         )
         response.raise_for_status()
         return json.loads(response.text)['choices'][0]["message"]
@@ -27,6 +27,26 @@ qwen3_8b_config = {
 
 # 配置您的SQL服务地址（offline部分的Flask服务）
 sql_service_url = 'http://localhost:5000/get_tablerag_response'
+# 批量接口：一次請求處理多個子查詢（共享 schema 解析、服務端並發調用 LLM）
+sql_service_batch_url = 'http://localhost:5000/get_tablerag_response_batch'
+# SQL 服務調用方式：http（經 sql_service_url 調用獨立服務）/ inproc（同進程直接調用 NL2SQL 函數，
+# 適用於 SQL 服務與推論部署在同一主機，省去序列化與本機回環往返）
+sql_service_transport = os.environ.get("SQL_SERVICE_TRANSPORT", "http").lower()
+# inproc 模式的工作執行緒數
+sql_inproc_workers = int(os.environ.get("SQL_INPROC_WORKERS", "8"))
+# http 模式：單次請求超時、連線超時（秒）與連線池大小
+sql_service_timeout = float(os.environ.get("SQL_SERVICE_TIMEOUT", "60"))
+sql_connect_timeout = float(os.environ.get("SQL_CONNECT_TIMEOUT", "3"))
+sql_http_pool_size = int(os.environ.get("SQL_HTTP_POOL_SIZE", "16"))
+# 僅對連線失敗與 429/502/503/504 重試，退避為帶抖動的指數退避（base * 2^n，上限 cap）
+sql_max_retries = int(os.environ.get("SQL_SERVICE_MAX_RETRIES", "2"))
+sql_backoff_base = float(os.environ.get("SQL_BACKOFF_BASE", "0.5"))
+sql_backoff_cap = float(os.environ.get("SQL_BACKOFF_CAP", "4"))
+# 熔斷：連續失敗達閾值後熔斷，經過 reset 秒後放行一次探測請求
+sql_breaker_failure_threshold = int(os.environ.get("SQL_BREAKER_FAILURES", "5"))
+sql_breaker_reset_timeout = float(os.environ.get("SQL_BREAKER_RESET_SECONDS", "30"))
+# 單次問答的整體時限（秒），SQL 調用的超時與重試不會超過剩餘時間
+chat_request_timeout = float(os.environ.get("CHAT_REQUEST_TIMEOUT", "600"))
 
 # 表选择策略配置（内容权重大，表名权重小）
 table_selection_config = {
@@ -38,7 +58,9 @@ table_selection_config = {
     # 强内容命中阈值（>= 即视为强命中）；无强命中时走合成排序
     "strong_content_threshold": 0.5,
     # 自动选择时默认返回的相关表数量（含 top1）
-    "default_top_k": 3
+    "default_top_k": 3,
+    # 由粗到细：先用表级摘要向量选出前 N 个文件，再只在其 chunk 内召回与重排；0 表示关闭（全量 chunk 召回）
+    "coarse_table_top_n": int(os.environ.get("TABLE_COARSE_TOP_N", "8"))
 }
 
 config_mapping = {
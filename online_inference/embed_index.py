@@ -3,7 +3,8 @@ import argparse
 from online_inference.tools.retriever import MixedDocRetriever
 
 
-def main():
+def main(progress_callback=None):
+    """progress_callback: optional callable receiving embedding progress dicts (see SemanticRetriever.embed_doc)."""
     parser = argparse.ArgumentParser(description="Build or rebuild document embeddings for TableRAG retriever")
 
     # Resolve repository root (parent of this file's directory: online_inference/..)
@@ -30,7 +31,8 @@ def main():
         llm_path=os.path.join(args.bge_dir, "bge-m3"),
         reranker_path=os.path.join(args.bge_dir, "bge-reranker-v2-m3"),
         save_path=args.save_path,
-        embedding_policy=args.policy
+        embedding_policy=args.policy,
+        progress_callback=progress_callback
     )
 
     # Side-effects of constructor perform the embedding build/load.
@@ -7,6 +7,7 @@ import sys
 from typing import Dict, Any
 from main import TableRAG
 from chat_utils import init_logger
+from utils.deadline import DeadlineExceeded
 import logging
 
 def create_sample_case(question: str, table_id: str = "auto") -> Dict[str, Any]:
@@ -78,10 +79,13 @@ def interactive_chat(args=None):
                 print("[TableRAG] 選表模式:", "手動多表" if isinstance(current_table_id, list) and current_table_id else ("手動單表" if (isinstance(current_table_id, str) and current_table_id not in (None, '', 'auto')) else "自動選表"))
                 print("[TableRAG] 當前table_id:", current_table_id)
                 print("[TableRAG] 開始推理...")
-            answer, _ = agent._run(case, backbone=args.backbone)
+            answer, _ = agent._run(case, backbone=args.backbone, deadline=getattr(args, 'deadline', None))
             if getattr(args, 'verbose', False):
                 print("[TableRAG] 結果:")
             print(answer or "")
+        except DeadlineExceeded:
+            # 交由調用方（如 /chat/ask）區分逾時/取消與一般錯誤
+            raise
         except Exception as e:
             print(f"處理問題時發生錯誤: {e}")
         return
@@ -11,7 +11,7 @@ from tools.retriever import *
 from tools.sql_tool import *
 from config import *
 from utils.utils import read_in, read_in_lines, read_plain_csv
-from utils.tool_utils import excel_to_markdown
+from utils.tool_utils import excel_to_markdown, load_snapshot_index, snapshot_to_markdown
 from typing import Dict, Tuple, Any, List, Set
 import threading
 import traceback
@@ -20,7 +20,8 @@ import time
 from prompt import *
 from chat_utils import init_logger
 import logging
-from utils.canonical_table_map import CanonicalTableIndex
+from utils.canonical_table_map import CanonicalTableIndex, TERM_PATTERN
+from utils.deadline import Deadline
 
 # 初始化logger
 logger = init_logger('./logs/test.log', logging.INFO)
@@ -41,6 +42,20 @@ class TableRAG() :
         self.cnt = 0
         # Build canonical table mapping index
         self.table_index = CanonicalTableIndex(schema_dir=_args.doc_dir, excel_dir=_args.excel_dir)
+        # 選表參數只在初始化時讀取一次
+        try:
+            self.selection_params = (
+                float(table_selection_config.get("alpha_content_weight", 0.85)),
+                float(table_selection_config.get("beta_name_weight", 0.15)),
+                int(table_selection_config.get("aggregate_top_m", 3)),
+                float(table_selection_config.get("strong_content_threshold", 0.5)),
+                int(table_selection_config.get("default_top_k", 3)),
+                int(table_selection_config.get("coarse_table_top_n", 0)),
+            )
+        except Exception:
+            self.selection_params = (0.85, 0.15, 3, 0.5, 3, 0)
+        # 原始檔名 -> Parquet 快照列表，表格內容優先由快照渲染
+        self.snapshot_index = load_snapshot_index(_args.doc_dir)
         # Ensure embeddings file resolves under the online_inference dir regardless of CWD
         _this_dir = os.path.dirname(os.path.abspath(__file__))
         _default_embed_path = os.path.join(_this_dir, "embedding.pkl")
@@ -61,6 +76,23 @@ class TableRAG() :
         except Exception:
             self.prompt_max_chars = 8000
 
+    def _snapshot_markdown(self, file_name: str) -> str | None:
+        """由匯入時寫出的 Parquet 快照渲染 Markdown；無快照時返回 None。"""
+        if not file_name:
+            return None
+        snapshots = self.snapshot_index.get(file_name)
+        if snapshots is None:
+            # 啟動後新匯入的檔案：重新掃描一次 schema 目錄
+            self.snapshot_index = load_snapshot_index(self.config.doc_dir)
+            snapshots = self.snapshot_index.get(file_name)
+        if not snapshots:
+            return None
+        try:
+            return snapshot_to_markdown(file_name, snapshots)
+        except Exception as e:
+            logger.warning(f"Failed to render snapshot for {file_name}: {e}")
+            return None
+
     def _markdown_for_canonical_ids(self, canonical_ids: List[str]) -> str:
         """
         根據規範ID列表生成合併的 Markdown 表內容。
@@ -75,7 +107,10 @@ class TableRAG() :
                 name = os.path.splitext(preferred_excel)[0]
                 stem, ext = os.path.splitext(preferred_excel)
                 csv_path = os.path.join(self.config.excel_dir, stem + ".csv")
-                if os.path.exists(csv_path):
+                snapshot_md = self._snapshot_markdown(preferred_excel)
+                if snapshot_md:
+                    markdown_text_local = snapshot_md
+                elif os.path.exists(csv_path):
                     markdown_text_local = read_plain_csv(csv_path)
                 else:
                     excel_path = os.path.join(self.config.excel_dir, preferred_excel)
@@ -90,7 +125,11 @@ class TableRAG() :
                         with open(json_path, "r", encoding="utf-8") as f:
                             data = json.load(f)
                         original_filename = data.get("original_filename")
-                        if original_filename:
+                        snapshot_md = self._snapshot_markdown(original_filename)
+                        if snapshot_md:
+                            name = os.path.splitext(original_filename)[0]
+                            markdown_text_local = snapshot_md
+                        elif original_filename:
                             name = os.path.splitext(original_filename)[0]
                             candidate_paths = []
                             # 1) excel_dir/original_filename
@@ -278,11 +317,11 @@ class TableRAG() :
             return available[0], [available[0]]
         return "sample_table", []
 
-    def get_llm_response(self, text_messages: object, tools: object, backbone: str, select_config: object) :
+    def get_llm_response(self, text_messages: object, tools: object, backbone: str, select_config: object, deadline: Deadline = None) :
         if tools :
-            response = get_chat_result(messages=text_messages, tools=tools, llm_config=select_config)   
+            response = get_chat_result(messages=text_messages, tools=tools, llm_config=select_config, deadline=deadline)   
         else :
-            response = get_chat_result(messages=text_messages, tools=None, llm_config=select_config)   
+            response = get_chat_result(messages=text_messages, tools=None, llm_config=select_config, deadline=deadline)   
 
         return response
                         
@@ -299,53 +338,27 @@ class TableRAG() :
         Returns:
             Tuple[str, List[str]]: (最相關表格名, 相關表格列表)
         """
-        # 讀取配置
-        try:
-            from config import table_selection_config as _sel_cfg
-            alpha = float(_sel_cfg.get("alpha_content_weight", 0.85))
-            beta = float(_sel_cfg.get("beta_name_weight", 0.15))
-            top_m = int(_sel_cfg.get("aggregate_top_m", 3))
-            strong_thr = float(_sel_cfg.get("strong_content_threshold", 0.5))
-            cfg_top_k = int(_sel_cfg.get("default_top_k", 3))
-        except Exception:
-            alpha, beta, top_m, strong_thr, cfg_top_k = 0.85, 0.15, 3, 0.5, 3
+        alpha, beta, top_m, strong_thr, cfg_top_k, coarse_top_n = self.selection_params
 
         # 以配置為主
         top_k = max(1, min(top_k or cfg_top_k, cfg_top_k))
 
-        # 使用檢索器獲取候選（包含重排分數與來源檔名）
-        _, rerank_scores, doc_filenames = self.retriever.retrieve(query, 30, max(top_k * 4, 5))
+        # 使用檢索器獲取候選（包含重排分數與來源檔名）；coarse_top_n > 0 時先以表級向量粗排，只在候選表內召回
+        _, rerank_scores, doc_filenames = self.retriever.retrieve(
+            query, 30, max(top_k * 4, 5), table_top_n=coarse_top_n or None
+        )
 
         # 將檢索文件名映射為規範ID，聚合內容分數，並計算名稱分數
         final_scored: List[Tuple[str, float]] = []  # (canonical_id, final_score)
-        name_score_by_cid: Dict[str, float] = {}
         content_scores_by_cid: Dict[str, List[float]] = {}
         strong_content_hit_by_cid: Dict[str, bool] = {}
         is_year_like_cid: Dict[str, bool] = {}
 
         # 提取查詢中的關鍵字串（簡單啟發式：長度>=2的連續中英文數字片段）
-        try:
-            import re as _re
-            query_terms = [t for t in _re.findall(r"[\u4e00-\u9fa5A-Za-z0-9]+", query) if len(t) >= 2]
-        except Exception:
-            query_terms = [query] if len(query) >= 2 else []
-
-        def _alias_score(aliases: List[str]) -> float:
-            score = 0.0
-            for alias in aliases:
-                lower_alias = alias.lower()
-                # 降權：純年份/通用短別名
-                if lower_alias.isdigit() and len(lower_alias) == 4:
-                    score -= 2.0
-                if len(lower_alias) <= 2:
-                    score -= 0.5
-                # 提升：別名包含查詢關鍵詞，或關鍵詞包含於別名
-                for term in query_terms:
-                    lower_term = term.lower()
-                    if lower_term in lower_alias or lower_alias in lower_term:
-                        score += 2.0
-            return score
+        query_terms = [t.lower() for t in TERM_PATTERN.findall(query) if len(t) >= 2]
 
+        # 每個表取第一次出現的來源檔名，用於名稱分數中的檔名命中
+        first_stem_by_cid: Dict[str, str] = {}
         for filename, rr_sc in zip(doc_filenames, rerank_scores):
             stem = filename.replace(".json", "").replace(".xlsx", "")
             cid = self.table_index.get_canonical_id(stem)
@@ -353,19 +366,16 @@ class TableRAG() :
                 continue
             # 聚合內容分數
             content_scores_by_cid.setdefault(cid, []).append(float(rr_sc))
-            # 名稱/別名分數（僅計算一次最高值即可）
-            if cid not in name_score_by_cid:
-                aliases = self.table_index.get_aliases(cid)
-                name_sc = _alias_score(aliases)
-                lower_filename = stem.lower()
-                for term in query_terms:
-                    lower_term = term.lower()
-                    if lower_term in lower_filename:
-                        name_sc += 3.0
-                name_score_by_cid[cid] = name_sc
+            if cid not in first_stem_by_cid:
+                first_stem_by_cid[cid] = stem
                 # 年份樣式
                 is_year_like_cid[cid] = cid.isdigit() and len(cid) == 4
 
+        # 名稱/別名分數：預先計算的別名陣列與詞項倒排索引上一次性算出所有候選
+        name_score_by_cid = self.table_index.name_scores(
+            list(first_stem_by_cid.keys()), list(first_stem_by_cid.values()), query_terms
+        )
+
         # 計算每個表的內容聚合分數與強內容命中
         aggregated_content_by_cid: Dict[str, float] = {}
         for cid, scores in content_scores_by_cid.items():
@@ -418,11 +428,17 @@ class TableRAG() :
         top_table = canonical_ids[0]
         return top_table, canonical_ids
 
-    def _run(self, case: dict, backbone: str, tmp: Any = None) :
+    def _run(self, case: dict, backbone: str, tmp: Any = None, deadline: Deadline = None) :
         """
         Single iteration of TableRAG inference.
+
+        `deadline` bounds the whole request: every LLM/SQL call's timeout is capped at the remaining
+        budget, and DeadlineExceeded is raised at the next step once it expires or is cancelled
+        (e.g. the HTTP client disconnected). Defaults to CHAT_REQUEST_TIMEOUT.
         """
         query = case["question"]
+        if deadline is None:
+            deadline = Deadline(chat_request_timeout)
         
         # 支持多表指定：table_id 可為字串或列表；若為 auto 或空則自動選表
         manual_list: List[str] = []
@@ -473,7 +489,8 @@ class TableRAG() :
 
         while current_iter :
             current_iter -= 1
-            response = self.get_llm_response(text_messages=text_messages, tools=tools, backbone=backbone, select_config=select_config)
+            deadline.check()
+            response = self.get_llm_response(text_messages=text_messages, tools=tools, backbone=backbone, select_config=select_config, deadline=deadline)
 
             reasoning, sub_queries, tool_call_ids = self.extract_subquery(response, backbone=backbone)
             logger.info(f"Step {self.max_iter - current_iter}: {sub_queries}")
@@ -498,7 +515,14 @@ class TableRAG() :
             messages = response
             text_messages.append(messages)
 
-            for sub_query, tool_call_id in zip(sub_queries, tool_call_ids) :
+            # 多個子查詢時一次批量請求 SQL 服務，服務端並發生成與執行
+            if len(sub_queries) > 1:
+                excel_rag_responses = get_excel_rag_response_batch(related_table_name_list, sub_queries, deadline=deadline)
+            else:
+                excel_rag_responses = [None] * len(sub_queries)
+
+            for sub_query, tool_call_id, prefetched_response in zip(sub_queries, tool_call_ids, excel_rag_responses) :
+                deadline.check()
                 # 若用戶手動指定表，使用指定ID對應表的 Markdown 作為 Content 1
                 if manual_mode:
                     try:
@@ -513,7 +537,10 @@ class TableRAG() :
                 # 截斷 Content 1 以控制提示長度
                 doc_content = self._truncate_text(doc_content)
 
-                excel_rag_response_dict = get_excel_rag_response_plain(related_table_name_list, sub_query)
+                if prefetched_response is not None:
+                    excel_rag_response_dict = prefetched_response
+                else:
+                    excel_rag_response_dict = get_excel_rag_response_plain(related_table_name_list, sub_query, deadline=deadline)
                 excel_rag_response = copy.deepcopy(excel_rag_response_dict)
                 logger.info(f"Requesting ExcelRAG, source file {str(related_table_name_list)}, with query {sub_query}")
 
@@ -537,7 +564,7 @@ class TableRAG() :
                 final_prompt = combine_prompt_formatted
 
                 msg = [{"role": "user", "content": final_prompt}]
-                answer = self.get_llm_response(text_messages=msg, backbone=backbone, select_config=select_config, tools=None)
+                answer = self.get_llm_response(text_messages=msg, backbone=backbone, select_config=select_config, tools=None, deadline=deadline)
                 answer = self.extract_content(answer)
 
                 if not answer :
@@ -0,0 +1,181 @@
+"""
+选表基准：对比全量 chunk 召回（当前路径）与表级摘要向量粗排后的受限召回，以及完整重排与自适应重排，
+统计选表准确率（top1 / top-k 命中）、检索延迟分位数与每个查询送入交叉编码器的对数。
+
+用例文件为 JSON 列表或 JSONL，每条含 question 与期望的表（table_id / table，
+可以是原始 Excel 文件名、schema 文件名或规范 ID）：
+  {"question": "华为2024年营收是多少", "table_id": "华为2024财报.xlsx"}
+
+聚合方式与 TableRAG.auto_select_table 的内容分一致（每表取重排分数最大值），不含名称分与 LLM 调用。
+
+另输出纯稠密召回的 recall@k（前 k 个 chunk 中含期望表即命中，不含 BM25 与重排）。对尚未迁移到
+L2 归一化向量的旧 pkl，用 --policy load_only 运行（不写回）可同时得到归一化前（原始内积）与归一化后的结果。
+
+示例（项目根目录，需已构建 embedding.pkl）：
+  python -m online_inference.table_selection_benchmark --cases cases.jsonl --top_n 0,4,8,16 --rerank_modes full,adaptive
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from online_inference.tools.retriever import MixedDocRetriever, SemanticRetriever
+from online_inference.utils.canonical_table_map import CanonicalTableIndex
+
+
+def load_cases(path: str) -> List[dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def rank_tables(index: CanonicalTableIndex, rerank_scores, filenames) -> List[str]:
+    """把重排后的 chunk 聚合到规范表 ID（取最大分），按分数降序返回。"""
+    best: Dict[str, float] = {}
+    for filename, score in zip(filenames, rerank_scores):
+        stem = filename.replace('.json', '').replace('.xlsx', '')
+        cid = index.get_canonical_id(stem)
+        if cid and float(score) > best.get(cid, float('-inf')):
+            best[cid] = float(score)
+    return [cid for cid, _ in sorted(best.items(), key=lambda kv: kv[1], reverse=True)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_mode(retriever: MixedDocRetriever, index: CanonicalTableIndex, cases: List[Tuple[str, Optional[str]]],
+             top_n: int, recall: int, rerank: int, k: int, adaptive: bool = False) -> dict:
+    semantic = retriever.semantic_retriever
+    semantic.adaptive_rerank = adaptive
+    pairs_before = semantic.rerank_pairs_scored
+    hits_1 = hits_k = 0
+    latencies: List[float] = []
+    for question, expected in cases:
+        started = time.perf_counter()
+        _, scores, filenames = retriever.retrieve(question, recall, rerank, table_top_n=top_n or None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ranked = rank_tables(index, scores, filenames)
+        if ranked and ranked[0] == expected:
+            hits_1 += 1
+        if expected in ranked[:k]:
+            hits_k += 1
+    total = max(1, len(cases))
+    return {
+        'mode': ('full' if not top_n else f'coarse@{top_n}') + ('+adaptive' if adaptive else ''),
+        'pairs': (semantic.rerank_pairs_scored - pairs_before) / total,
+        'top1': hits_1 / total,
+        f'top{k}': hits_k / total,
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'mean_ms': statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+def dense_recall_at_k(semantic: SemanticRetriever, index: CanonicalTableIndex, cases: List[Tuple[str, Optional[str]]],
+                      ks: List[int], doc_vectors: np.ndarray, normalize_query: bool) -> Dict[int, float]:
+    """只用稠密向量在全部 chunk 上取前 max(ks) 个，统计期望表出现在前 k 个 chunk 中的比例。"""
+    hits = {k: 0 for k in ks}
+    top_k = min(max(ks), len(doc_vectors))
+    for question, expected in cases:
+        q = np.asarray(semantic.embedding_model.encode(question, normalize=normalize_query), dtype=np.float32).reshape(-1)
+        sims = doc_vectors @ q
+        top = np.argpartition(-sims, top_k - 1)[:top_k]
+        top = top[np.argsort(-sims[top])]
+        first_hit = None
+        for rank, row in enumerate(top):
+            stem = semantic.chunk_file_index[int(row)].replace('.json', '').replace('.xlsx', '')
+            if expected is not None and index.get_canonical_id(stem) == expected:
+                first_hit = rank
+                break
+        for k in ks:
+            if first_hit is not None and first_hit < k:
+                hits[k] += 1
+    total = max(1, len(cases))
+    return {k: hits[k] / total for k in ks}
+
+
+def main() -> None:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    repo_root = os.path.abspath(os.path.join(script_dir, os.pardir))
+    parser = argparse.ArgumentParser(description='Compare table selection accuracy/latency: full chunk recall vs coarse-to-fine')
+    parser.add_argument('--cases', required=True, help='JSON/JSONL file with question and expected table_id')
+    parser.add_argument('--doc_dir', default=os.path.join(repo_root, 'offline_data_ingestion_and_query_interface', 'data', 'schema'))
+    parser.add_argument('--excel_dir', default=os.path.join(repo_root, 'offline_data_ingestion_and_query_interface', 'dataset', 'dev_excel'))
+    parser.add_argument('--bge_dir', default=os.path.join(script_dir, 'bge_models'))
+    parser.add_argument('--save_path', default=os.path.join(script_dir, 'embedding.pkl'))
+    parser.add_argument('--policy', default='build_if_missing', choices=['rebuild', 'build_if_missing', 'load_only'])
+    parser.add_argument('--top_n', default='0,4,8,16', help='Comma separated shortlist sizes; 0 = full chunk recall')
+    parser.add_argument('--recall', type=int, default=30)
+    parser.add_argument('--rerank', type=int, default=12)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--rerank_modes', default='full,adaptive', help='Comma separated: full (score every recalled chunk) and/or adaptive')
+    parser.add_argument('--dense_k', default='5,10,30', help='Comma separated k for dense-only recall@k')
+    parser.add_argument('--warmup', type=int, default=3, help='Queries run before timing each mode')
+    args = parser.parse_args()
+
+    # 旧 pkl 载入时会被归一化，先留一份原始向量用于对比
+    raw_vectors = None
+    if args.policy != 'rebuild' and os.path.exists(args.save_path):
+        payload = SemanticRetriever.load_embedding_payload(args.save_path)
+        if not payload.get('normalized'):
+            raw_vectors = np.asarray(payload['embeddings'], dtype=np.float32)
+        payload = None
+
+    retriever = MixedDocRetriever(
+        doc_dir_path=args.doc_dir,
+        excel_dir_path=args.excel_dir,
+        llm_path=os.path.join(args.bge_dir, 'bge-m3'),
+        reranker_path=os.path.join(args.bge_dir, 'bge-reranker-v2-m3'),
+        save_path=args.save_path,
+        embedding_policy=args.policy,
+    )
+    index = CanonicalTableIndex(schema_dir=args.doc_dir, excel_dir=args.excel_dir)
+
+    cases = []
+    for case in load_cases(args.cases):
+        expected = case.get('table_id') or case.get('table')
+        cases.append((case['question'], index.get_canonical_id(expected) if expected else None))
+    unresolved = sum(1 for _, expected in cases if expected is None)
+    if unresolved:
+        print(f'warning: {unresolved} case(s) reference unknown tables and will count as misses')
+
+    results = []
+    modes = [m.strip() for m in args.rerank_modes.split(',') if m.strip()]
+    for top_n in [int(n) for n in args.top_n.split(',') if n.strip()]:
+        for mode in modes:
+            retriever.semantic_retriever.adaptive_rerank = mode == 'adaptive'
+            for question, _ in cases[:args.warmup]:
+                retriever.retrieve(question, args.recall, args.rerank, table_top_n=top_n or None)
+            results.append(run_mode(retriever, index, cases, top_n, args.recall, args.rerank, args.k,
+                                    adaptive=mode == 'adaptive'))
+
+    ks = [int(k) for k in args.dense_k.split(',') if k.strip()]
+    semantic = retriever.semantic_retriever
+    dense_rows = [('dense_cosine', dense_recall_at_k(semantic, index, cases, ks, semantic.doc_embeddings, True))]
+    if raw_vectors is not None and len(raw_vectors) == len(semantic.doc_embeddings):
+        dense_rows.insert(0, ('dense_raw_ip', dense_recall_at_k(semantic, index, cases, ks, raw_vectors, False)))
+
+    print(f"cases={len(cases)} tables={len(index.list_canonical_ids())} recall={args.recall} rerank={args.rerank}")
+    print(f"{'similarity':<22}" + ''.join(f"{f'R@{k}':>8}" for k in ks))
+    for name, recalls in dense_rows:
+        print(f"{name:<22}" + ''.join(f"{recalls[k]:>8.3f}" for k in ks))
+    print()
+    header = f"{'mode':<22}{'top1':>8}{f'top{args.k}':>8}{'pairs':>8}{'p50_ms':>10}{'p95_ms':>10}{'mean_ms':>10}"
+    print(header)
+    for r in results:
+        print(f"{r['mode']:<22}{r['top1']:>8.3f}{r[f'top{args.k}']:>8.3f}{r['pairs']:>8.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_ms']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import tqdm as tqdm
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from transformers import AutoModel
 import transformers
 from online_inference.utils.tool_utils import *
@@ -20,12 +20,43 @@ import nltk
 from more_itertools import chunked
 import numpy as np
 import pickle
-from typing import Dict, List, Union, Tuple, Any
+from typing import Callable, Dict, List, Union, Tuple, Any
 from online_inference.utils.utils import read_plain_csv
+from online_inference.tools.sparse_index import BM25Index, reciprocal_rank_fusion
 
 warnings.filterwarnings("ignore", category=urllib3.exceptions.InsecureRequestWarning)
 device = "cuda:0"
 
+# 表级摘要取每个文件首个 chunk 的前 N 个字符（文件名 + schema/表头 + 前几行样本）
+TABLE_SUMMARY_CHARS = int(os.environ.get("TABLE_SUMMARY_CHARS", "800"))
+# 混合召回：BM25 与稠密召回做 RRF 融合；设为 0 时只用稠密召回
+HYBRID_RECALL = os.environ.get("HYBRID_RECALL", "1") not in ("0", "false", "False")
+# 自适应重排：去重、每文件上限、裁剪尾部；稠密首位领先足够多时只对少数锚点调用交叉编码器
+RERANK_ADAPTIVE = os.environ.get("RERANK_ADAPTIVE", "1") not in ("0", "false", "False")
+# 近似重复：两个 chunk 的字符 5-gram 集合交集占较小集合的比例达到该值时，只保留召回排名靠前的一个。
+# 用包含度而非 Jaccard，能去掉完全相同的 chunk（重复的 sheet/文件）以及被前一个 chunk 覆盖的短尾块；
+# 普通的相邻重叠窗口（1000 字符中重叠 200）包含度约 0.2，不会被去掉
+RERANK_DEDUP_CONTAINMENT = float(os.environ.get("RERANK_DEDUP_CONTAINMENT", "0.8"))
+# 每个来源文件最多送入重排的 chunk 数
+RERANK_MAX_PER_FILE = int(os.environ.get("RERANK_MAX_PER_FILE", "4"))
+# 融合排名前 rerank_num 之外、余弦低于首位减该值的候选不送入重排
+RERANK_PRUNE_MARGIN = float(os.environ.get("RERANK_PRUNE_MARGIN", "0.25"))
+# BM25 排名前 N 的命中（用户原样输入的标识）总是送入重排，不受裁剪影响
+RERANK_KEEP_SPARSE = int(os.environ.get("RERANK_KEEP_SPARSE", "3"))
+# 融合首位同时是余弦首位且领先第二名达到该值时，不再重排余弦裁剪留下的尾部，只重排融合排名前 rerank_num 个
+# （加上保留的 BM25 命中）；返回条数与分数量纲都不变；<= 0 关闭
+RERANK_SKIP_MARGIN = float(os.environ.get("RERANK_SKIP_MARGIN", "0.15"))
+# 字符 5-gram 集合的 LRU 缓存条数
+RERANK_SHINGLE_CACHE_SIZE = int(os.environ.get("RERANK_SHINGLE_CACHE_SIZE", "4096"))
+
+
+def l2_normalize(vectors: Any) -> np.ndarray :
+    """按行 L2 归一化（零向量保持为零），返回 float32。"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
 class SemanticRetriever :
     """
     Retrieving process, containing recall and rerank.
@@ -38,7 +69,8 @@ class SemanticRetriever :
         llm_path: str = None,
         reranker_path: str = None,
         save_path: str = "./retrieval_result/embedding.pkl",
-        embedding_policy: str = "build_if_missing"  # options: load_only | build_if_missing | rebuild
+        embedding_policy: str = "build_if_missing",  # options: load_only | build_if_missing | rebuild
+        progress_callback: Callable[[dict], None] = None
     ) -> None:
         self.embedding_model = Embedder(llm_path)
         self.reranker = Reranker(reranker_path)
@@ -52,24 +84,60 @@ class SemanticRetriever :
         self.chunk_index = chunk_index
         self.chunk_file_index = chunk_file_index
 
+        loaded = False
+        payload = None
         if policy == "rebuild":
             # always rebuild and overwrite
-            doc_embeddings = self.embed_doc(chunks, save_path=save_path)
+            doc_embeddings = self.embed_doc(chunks, progress_callback=progress_callback)
         elif policy == "load_only":
             if os.path.exists(save_path):
-                doc_embeddings, self.chunks, self.chunk_file_index = self.load_embeddings(save_path)
+                payload = self.load_embedding_payload(save_path)
+                doc_embeddings, self.chunks, self.chunk_file_index = payload['embeddings'], payload['chunks'], payload['chunk_file_index']
                 self.chunk_index = {idx: ch for idx, ch in enumerate(self.chunks)}
+                loaded = True
             else:
                 raise FileNotFoundError(f"Embeddings not found at {save_path} while policy=load_only")
         else:  # build_if_missing
             if os.path.exists(save_path):
-                doc_embeddings, self.chunks, self.chunk_file_index = self.load_embeddings(save_path)
+                payload = self.load_embedding_payload(save_path)
+                doc_embeddings, self.chunks, self.chunk_file_index = payload['embeddings'], payload['chunks'], payload['chunk_file_index']
                 self.chunk_index = {idx: ch for idx, ch in enumerate(self.chunks)}
+                loaded = True
             else:
-                doc_embeddings = self.embed_doc(chunks, save_path=save_path)
+                doc_embeddings = self.embed_doc(chunks, progress_callback=progress_callback)
+
+        # 表级摘要向量：粗排用，先选出少量候选表，再只在这些表的 chunk 内召回
+        self.table_files, self.table_rows = self._group_rows_by_file()
+        table_embeddings = self.table_embeddings_from(payload, self.table_files) if loaded else None
+        # BM25 倒排索引与稠密索引并行存放；旧 pkl 或分词器变化时重建
+        self.sparse_index = BM25Index.from_state(payload.get('sparse_index'), len(self.chunks)) if loaded else None
+        # 旧 pkl 存的是未归一化的 CLS 向量，内积受向量模长影响；载入时归一化并写回
+        normalized = bool(payload.get('normalized')) if loaded else True
+        if not normalized:
+            print(f"Embeddings in {save_path} are not L2-normalized, migrating.")
+            doc_embeddings = l2_normalize(doc_embeddings)
+            if table_embeddings is not None:
+                table_embeddings = l2_normalize(table_embeddings)
+        payload = None
+        missing = not normalized or table_embeddings is None or (HYBRID_RECALL and self.sparse_index is None)
+        if table_embeddings is None:
+            table_embeddings = self.embed_tables(progress_callback=progress_callback)
+        if HYBRID_RECALL and self.sparse_index is None:
+            self.sparse_index = BM25Index.build(self.chunks)
+        if missing and save_path and (not loaded or policy != "load_only"):
+            self.save_embeddings(doc_embeddings, self.chunks, save_path, table_embeddings=table_embeddings)
+        if not HYBRID_RECALL:
+            self.sparse_index = None
+        # 受限召回直接在内存中的向量上计算内积（与 IndexFlatIP 结果一致）
+        self.doc_embeddings = np.asarray(doc_embeddings, dtype=np.float32)
         
         self.thread_local = threading.local()
         self.index_lock = threading.RLock()
+        self.adaptive_rerank = RERANK_ADAPTIVE
+        # 累计送入交叉编码器的 (query, chunk) 对数，供基准统计
+        self.rerank_pairs_scored = 0
+        # chunk 行号 -> 字符 5-gram 集合，去重时按需计算，LRU 上限 RERANK_SHINGLE_CACHE_SIZE
+        self._shingle_cache: "OrderedDict[int, set]" = OrderedDict()
 
         print("embedding size", doc_embeddings.shape)
         
@@ -84,13 +152,57 @@ class SemanticRetriever :
             print("GPU不可用，使用CPU模式")
         
         self.index_IP = self.build_index(doc_embeddings)
+        self.table_index_IP = self.build_index(table_embeddings) if len(self.table_files) else None
+
+    def _group_rows_by_file(self) -> Tuple[List[str], Dict[str, np.ndarray]] :
+        """按来源文件分组 chunk 行号，返回 (文件名列表, 文件名 -> 行号数组)。"""
+        rows_by_file: Dict[str, List[int]] = defaultdict(list)
+        for row in range(len(self.chunks)) :
+            rows_by_file[self.chunk_file_index[row]].append(row)
+        files = sorted(rows_by_file)
+        return files, {f: np.array(rows_by_file[f], dtype=np.int64) for f in files}
+
+    def table_summaries(self) -> List[str] :
+        """
+        每个文件的摘要文本：文件名 + 首个 chunk 的前 TABLE_SUMMARY_CHARS 个字符。
+        schema 文件的首个 chunk 含表名、列名与列统计，Excel 文件的首个 chunk 含表头与前几行样本。
+        """
+        summaries = []
+        for f in self.table_files :
+            first = self.chunks[int(self.table_rows[f][0])]
+            prefix = f"File name: {f}\n"
+            body = first[len(prefix):] if first.startswith(prefix) else first
+            summaries.append(prefix + body[:TABLE_SUMMARY_CHARS])
+        return summaries
+
+    def embed_tables(self, progress_callback: Callable[[dict], None] = None) -> Any :
+        """计算表级摘要向量，进度以 stage=table_embedding、unit=tables 上报。"""
+        if not self.table_files :
+            return np.zeros((0, 0), dtype=np.float32)
+        callback = None
+        if progress_callback :
+            callback = lambda event : progress_callback({
+                **event, "stage": "table_embedding", "unit": "tables",
+                "tables_per_second": event.get("chunks_per_second"),
+            })
+        return self.embed_doc(self.table_summaries(), progress_callback=callback)
 
-    def embed_doc(self, chunks: List[str], batch_size: int = 512, save_path: str = None) -> Any :
+    @staticmethod
+    def table_embeddings_from(payload: Dict, table_files: List[str]) -> Any :
+        """取 pkl 中的表级向量；旧文件没有或文件列表不一致时返回 None（需要重新计算）。"""
+        if not payload or payload.get('table_files') != table_files or payload.get('table_embeddings') is None :
+            return None
+        return payload['table_embeddings']
+
+    def embed_doc(self, chunks: List[str], batch_size: int = 512, save_path: str = None,
+                  progress_callback: Callable[[dict], None] = None) -> Any :
         """
         Embed documents in batches for improved performance
 
         Args:
             chunks: List of text chunks to embed
+            progress_callback: called after each batch with
+                {"stage": "embedding", "unit": "chunks", "done", "total", "chunks_per_second"}
 
         Returns:
             np.ndarray: Array of document embeddings
@@ -99,6 +211,7 @@ class SemanticRetriever :
         iterator = tqdm(range(0, len(chunks), batch_size)) if len(chunks) >= 100 \
             else range(0, len(chunks), batch_size)
 
+        started = time.monotonic()
         for i in iterator :
             batch = chunks[i: i + batch_size]
             batch_embeddings = self.embedding_model.encode(batch)
@@ -107,6 +220,20 @@ class SemanticRetriever :
                 encode_vecs.append(batch_embeddings)
             else :
                 encode_vecs.extend(batch_embeddings)
+
+            if progress_callback :
+                done = min(i + batch_size, len(chunks))
+                elapsed = time.monotonic() - started
+                try :
+                    progress_callback({
+                        "stage": "embedding",
+                        "unit": "chunks",
+                        "done": done,
+                        "total": len(chunks),
+                        "chunks_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0,
+                    })
+                except Exception as e :
+                    print(f"progress callback failed: {e}")
                  
         encode_vecs = np.array(encode_vecs)
         if len(encode_vecs.shape) == 3 :
@@ -118,7 +245,7 @@ class SemanticRetriever :
         
         return encode_vecs
     
-    def save_embeddings(self, embeddings: Any, chunks: List[str], save_path: str) -> None :
+    def save_embeddings(self, embeddings: Any, chunks: List[str], save_path: str, table_embeddings: Any = None) -> None :
         """
         Save embeddings and optionally the original chunks.
 
@@ -126,16 +253,27 @@ class SemanticRetriever :
             embeddings: numpy array of embeddings
             chunks: orignal text chunks
             save_path: path to save the embeddings
+            table_embeddings: optional per-file summary vectors, aligned with self.table_files
         """
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
         if save_path.endswith('.pkl') :
             data = {
                 "embeddings": embeddings,
                 "chunks": chunks,
-                "chunk_file_index": self.chunk_file_index
+                "chunk_file_index": self.chunk_file_index,
+                # 向量已 L2 归一化（内积即余弦）；缺少该标记的旧文件载入时会迁移
+                "normalized": True,
             }
-            with open(save_path, "wb") as f :
+            if table_embeddings is not None :
+                data["table_embeddings"] = table_embeddings
+                data["table_files"] = self.table_files
+            if getattr(self, "sparse_index", None) is not None :
+                data["sparse_index"] = self.sparse_index.to_state()
+            # 先写临时文件再替换，避免其它进程读到写了一半的 pkl
+            tmp_path = f"{save_path}.tmp"
+            with open(tmp_path, "wb") as f :
                 pickle.dump(data, f)
+            os.replace(tmp_path, save_path)
             print(f"Embeddings and chunks saved to {save_path}")
 
     @staticmethod
@@ -152,9 +290,14 @@ class SemanticRetriever :
         if load_path.endswith('.npy') :
             return np.load(load_path)
         elif load_path.endswith('.pkl') :
-            with open(load_path, 'rb') as f :
-                data = pickle.load(f)
+            data = SemanticRetriever.load_embedding_payload(load_path)
             return data['embeddings'], data['chunks'], data['chunk_file_index']
+
+    @staticmethod
+    def load_embedding_payload(load_path: str) -> Dict :
+        """读取 .pkl 的完整内容（含可选的 table_embeddings / table_files）。"""
+        with open(load_path, 'rb') as f :
+            return pickle.load(f)
         
     def build_index(self, dense_vector: Any) -> Any :
         print("Building Index.")
@@ -180,21 +323,130 @@ class SemanticRetriever :
             index_gpu.add(dense_vector)
             return index_gpu
 
-    def retrieve(self, query, recall_num, rerank_num) :
-        docs, ori_file_name = self.recall(query, recall_num)
+    def retrieve(self, query, recall_num, rerank_num, table_top_n: int = None) :
+        ids, query_emb, sparse_ids = self.recall_ids(query, recall_num, table_top_n=table_top_n)
+        if self.adaptive_rerank and ids :
+            return self.adaptive_rerank_ids(query, query_emb, ids, rerank_num, sparse_ids=sparse_ids)
+        docs = [self.chunk_index[i] for i in ids]
+        ori_file_name = [self.chunk_file_index[i] for i in ids]
         reranked_docs, rerank_scores, filenames = self.rerank(query, docs, rerank_num, ori_file_name)
         return reranked_docs, rerank_scores, filenames
-        
-    def recall(self, query: str, topn:int) -> List[str] :
-        query_emb = self.embed_doc(query)
+
+    def _dense_cosine(self, query_emb: Any, ids: List[int]) -> np.ndarray :
+        """文档与查询向量均已 L2 归一化，内积即余弦。"""
+        q = np.asarray(query_emb, dtype=np.float32).reshape(-1, self.doc_embeddings.shape[1])[0]
+        return self.doc_embeddings[ids] @ q
+
+    @staticmethod
+    def _shingles(text: str, n: int = 5) -> set :
+        body = text.split("\n", 1)[1] if text.startswith("File name:") and "\n" in text else text
+        body = " ".join(body.split())
+        return {body[i:i + n] for i in range(max(1, len(body) - n + 1))}
+
+    def _cached_shingles(self, i: int) -> set :
+        with self.index_lock :
+            sh = self._shingle_cache.get(i)
+            if sh is not None :
+                self._shingle_cache.move_to_end(i)
+                return sh
+        sh = self._shingles(self.chunk_index[i])
+        with self.index_lock :
+            self._shingle_cache[i] = sh
+            while len(self._shingle_cache) > RERANK_SHINGLE_CACHE_SIZE :
+                self._shingle_cache.popitem(last=False)
+        return sh
+
+    def select_rerank_candidates(self, ids: List[int], cosine: np.ndarray, rerank_num: int,
+                                 sparse_ids: List[int] = None) -> List[int] :
+        """
+        在融合召回顺序上依次过滤：近似重复（见 RERANK_DEDUP_CONTAINMENT）、超过每文件上限；
+        之后保留融合排名前 rerank_num 个、余弦不落后首位超过 RERANK_PRUNE_MARGIN 的，以及 BM25 前 RERANK_KEEP_SPARSE 的命中。
+        返回送入交叉编码器的位置下标（保持融合顺序）。
+        """
+        kept: List[int] = []
+        kept_shingles: List[set] = []
+        per_file: Dict[str, int] = defaultdict(int)
+        for pos, i in enumerate(ids) :
+            f = self.chunk_file_index[i]
+            if per_file[f] >= RERANK_MAX_PER_FILE :
+                continue
+            sh = self._cached_shingles(i)
+            if any(len(sh & other) / max(1, min(len(sh), len(other))) >= RERANK_DEDUP_CONTAINMENT for other in kept_shingles) :
+                continue
+            kept.append(pos)
+            kept_shingles.append(sh)
+            per_file[f] += 1
+        best = float(cosine[kept].max()) if kept else 0.0
+        top_sparse = set((sparse_ids or [])[:max(0, RERANK_KEEP_SPARSE)])
+        return [p for rank, p in enumerate(kept)
+                if rank < rerank_num or cosine[p] >= best - RERANK_PRUNE_MARGIN or ids[p] in top_sparse]
+
+    def adaptive_rerank_ids(self, query: str, query_emb: Any, ids: List[int], rerank_num: int,
+                            sparse_ids: List[int] = None) :
+        """
+        自适应重排：先按 select_rerank_candidates 缩小候选。若融合首位也是余弦首位，且领先其余候选超过 RERANK_SKIP_MARGIN，
+        只重排融合排名前 rerank_num 个与保留的 BM25 命中，余弦裁剪范围内的其余候选不再送入交叉编码器。
+        两条路径都返回 rerank_num 条（候选足够时），分数都是交叉编码器分数，与全量重排同一量纲
+        （TableRAG.auto_select_table 的阈值与候选池依赖此约定）。
+        """
+        cosine = self._dense_cosine(query_emb, ids)
+        positions = self.select_rerank_candidates(ids, cosine, rerank_num, sparse_ids=sparse_ids)
+        if RERANK_SKIP_MARGIN > 0 and len(positions) > 1 :
+            leader, rest = positions[0], positions[1:]
+            if cosine[leader] - max(cosine[p] for p in rest) >= RERANK_SKIP_MARGIN :
+                top_sparse = set((sparse_ids or [])[:max(0, RERANK_KEEP_SPARSE)])
+                positions = [p for rank, p in enumerate(positions)
+                             if rank < rerank_num or ids[p] in top_sparse]
+        docs = [self.chunk_index[ids[p]] for p in positions]
+        filenames = [self.chunk_file_index[ids[p]] for p in positions]
+        return self.rerank(query, docs, rerank_num, filenames)
+
+    def shortlist_tables(self, query_emb: Any, table_top_n: int) -> List[str] :
+        """粗排：用表级摘要向量取与查询最相近的 table_top_n 个文件。"""
         with self.index_lock :
-            D, I = self.index_IP.search(query_emb, topn)
-        ori_docs = [self.chunk_index[i] for i in I[0]]
-        ori_file_name = [self.chunk_file_index[i] for i in I[0]]
+            _, T = self.table_index_IP.search(query_emb[:1], table_top_n)
+        return [self.table_files[t] for t in T[0] if t >= 0]
+
+    def recall(self, query: str, topn: int, table_top_n: int = None) -> List[str] :
+        ids, _, _ = self.recall_ids(query, topn, table_top_n=table_top_n)
+        ori_docs = [self.chunk_index[i] for i in ids]
+        ori_file_name = [self.chunk_file_index[i] for i in ids]
         return ori_docs, ori_file_name
 
+    def recall_ids(self, query: str, topn: int, table_top_n: int = None) -> Tuple[List[int], Any, List[int]] :
+        """
+        召回 topn 个 chunk，返回 (融合后的 chunk 行号, 查询向量, BM25 命中行号)。table_top_n 为正且小于文件数时先粗排出候选表，
+        只在这些表的 chunk 中按内积取 topn（由粗到细）；否则在全部 chunk 上检索。
+        启用混合召回时，同一范围内再取 BM25 前 topn，与稠密结果做 RRF 融合后截取 topn。
+        """
+        query_emb = self.embed_doc(query)
+        rows = None
+        if table_top_n and self.table_index_IP is not None and table_top_n < len(self.table_files) :
+            shortlisted = self.shortlist_tables(query_emb, table_top_n)
+            rows = np.concatenate([self.table_rows[f] for f in shortlisted]) if shortlisted else np.zeros(0, dtype=np.int64)
+            q = np.asarray(query_emb, dtype=np.float32).reshape(-1, self.doc_embeddings.shape[1])[0]
+            sims = self.doc_embeddings[rows] @ q
+            if len(rows) > topn :
+                top = np.argpartition(-sims, topn - 1)[:topn]
+                order = top[np.argsort(-sims[top])]
+            else :
+                order = np.argsort(-sims)
+            ids = [int(i) for i in rows[order]]
+        else :
+            with self.index_lock :
+                D, I = self.index_IP.search(query_emb, topn)
+            ids = [int(i) for i in I[0] if i >= 0]
+        sparse_ids: List[int] = []
+        if self.sparse_index is not None :
+            sparse_ids = self.sparse_index.search(query, topn, rows=rows)
+            if sparse_ids :
+                ids = reciprocal_rank_fusion([ids, sparse_ids])[:topn]
+        return ids, query_emb, sparse_ids
+
     def rerank(self, query: str, docs: List[str], topn: int, ori_file_name: List[str]) -> Tuple[List[str], List[int]] :
         pairs = [[query, d] for d in docs]
+        with self.index_lock :
+            self.rerank_pairs_scored += len(pairs)
         scores = self.reranker.compute_score(pairs)
         sroted_pairs = sorted(zip(scores, docs, ori_file_name), reverse=True)
         score_sorted, doc_sorted, filename_sorted = zip(*sroted_pairs)
@@ -209,7 +461,8 @@ class MixedDocRetriever :
         llm_path: str = None,
         reranker_path: str = None,
         save_path: str = "./retrieve_result/embedding.pkl",
-        embedding_policy: str = "build_if_missing"
+        embedding_policy: str = "build_if_missing",
+        progress_callback: Callable[[dict], None] = None
     ) -> None:
         self.ori_documents = self.load_hybrid_dataset(doc_dir_path, excel_dir_path)
         print("Loading done.")
@@ -223,13 +476,22 @@ class MixedDocRetriever :
             llm_path=llm_path,
             reranker_path=reranker_path,
             save_path=save_path,
-            embedding_policy=embedding_policy
+            embedding_policy=embedding_policy,
+            progress_callback=progress_callback
         )
 
     def load_hybrid_dataset(self, doc_dir_path: str, excel_dir_path: str) -> Dict[str, List[str]] :
         all_docs = defaultdict(list)
+        # Prefer the Parquet snapshots written at ingestion over re-parsing workbooks
+        snapshot_index = load_snapshot_index(doc_dir_path)
         for file in tqdm(os.listdir(excel_dir_path)) :
-            content = excel_to_markdown(os.path.join(excel_dir_path, file))
+            # skip hidden files such as the upload manifest and in-progress .part uploads
+            if file.startswith('.') :
+                continue
+            if file in snapshot_index :
+                content = snapshot_to_markdown(file, snapshot_index[file])
+            else :
+                content = excel_to_markdown(os.path.join(excel_dir_path, file))
             excel_content = content
             all_docs[file] = excel_content
         
@@ -277,8 +539,8 @@ class MixedDocRetriever :
                     print(f"Case processing generated exception: {e}")
         return doc_chunkings
 
-    def retrieve(self, query: str, recall_nun: int = 50, rerank_num: int = 5) :
-        return self.semantic_retriever.retrieve(query, recall_nun, rerank_num)
+    def retrieve(self, query: str, recall_nun: int = 50, rerank_num: int = 5, table_top_n: int = None) :
+        return self.semantic_retriever.retrieve(query, recall_nun, rerank_num, table_top_n=table_top_n)
 
 
 
@@ -0,0 +1,132 @@
+"""
+BM25 稀疏倒排索引，与 FAISS 稠密索引并行构建，用于召回用户原样输入的标识（公司名、股票代码、年份、表名），
+结果与稠密召回用倒数排名融合（RRF）后再进入重排。
+中文用 jieba 搜索模式分词；jieba 未安装时退化为正则切分（英文/数字整词 + 中文二元组）。
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+BM25_K1 = float(os.environ.get("BM25_K1", "1.5"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+# RRF 常数：score = Σ 1 / (k + rank)
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+_HAS_WORD = re.compile(r"[0-9a-z\u4e00-\u9fff]")
+_FALLBACK_TOKEN = re.compile(r"[0-9a-z]+|[\u4e00-\u9fff]+")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+
+TOKENIZER_NAME = "jieba" if jieba is not None else "regex-bigram"
+
+
+def tokenize(text: str) -> List[str]:
+    """小写后分词，丢弃纯标点/空白的词。"""
+    text = text.lower()
+    if jieba is not None:
+        return [t for t in jieba.lcut_for_search(text) if _HAS_WORD.search(t)]
+    tokens = []
+    for tok in _FALLBACK_TOKEN.findall(text):
+        if _CJK_RUN.fullmatch(tok) and len(tok) > 1:
+            tokens.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+        else:
+            tokens.append(tok)
+    return tokens
+
+
+class BM25Index:
+    """
+    以 CSR 形式存放倒排表：vocab 把词映射到行号，indptr/doc_ids/tfs 为该词的文档与词频。
+    查询时每个词一次向量化累加，不遍历文档。
+    """
+
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_len: np.ndarray, tokenizer: str = TOKENIZER_NAME) -> None:
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.tokenizer = tokenizer
+        self.num_docs = len(doc_len)
+        avgdl = float(doc_len.mean()) if self.num_docs else 0.0
+        # 长度归一项只与文档有关，构建时算好
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avgdl) if avgdl > 0 else np.full(self.num_docs, BM25_K1)
+
+    @classmethod
+    def build(cls, docs: Sequence[str]) -> "BM25Index":
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(docs), dtype=np.float32)
+        for doc_id, doc in enumerate(docs):
+            counts = Counter(tokenize(doc))
+            doc_len[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        term_arr = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_arr, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_arr, minlength=len(vocab)), out=indptr[1:])
+        return cls(
+            vocab,
+            indptr,
+            np.array(doc_ids, dtype=np.int32)[order],
+            np.array(tfs, dtype=np.float32)[order],
+            doc_len,
+        )
+
+    def to_state(self) -> dict:
+        return {
+            "vocab": self.vocab, "indptr": self.indptr, "doc_ids": self.doc_ids, "tfs": self.tfs,
+            "doc_len": self.doc_len, "tokenizer": self.tokenizer,
+        }
+
+    @classmethod
+    def from_state(cls, state: Optional[dict], num_docs: int) -> Optional["BM25Index"]:
+        """从 pkl 恢复；缺失、分词器不同或文档数不一致时返回 None（需要重建）。"""
+        if not state or state.get("tokenizer") != TOKENIZER_NAME or len(state.get("doc_len", ())) != num_docs:
+            return None
+        return cls(state["vocab"], state["indptr"], state["doc_ids"], state["tfs"], state["doc_len"], state["tokenizer"])
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            row = self.vocab.get(term)
+            if row is None:
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            ids, tf = self.doc_ids[start:end], self.tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tf * (BM25_K1 + 1) / (tf + self._norm[ids])
+        return scores
+
+    def search(self, query: str, topn: int, rows: Optional[np.ndarray] = None) -> List[int]:
+        """按 BM25 分数返回前 topn 个文档号（只含分数 > 0 的）；rows 不为空时只在这些文档中检索。"""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0) if rows is None else rows[scores[rows] > 0]
+        if len(candidates) > topn:
+            part = np.argpartition(-scores[candidates], topn - 1)[:topn]
+            candidates = candidates[part]
+        return [int(i) for i in candidates[np.argsort(-scores[candidates], kind="stable")]]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """倒数排名融合：各路排名中的文档按 Σ 1/(k + rank) 降序排列，同分保持首次出现的顺序。"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused, key=lambda d: fused[d], reverse=True)
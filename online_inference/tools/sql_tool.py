@@ -1,88 +1,224 @@
 import json
+import random
 import requests
+import requests.adapters
 import logging
-from functools import wraps
 from typing import Any
 import os
 import time
 import threading
 import traceback
 import sys
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append("../")
 from chat_utils import *
-from config import sql_service_url
+from config import (sql_service_url, sql_service_batch_url, sql_service_transport, sql_inproc_workers,
+                    sql_service_timeout, sql_connect_timeout, sql_max_retries, sql_backoff_base, sql_backoff_cap,
+                    sql_http_pool_size, sql_breaker_failure_threshold, sql_breaker_reset_timeout)
 from utils.utils import read_plain_csv
+from utils.deadline import DEADLINE_HEADER, DeadlineExceeded
 
 function_lock = threading.Lock()
 logger = init_logger('./logs/test.log', logging.INFO)
 
-def with_retry(max_retries=3, backoff_factor=5):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            retries = 0
-            while retries < max_retries:
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_inproc_service = None
+_inproc_executor = None
+
+
+def _get_inproc_service():
+    """
+    Lazily import the offline NL2SQL service module (it connects to the database on import)
+    and create the worker pool used by the inproc transport.
+    """
+    global _inproc_service, _inproc_executor
+    with function_lock:
+        if _inproc_service is None:
+            if PROJECT_ROOT not in sys.path:
+                sys.path.insert(0, PROJECT_ROOT)
+            from offline_data_ingestion_and_query_interface.src import service
+            _inproc_executor = ThreadPoolExecutor(max_workers=sql_inproc_workers, thread_name_prefix="sql-inproc")
+            _inproc_service = service
+    return _inproc_service
+
+
+def _monotonic_deadline(deadline):
+    """The offline service takes an absolute time.monotonic() deadline."""
+    remaining = _remaining(deadline)
+    return None if remaining is None else time.monotonic() + remaining
+
+
+def _inproc_request(table_name_list, query, deadline=None):
+    service = _get_inproc_service()
+    future = _inproc_executor.submit(service.process_tablerag_request, table_name_list, query,
+                                     deadline=_monotonic_deadline(deadline))
+    return future.result(timeout=_remaining(deadline))
+
+
+def _inproc_batch(table_name_list, queries, deadline=None):
+    service = _get_inproc_service()
+    items = [{'table_name_list': table_name_list, 'query': q} for q in queries]
+    # process_tablerag_batch parallelises the LLM calls itself
+    return service.process_tablerag_batch(items, deadline=_monotonic_deadline(deadline))['results']
+
+class CircuitOpenError(Exception):
+    """Raised when the SQL service circuit breaker is open and calls are short-circuited."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker shared by all SQL service calls.
+    closed -> open after `failure_threshold` transient failures in a row; after `reset_timeout`
+    seconds one probe call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("SQL service circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logger.error(f"SQL service circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+sql_circuit_breaker = CircuitBreaker(sql_breaker_failure_threshold, sql_breaker_reset_timeout)
+
+# Shared keep-alive connection pool; retries are handled in _post_json, not by urllib3
+_session = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=sql_http_pool_size, max_retries=0)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+_session.headers.update({'Content-Type': 'application/json'})
+
+# Gateway / overload responses are safe to retry: the request was not processed
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def _remaining(deadline):
+    """Seconds left on a utils.deadline.Deadline; None means no deadline."""
+    return None if deadline is None else deadline.remaining()
+
+
+def _post_json(url: str, body: dict, timeout: float, deadline=None) -> dict:
+    """
+    POST a JSON body with the pooled session.
+
+    Only transient failures are retried: connection errors (the request never reached the service)
+    and 429/502/503/504 responses. Read timeouts, other HTTP errors and malformed JSON are not
+    retried, since repeating them would only add load to a struggling service. Backoff uses
+    full jitter and never sleeps past the deadline; each attempt's timeout shrinks to the
+    remaining budget, which is also forwarded to the service in the X-Deadline-Ms header.
+
+    Raises:
+        CircuitOpenError: the breaker is open
+        DeadlineExceeded: the deadline is exhausted or the request was cancelled
+        requests.RequestException / ValueError: non-retryable failure or retries exhausted
+    """
+    attempt = 0
+    while True:
+        if deadline is not None:
+            deadline.check()
+        remaining = _remaining(deadline)
+        if not sql_circuit_breaker.allow():
+            raise CircuitOpenError(f"SQL service circuit is {sql_circuit_breaker.state}")
+
+        attempt_timeout = timeout if remaining is None else min(timeout, remaining)
+        retry_after = None
+        try:
+            headers = {DEADLINE_HEADER: deadline.header_value()} if remaining is not None else None
+            resp = _session.post(url, json=body, headers=headers, verify=False,
+                                 timeout=(min(sql_connect_timeout, attempt_timeout), attempt_timeout))
+        except requests.exceptions.ConnectionError as e:
+            sql_circuit_breaker.record_failure()
+            error = e
+        except Exception:
+            # read timeouts and anything unexpected: count against the breaker, do not retry
+            sql_circuit_breaker.record_failure()
+            raise
+        else:
+            if resp.status_code in _RETRYABLE_STATUS:
+                sql_circuit_breaker.record_failure()
+                error = requests.exceptions.HTTPError(f"{resp.status_code} from SQL service", response=resp)
                 try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    retries += 1
-                    if retries >= max_retries:
-                        raise e
-                    wait_time = backoff_factor * (2 ** (retries - 1))
-                    print(f"Retry {retries}/{max_retries} after {wait_time:.2f}s due to {e}")
-                    time.sleep(wait_time)
-        return wrapper
-    return decorator
-
-@with_retry(max_retries=3)
-def get_excel_rag_response(table_name_list, query, repo_id) :
+                    retry_after = float(resp.headers.get('Retry-After', ''))
+                except ValueError:
+                    retry_after = None
+            elif resp.status_code >= 500:
+                sql_circuit_breaker.record_failure()
+                resp.raise_for_status()
+            else:
+                sql_circuit_breaker.record_success()
+                resp.raise_for_status()
+                return resp.json()
+
+        attempt += 1
+        if attempt > sql_max_retries:
+            raise error
+        backoff = random.uniform(0, min(sql_backoff_cap, sql_backoff_base * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        remaining = _remaining(deadline)
+        if remaining is not None and backoff >= remaining:
+            raise error
+        logger.warning(f"SQL service attempt {attempt} failed ({error}), retrying in {backoff:.2f}s")
+        time.sleep(backoff)
+
+
+def get_excel_rag_response(table_name_list, query, repo_id, deadline=None) :
     """
     Run SQL generation and execute SQL in the database.
 
     Args:
         table_name_list[List]: num of tables
         repo_id: ID of the knowledge base
+        deadline: optional utils.deadline.Deadline bounding the whole call including retries
     """
-    url = sql_service_url
-
-    headers = {
-        'Content-Type': 'application/json',
-    }
+    if sql_service_transport == 'inproc':
+        return _inproc_request(table_name_list, query, deadline)
 
     body = {
         'repo_id': repo_id,
         'table_name_list': table_name_list,
         'query': query
     }
+    return _post_json(sql_service_url, body, sql_service_timeout, deadline)
 
-    try :
-        resp = requests.post(url=url, json=body, headers=headers, verify=False)
-        answer = json.loads(resp.text)
-        return answer
-    except json.JSONDecodeError as json_decode_e :
-        print(resp.text)
-    except Exception as e :
-        print(e)
-        raise e
-
-
-def get_excel_rag_response_plain(table_name_list: list = [], query: str = None) :
-    """
-    Call the SQL generation and execution service.
-
-    Args: 
-        table_name_list(list): List of table names
-        query(str): input query
-    
-    Returns:
-        answer(dict)
-    """
-    url = sql_service_url
-
-    headers = {
-        'Content-Type': 'application/json',
-    }
 
+def _dedup_table_names(table_name_list):
     # 去重并保持顺序，避免中文/别名重复
     dedup = []
     seen = set()
@@ -90,29 +226,113 @@ def get_excel_rag_response_plain(table_name_list: list = [], query: str = None)
         if t not in seen:
             dedup.append(t)
             seen.add(t)
+    return dedup
+
+
+# 批量接口不存在（舊版服務）時的狀態碼，只有這些情況才回退為逐條請求
+_BATCH_UNSUPPORTED_STATUS = {404, 405}
+
+
+def _batch_errors(queries: list, error: Exception) -> list:
+    """Per-item error results in the same shape the batch service returns for a failed item."""
+    return [{'error': str(error), 'query': q} for q in queries]
+
+
+def get_excel_rag_response_batch(table_name_list: list = [], queries: list = None, deadline=None) -> list:
+    """
+    Call the batch SQL generation and execution service for several subqueries over the same tables.
+
+    Args:
+        table_name_list(list): List of table names shared by all queries
+        queries(list): input queries
+        deadline: optional utils.deadline.Deadline bounding the whole call
+
+    Returns:
+        answers(list): one dict per query, in order. Falls back to per-query calls only when the
+            batch endpoint is missing (404/405) or its response is malformed; other failures
+            (timeouts, connection errors, 5xx, open circuit) return per-item {'error', 'query'} dicts
+
+    Raises:
+        DeadlineExceeded: the deadline is exhausted or the request was cancelled
+    """
+    queries = list(queries or [])
+    if len(queries) <= 1:
+        return [get_excel_rag_response_plain(table_name_list, q, deadline=deadline) for q in queries]
+    if sql_service_transport == 'inproc':
+        return _inproc_batch(_dedup_table_names(table_name_list), queries, deadline)
 
     body = {
-        'table_name_list': dedup,
-        'query': query
+        'table_name_list': _dedup_table_names(table_name_list),
+        'items': [{'query': q} for q in queries]
     }
+    try:
+        # 服務端並發處理，超時按條目數放寬
+        answer = _post_json(sql_service_batch_url, body, sql_service_timeout + 30 * len(queries), deadline)
+    except DeadlineExceeded:
+        raise
+    except CircuitOpenError as e:
+        logger.error(f"SQL batch call skipped: {e}")
+        return _batch_errors(queries, e)
+    except requests.exceptions.JSONDecodeError as e:
+        logger.error(f"SQL batch response is not JSON, falling back to single requests: {e}")
+        return [get_excel_rag_response_plain(table_name_list, q, deadline=deadline) for q in queries]
+    except requests.exceptions.HTTPError as e:
+        status = getattr(e.response, 'status_code', None)
+        if status not in _BATCH_UNSUPPORTED_STATUS:
+            logger.error(f"SQL batch error: {e}")
+            return _batch_errors(queries, e)
+        # 服務未部署批量接口，逐條請求
+        logger.error(f"SQL batch endpoint unavailable ({status}), falling back to single requests")
+        return [get_excel_rag_response_plain(table_name_list, q, deadline=deadline) for q in queries]
+    except Exception as e:
+        # 超時、連線失敗等已計入熔斷器；逐條重發只會給故障中的服務再加 N 倍負載
+        logger.error(f"SQL batch error: {e}")
+        return _batch_errors(queries, e)
+    results = answer.get('results') if isinstance(answer, dict) else None
+    if isinstance(results, list) and len(results) == len(queries):
+        return results
+    logger.error(f"SQL batch response malformed, falling back to single requests: {str(answer)[:500]}")
+    return [get_excel_rag_response_plain(table_name_list, q, deadline=deadline) for q in queries]
+
+
+def get_excel_rag_response_plain(table_name_list: list = [], query: str = None, deadline=None) :
+    """
+    Call the SQL generation and execution service.
+
+    Args: 
+        table_name_list(list): List of table names
+        query(str): input query
+        deadline: optional utils.deadline.Deadline bounding the whole call including retries
     
-    try_times = 5
-    backoff = 1.0
-    while try_times > 0:
-        resp = None
+    Returns:
+        answer(dict), empty on failure
+
+    Raises:
+        DeadlineExceeded: the deadline is exhausted or the request was cancelled
+    """
+    if sql_service_transport == 'inproc':
+        if deadline is not None:
+            deadline.check()
         try:
-            resp = requests.post(url=url, json=body, headers=headers, verify=False, timeout=60)
-            answer = json.loads(resp.text)
-            return answer
+            return _inproc_request(_dedup_table_names(table_name_list), query, deadline)
         except Exception as e:
-            safe_text = getattr(resp, 'text', str(e))
-            logger.error(f"SQL error, response: {safe_text}")
+            logger.error(f"SQL inproc error: {e}")
             traceback.print_exc()
-            try_times -= 1
-            if try_times <= 0:
-                break
-            time.sleep(backoff)
-            backoff = min(backoff * 2, 8.0)
+            return {}
+
+    body = {
+        'table_name_list': _dedup_table_names(table_name_list),
+        'query': query
+    }
+    try:
+        return _post_json(sql_service_url, body, sql_service_timeout, deadline)
+    except DeadlineExceeded:
+        raise
+    except CircuitOpenError as e:
+        logger.error(f"SQL call skipped: {e}")
+    except Exception as e:
+        safe_text = getattr(getattr(e, 'response', None), 'text', str(e))
+        logger.error(f"SQL error, response: {safe_text}")
     return {}
 
 
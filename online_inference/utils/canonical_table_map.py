@@ -1,7 +1,16 @@
 import os
 import json
 import re
-from typing import Dict, List, Optional, Set, Tuple
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+# Query/alias term pattern used by table selection: runs of CJK, latin letters and digits
+TERM_PATTERN = re.compile(r"[\u4e00-\u9fa5A-Za-z0-9]+")
+# Upper bound of cached query terms in the inverted term index
+_TERM_CACHE_SIZE = 4096
 
 
 def _slugify(name: str) -> str:
@@ -31,6 +40,7 @@ class CanonicalTableIndex:
         self.alias_to_canonical: Dict[str, str] = {}
         self.canonical_to_files: Dict[str, Dict[str, Optional[str]]] = {}
         self._build_index()
+        self._build_alias_arrays()
 
     def _add_alias(self, canonical_id: str, alias: str) -> None:
         if not alias:
@@ -99,6 +109,75 @@ class CanonicalTableIndex:
                     self._add_alias(canonical_id, internal_name)
                 self._register_file(canonical_id, json_file=file)
 
+    def _build_alias_arrays(self) -> None:
+        """
+        Precompute what table selection needs so scoring is a few numpy operations per query:
+        - sorted alias tuples per table (get_aliases no longer re-sorts a set on each call)
+        - every (table, alias) pair lowercased into one array, with the owning table position
+        - per-table penalty for generic aliases (4-digit years, aliases of <= 2 chars)
+        - an inverted term index: lowercase term -> alias rows where the term contains or is
+          contained in the alias, filled lazily per unseen term and cached
+        """
+        self._ids: List[str] = sorted(self.canonical_to_aliases.keys())
+        self._id_pos: Dict[str, int] = {cid: i for i, cid in enumerate(self._ids)}
+        self._sorted_aliases: Dict[str, Tuple[str, ...]] = {
+            cid: tuple(sorted(aliases)) for cid, aliases in self.canonical_to_aliases.items()
+        }
+        lowered: List[str] = []
+        owners: List[int] = []
+        penalty = np.zeros(len(self._ids), dtype=np.float64)
+        for pos, cid in enumerate(self._ids):
+            for alias in self._sorted_aliases[cid]:
+                lower_alias = alias.lower()
+                lowered.append(lower_alias)
+                owners.append(pos)
+                if lower_alias.isdigit() and len(lower_alias) == 4:
+                    penalty[pos] -= 2.0
+                if len(lower_alias) <= 2:
+                    penalty[pos] -= 0.5
+        self._alias_lower = np.array(lowered, dtype=str)
+        self._alias_owner = np.array(owners, dtype=np.int64)
+        self._alias_penalty = penalty
+        self._term_rows: Dict[str, np.ndarray] = {}
+        self._term_lock = threading.Lock()
+
+    def _rows_for_term(self, term: str) -> np.ndarray:
+        """Alias rows matching a lowercase term (term in alias or alias in term), cached per term."""
+        rows = self._term_rows.get(term)
+        if rows is not None:
+            return rows
+        if self._alias_lower.size:
+            matched = (np.char.find(self._alias_lower, term) >= 0) | (np.char.find(term, self._alias_lower) >= 0)
+            rows = np.flatnonzero(matched)
+        else:
+            rows = np.empty(0, dtype=np.int64)
+        with self._term_lock:
+            if len(self._term_rows) >= _TERM_CACHE_SIZE:
+                self._term_rows.clear()
+            self._term_rows[term] = rows
+        return rows
+
+    def name_scores(self, canonical_ids: Sequence[str], filenames: Sequence[str], query_terms: Sequence[str]) -> Dict[str, float]:
+        """
+        Name/alias score for each candidate table:
+        generic-alias penalty + 2.0 per (alias, term) match + 3.0 per term found in the candidate's filename.
+        `query_terms` must be lowercase; repeated terms count repeatedly. All tables are scored in one
+        pass (bincount over the matching alias rows) and the candidates are picked out by position.
+        """
+        table_scores = self._alias_penalty.copy()
+        for term in query_terms:
+            rows = self._rows_for_term(term)
+            if rows.size:
+                table_scores += 2.0 * np.bincount(self._alias_owner[rows], minlength=len(self._ids))
+
+        positions = np.array([self._id_pos.get(cid, -1) for cid in canonical_ids], dtype=np.int64)
+        scores = np.where(positions >= 0, table_scores[np.maximum(positions, 0)], 0.0) if len(positions) else np.zeros(0)
+        if len(filenames) and query_terms:
+            lower_names = np.array([name.lower() for name in filenames], dtype=str)
+            for term in query_terms:
+                scores = scores + 3.0 * (np.char.find(lower_names, term) >= 0)
+        return {cid: float(score) for cid, score in zip(canonical_ids, scores)}
+
     def get_canonical_id(self, any_name: str) -> Optional[str]:
         """Return canonical id for any known alias or filename stem."""
         if not any_name:
@@ -117,7 +196,7 @@ class CanonicalTableIndex:
         return None
 
     def get_aliases(self, canonical_id: str) -> List[str]:
-        return sorted(list(self.canonical_to_aliases.get(canonical_id, set())))
+        return list(self._sorted_aliases.get(canonical_id, ()))
 
     def get_preferred_excel_file(self, canonical_id: str) -> Optional[str]:
         entry = self.canonical_to_files.get(canonical_id)
@@ -155,6 +234,6 @@ class CanonicalTableIndex:
         return result
 
     def list_canonical_ids(self) -> List[str]:
-        return sorted(list(self.canonical_to_aliases.keys()))
+        return list(self._ids)
 
 
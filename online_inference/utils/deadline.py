@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Optional
+
+
+# HTTP header carrying the remaining budget (milliseconds) to the SQL service.
+# A relative budget avoids depending on clock agreement between hosts.
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget is used up or the request was cancelled."""
+
+
+class Deadline:
+    """
+    Request-scoped time budget shared by every downstream call of one chat request.
+
+    - `timeout(cap)` shrinks a per-call timeout to what is left of the budget;
+    - `check()` is called between steps and raises once the budget is exhausted;
+    - `cancel()` (e.g. on client disconnect) makes the next `check()`/`timeout()` raise,
+      so worker threads stop at the next step instead of finishing a dead request.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None) -> None:
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+        self._cancelled = cancel_event or threading.Event()
+        self.reason = None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left; 0 once cancelled; None when unbounded."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self.reason = reason
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise DeadlineExceeded(self.reason or "cancelled")
+        if self.expired:
+            raise DeadlineExceeded("deadline exceeded")
+
+    def timeout(self, cap: float) -> float:
+        """Per-call timeout bounded by the remaining budget; raises if nothing is left."""
+        self.check()
+        remaining = self.remaining()
+        return cap if remaining is None else min(cap, remaining)
+
+    def header_value(self) -> Optional[str]:
+        remaining = self.remaining()
+        return None if remaining is None else str(int(remaining * 1000))
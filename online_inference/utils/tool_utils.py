@@ -7,6 +7,14 @@ from typing import Union, List, Tuple
 from transformers import AutoTokenizer, AutoModel, AutoModelForSequenceClassification
 from tqdm import tqdm
 import numpy as np
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 def sigmoid(x) :
     return 1 / (1 + np.exp(-x))
@@ -30,12 +38,15 @@ class Embedder :
         self.model.eval()
     
     @torch.no_grad()
-    def encode(self, texts) :
+    def encode(self, texts, normalize: bool = True) :
+        """取 CLS 向量；BGE-M3 按余弦相似度训练，默认做 L2 归一化，使内积即余弦。"""
         features = self.tokenizer(texts, padding=True, truncation=True, 
                                     return_tensors="pt").to(self.device)
         model_output = self.model(**features)
-        embs = model_output[0][:, 0].cpu().numpy()
-        return embs
+        embs = model_output[0][:, 0]
+        if normalize :
+            embs = torch.nn.functional.normalize(embs, p=2, dim=-1)
+        return embs.float().cpu().numpy()
 
 class Reranker :
     def __init__(
@@ -201,5 +212,98 @@ def excel_to_markdown(file_path) :
     return content
 
 
+def snapshot_dir_for(schema_dir: str) -> str:
+    """
+    Locate the Parquet snapshot directory written by ingestion.
+    Defaults to the `snapshots` sibling of the schema directory; TABLE_SNAPSHOT_DIR overrides it.
+    """
+    return os.getenv("TABLE_SNAPSHOT_DIR") or os.path.join(os.path.dirname(os.path.abspath(schema_dir)), "snapshots")
+
+
+# excel_to_markdown 对 .xls / CSV 只输出前 50 行，.xlsx 输出全部行；快照渲染沿用同样的上限
+MARKDOWN_MAX_ROWS = 50
+
+
+def _markdown_row_cap(file_name: str) :
+    return None if os.path.splitext(file_name)[1].lower() == ".xlsx" else MARKDOWN_MAX_ROWS
+
+
+def load_snapshot_index(schema_dir: str) -> dict:
+    """
+    Map original filename -> [(sheet_name, snapshot_path), ...] from the schema JSON files.
+    Only snapshots that exist on disk are returned; sheets keep their schema file order.
+    When several versions of a file are present (different source_file_hash), only the sheets
+    of the most recently written version are kept.
+    """
+    index = {}
+    if pq is None or not schema_dir or not os.path.isdir(schema_dir):
+        return index
+    snapshot_dir = snapshot_dir_for(schema_dir)
+    # original filename -> {source_file_hash: [newest schema mtime, [(sheet_name, snapshot_path), ...]]}
+    versions = {}
+    for file_name in sorted(os.listdir(schema_dir)):
+        if not file_name.endswith(".json"):
+            continue
+        schema_path = os.path.join(schema_dir, file_name)
+        try:
+            with open(schema_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            mtime = os.path.getmtime(schema_path)
+        except Exception:
+            continue
+        if not isinstance(data, dict) or not data.get("snapshot_file") or not data.get("original_filename"):
+            continue
+        path = os.path.join(snapshot_dir, data["snapshot_file"])
+        if not os.path.exists(path):
+            continue
+        version = versions.setdefault(data["original_filename"], {}).setdefault(data.get("source_file_hash"), [mtime, []])
+        version[0] = max(version[0], mtime)
+        version[1].append((data.get("sheet_name"), path))
+    for original, by_hash in versions.items():
+        index[original] = max(by_hash.values(), key=lambda v: v[0])[1]
+    return index
+
+
+def _read_snapshot_head(path: str, max_rows) :
+    """Memory-map a snapshot and read at most max_rows rows (all rows when max_rows is None)."""
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    if max_rows is None :
+        return parquet_file.read()
+    batches = []
+    remaining = max_rows
+    for batch in parquet_file.iter_batches(batch_size=max(1, min(max_rows, 65536))) :
+        if remaining <= 0 :
+            break
+        batches.append(batch.slice(0, remaining))
+        remaining -= min(remaining, batch.num_rows)
+    if not batches :
+        return parquet_file.schema_arrow.empty_table()
+    return pa.Table.from_batches(batches, schema=parquet_file.schema_arrow)
+
+
+def snapshot_to_markdown(file_name: str, snapshots: List[Tuple[str, str]]) :
+    """
+    Render Parquet snapshots of one source file in the same layout as excel_to_markdown,
+    including its per-format row cap (first 50 rows for .xls / CSV, all rows for .xlsx).
+    Snapshots are memory-mapped; original headers are restored from the file metadata.
+    """
+    max_rows = _markdown_row_cap(file_name)
+    parts = [f"Table name: {os.path.splitext(file_name)[0]}\n"]
+    for _, path in snapshots :
+        table = _read_snapshot_head(path, max_rows)
+        metadata = table.schema.metadata or {}
+        header = list(table.column_names)
+        if b"tablerag.original_columns" in metadata :
+            original = json.loads(metadata[b"tablerag.original_columns"].decode("utf-8"))
+            if len(original) == len(header) :
+                header = original
+        parts.append(" | " + " | ".join([str(h) for h in header]) + " | \n")
+        parts.append(" | " + " | ".join(["---"]*len(header)) + " | \n")
+        columns = [column.to_pylist() for column in table.columns]
+        for row in zip(*columns) :
+            parts.append(" | " + " | ".join(["" if v is None else str(v) for v in row]) + " | \n")
+    return "".join(parts)
+
+
 if __name__ == '__main__' :
     print(excel_to_markdown("./test.xlsx"))
\ No newline at end of file
@@ -47,6 +47,11 @@ class ServiceManager:
         self.running = True
         self.project_root = Path(__file__).parent.absolute()
         
+        # SQL 服务运行模式：flask（开发服务器，默认）/ asgi（uvicorn 多 worker、异步 LLM 调用）
+        sql_service_mode = os.getenv('SQL_SERVICE_MODE', 'flask').lower()
+        self.db_config_path = self.project_root / 'offline_data_ingestion_and_query_interface' / 'config' / 'database_config.json'
+        self.sql_backend = self.resolve_sql_backend()
+
         # 服务配置
         self.services = {
             'flask_sql': {
@@ -77,11 +82,36 @@ class ServiceManager:
                 'startup_timeout': 30
             }
         }
+        if sql_service_mode == 'asgi':
+            # 多 worker 数、背压阈值等见 asgi_app 的环境变量（NL2SQL_WORKERS、NL2SQL_MAX_IN_FLIGHT）
+            self.services['flask_sql'].update({
+                'name': 'ASGI SQL Service',
+                'command': [
+                    sys.executable, '-m', 'offline_data_ingestion_and_query_interface.src.asgi_app',
+                    '--host', '0.0.0.0',
+                    '--port', '5000'
+                ],
+                'working_dir': self.project_root,
+                # 留出在途请求排空的时间
+                'stop_timeout': float(os.getenv('NL2SQL_SHUTDOWN_TIMEOUT', '30')) + 5,
+            })
+        if self.sql_backend == 'duckdb':
+            # duckdb 数据库文件只能由一个进程打开：由 FastAPI 进程（单 worker）以 inproc 方式同时负责导入与查询，不启动独立 SQL 服务
+            del self.services['flask_sql']
         
         # 设置信号处理
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
     
+    def resolve_sql_backend(self) -> str:
+        """与 sql_alchemy_helper.resolve_backend 一致：环境变量 SQL_BACKEND 优先，其次 database_config.json 的 backend 字段"""
+        try:
+            with open(self.db_config_path, 'r', encoding='utf-8') as f:
+                db_config = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            db_config = {}
+        return (os.getenv('SQL_BACKEND') or db_config.get('backend') or 'mysql').lower()
+
     def signal_handler(self, signum, frame):
         """处理中断信号"""
         logger.info(f"接收到信号 {signum}，正在关闭服务...")
@@ -151,10 +181,12 @@ class ServiceManager:
         
         logger.info("✓ 所有必需依赖检查通过")
         
-        # 检查MySQL连接
+        # 检查MySQL连接（sqlite / duckdb 为内嵌数据库，无需检查）
         try:
-            config_path = self.services['flask_sql']['env_file']
-            if config_path.exists():
+            config_path = self.db_config_path
+            if self.sql_backend != 'mysql':
+                logger.info(f"使用内嵌数据库后端: {self.sql_backend}")
+            elif config_path.exists():
                 with open(config_path, 'r', encoding='utf-8') as f:
                     db_config = json.load(f)
                 
@@ -230,6 +262,8 @@ class ServiceManager:
             # 指定 Flask 应用入口，避免 "Could not locate a Flask application" 错误
             if service_name == 'flask_sql':
                 env['FLASK_APP'] = 'interface:app'
+            if service_name == 'fastapi_web' and self.sql_backend == 'duckdb':
+                env.setdefault('SQL_SERVICE_TRANSPORT', 'inproc')
             
             # 启动服务
             process = subprocess.Popen(
@@ -316,7 +350,7 @@ class ServiceManager:
                 logger.info(f"停止 {self.services[service_name]['name']}...")
                 process.terminate()
                 try:
-                    process.wait(timeout=10)
+                    process.wait(timeout=self.services[service_name].get('stop_timeout', 10))
                 except subprocess.TimeoutExpired:
                     logger.warning(f"强制终止 {service_name}")
                     process.kill()
@@ -355,7 +389,8 @@ class ServiceManager:
             logger.info("服务访问地址:")
             logger.info("  - Web界面: http://localhost:8000")
             logger.info("  - API文档: http://localhost:8000/docs")
-            logger.info("  - SQL服务: http://localhost:5000")
+            if 'flask_sql' in self.services:
+                logger.info("  - SQL服务: http://localhost:5000")
             logger.info("按 Ctrl+C 停止所有服务")
             return True
         